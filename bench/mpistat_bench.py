@@ -0,0 +1,338 @@
+'''
+benchmark the mpistat loader, treemap reports and progress parser
+on synthetic filesystem snapshots at several scales
+
+the results are written as json to the results directory and
+compared with an earlier run to spot regressions
+'''
+
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+
+import numpy as np
+
+# the tools being benchmarked live in bin and cli
+HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME, 'cli'))
+sys.path.insert(0, os.path.join(HOME, 'bin'))
+
+import mpistat_pb
+import mpistat_synth
+import mpistat_columnar
+import mpistat_progress
+
+# paths to report on in the synthetic tree
+PATHS = ('', '/synth', '/synth/d0')
+
+# no filters
+FILTERS = (None,) * 10
+
+
+def get_args():
+    '''
+    parse commandline arguments for the benchmarks
+    '''
+    parser = argparse.ArgumentParser(description='''
+        benchmark the mpistat loader, treemap and progress parser
+        on synthetic snapshots''')
+    parser.add_argument(
+        '--scales',
+        help='comma separated list of the number of inodes to generate')
+    parser.set_defaults(scales='10000,100000')
+    parser.add_argument(
+        '--repeat', type=int,
+        help='number of times to run each benchmark')
+    parser.set_defaults(repeat=3)
+    parser.add_argument(
+        '--database',
+        help='also run the treemap benchmarks against this clickhouse'
+             ' database with the cache disabled')
+    parser.add_argument(
+        '--load_database',
+        help='also time loading each synthetic snapshot into this'
+             ' (already created) clickhouse database')
+    parser.add_argument(
+        '--work_dir',
+        help='directory for the synthetic snapshots, defaults to a'
+             ' temporary directory that is removed afterwards')
+    parser.add_argument(
+        '--results_dir',
+        help='directory to save the results in')
+    parser.set_defaults(results_dir=os.path.join(HOME, 'bench', 'results'))
+    parser.add_argument(
+        '--compare',
+        help='results file to compare against, defaults to the latest'
+             ' one in the results directory')
+    parser.add_argument(
+        '--threshold', type=float,
+        help='ratio of new to old time that counts as a regression')
+    parser.set_defaults(threshold=1.2)
+    parser.add_argument(
+        '--startup_budget', type=float,
+        help='seconds that starting python and importing treemap_cmd'
+             ' may take before the run counts as failed')
+    parser.set_defaults(startup_budget=0.25)
+    return parser.parse_args()
+
+
+def timed(func, repeat):
+    '''
+    run func repeat times and return the min and median time
+    along with the value returned by the last run
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': float(np.median(times))}, value
+
+
+def decode_all(batch_run_dir):
+    '''
+    decode every collector file, returns the number of messages
+    '''
+    rows = 0
+    for data_file in glob.glob(os.path.join(batch_run_dir, '*.out.gz')):
+        for batch in mpistat_pb.read_batches(data_file):
+            rows += len(batch['mode'])
+    return rows
+
+
+def decode_protobuf(batch_run_dir):
+    '''
+    decode every collector file a message at a time with the protobuf
+    runtime, the way print_pb.py used to, pulling out the fields the
+    loader needs. returns the number of messages
+    '''
+    import gzip
+    import proto3_pb2
+    from google.protobuf.internal.decoder import _DecodeVarint32
+
+    rows = 0
+    columns = [[] for _ in mpistat_pb.FIELD_NAMES]
+    for data_file in glob.glob(os.path.join(batch_run_dir, '*.out.gz')):
+        with gzip.open(data_file, 'rb') as data:
+            buf = data.read(10)
+            while buf:
+                msg_len, new_pos = _DecodeVarint32(buf, 0)
+                buf = buf[new_pos:]
+                buf += data.read(msg_len - len(buf))
+                msg = proto3_pb2.MpistatMsg()
+                msg.ParseFromString(buf)
+                for column, name in zip(columns, mpistat_pb.FIELD_NAMES):
+                    column.append(getattr(msg, name))
+                rows += 1
+                buf = data.read(10)
+        columns = [[] for _ in mpistat_pb.FIELD_NAMES]
+    return rows
+
+
+def has_protobuf():
+    '''
+    can the protobuf module built by src/Makefile be imported
+    '''
+    try:
+        import proto3_pb2
+    except ImportError:
+        return False
+    return True
+
+
+def treemap_benchmarks(engine, database, repeat):
+    '''
+    time the treemap reports using the given engine module
+    '''
+    results = {}
+    for path in PATHS:
+        name = 'get_subdir_data[{}]'.format(path or '/')
+        results[name], _ = timed(
+            lambda: engine.get_subdir_data(database, path, *FILTERS), repeat)
+    for report in ('by_user', 'by_suffix'):
+        func = getattr(engine, report)
+        results['{}[/]'.format(report)], _ = timed(
+            lambda: func(database, '', *FILTERS, 'size', 20), repeat)
+    return results
+
+
+def startup_time(repeat):
+    '''
+    time starting python and importing treemap_cmd, the fixed cost
+    of every treemap command even when the answer is cached.
+    returns None if it can't be imported, e.g. no treemap_config
+    '''
+    cmd = [sys.executable, '-c', 'import treemap_cmd']
+    cli = os.path.join(HOME, 'cli')
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if subprocess.run(cmd, cwd=cli, stderr=subprocess.DEVNULL).returncode:
+            return None
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': float(np.median(times))}
+
+
+def run_scale(num_inodes, work_dir, args):
+    '''
+    run the benchmarks for one synthetic snapshot
+    '''
+    import treemap_local
+
+    results = {}
+    batch_run_dir = os.path.join(work_dir, 'synth_{}'.format(num_inodes))
+    snapshot = os.path.join(work_dir, 'snapshot_{}'.format(num_inodes))
+    progress_log = os.path.join(work_dir, 'progress_{}.log'.format(num_inodes))
+
+    # the generator is timed once, mainly to size the other numbers
+    print('generating {} inodes'.format(num_inodes))
+    start = time.perf_counter()
+    mpistat_synth.generate(batch_run_dir, num_inodes)
+    mpistat_synth.write_progress_log(progress_log, num_inodes)
+    results['generate'] = {'min': time.perf_counter() - start}
+
+    # decoding the collector output, the first stage of the loader
+    results['decode'], rows = timed(lambda: decode_all(batch_run_dir), args.repeat)
+    results['decode']['rows_per_second'] = rows / results['decode']['min']
+
+    # the same with the protobuf runtime to compare with, if it's built
+    if has_protobuf():
+        results['decode_protobuf'], _ = timed(
+            lambda: decode_protobuf(batch_run_dir), args.repeat)
+        results['decode_protobuf']['rows_per_second'] = (
+            rows / results['decode_protobuf']['min'])
+
+    # loading into clickhouse
+    if args.load_database is not None:
+        start = time.perf_counter()
+        subprocess.run([
+            sys.executable, os.path.join(HOME, 'bin', 'mpistat_click_load.py'),
+            '--database', args.load_database,
+            '--batch_run_dir', batch_run_dir,
+            '--manifest', os.path.join(batch_run_dir, 'bench_manifest.jsonl')],
+            check=True)
+        results['click_load'] = {
+            'min': time.perf_counter() - start, 'rows': rows}
+
+    # the progress parser
+    results['progress'], _ = timed(
+        lambda: mpistat_progress.read_progress(progress_log), args.repeat)
+
+    # treemap reports over a local snapshot
+    results['columnar_convert'], _ = timed(
+        lambda: mpistat_columnar.convert(batch_run_dir, snapshot), 1)
+    treemap_local.SNAPSHOTS.clear()
+    for name, value in treemap_benchmarks(
+            treemap_local, snapshot, args.repeat).items():
+        results['local_' + name] = value
+    return results
+
+
+def compare(previous_file, current, threshold):
+    '''
+    print the ratio of the current min times to an earlier run
+    '''
+    with open(previous_file) as previous_json:
+        previous = json.load(previous_json)['results']
+    print()
+    print('compared with {}'.format(previous_file))
+    print('{:>10s} {:40s} {:>10s} {:>10s} {:>7s}'.format(
+        'scale', 'benchmark', 'before', 'after', 'ratio'))
+    regressions = 0
+    for scale, benchmarks in current.items():
+        for name, result in benchmarks.items():
+            try:
+                before = previous[scale][name]['min']
+            except KeyError:
+                continue
+            ratio = result['min'] / before if before > 0 else float('inf')
+            flag = ''
+            if ratio > threshold:
+                flag = ' <-- slower'
+                regressions += 1
+            print('{:>10s} {:40s} {:10.4f} {:10.4f} {:7.2f}{}'.format(
+                scale, name, before, result['min'], ratio, flag))
+    return regressions
+
+
+def main():
+    '''
+    main entry point
+    '''
+    args = get_args()
+    scales = [int(scale) for scale in args.scales.split(',')]
+
+    # find the results to compare with before writing new ones
+    os.makedirs(args.results_dir, exist_ok=True)
+    previous_file = args.compare
+    if previous_file is None:
+        existing = sorted(glob.glob(os.path.join(args.results_dir, '*.json')))
+        if existing:
+            previous_file = existing[-1]
+
+    # run the benchmarks
+    work_dir = args.work_dir
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='mpistat_bench_')
+    results = {}
+    try:
+        for num_inodes in scales:
+            results[str(num_inodes)] = run_scale(num_inodes, work_dir, args)
+        if args.database is not None:
+            import treemap
+            import treemap_cache
+            treemap_cache.ENABLED = False
+            results['clickhouse'] = treemap_benchmarks(
+                treemap, args.database, args.repeat)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    # the cli start up time, which doesn't depend on the scale
+    startup = startup_time(args.repeat)
+    if startup is None:
+        print('could not import treemap_cmd, skipping the startup check')
+    else:
+        results['startup'] = {'import_treemap_cmd': startup}
+
+    # print and save them
+    for scale, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            print('{:>10s} {:40s} {:10.4f}s'.format(scale, name, result['min']))
+    results_file = os.path.join(
+        args.results_dir, time.strftime('%Y%m%d_%H%M%S') + '.json')
+    with open(results_file, 'w') as out:
+        json.dump({
+            'time': int(time.time()),
+            'host': socket.gethostname(),
+            'python': platform.python_version(),
+            'args': vars(args),
+            'results': results}, out, indent=1)
+    print('saved results to {}'.format(results_file))
+
+    # compare with the earlier run
+    status = 0
+    if previous_file is not None:
+        regressions = compare(previous_file, results, args.threshold)
+        if regressions:
+            print('{} benchmarks are slower than before'.format(regressions))
+            status = 1
+
+    # check the start up time against its budget
+    if startup is not None and startup['min'] > args.startup_budget:
+        print('importing treemap_cmd took {:.3f}s, over the {:.3f}s budget'.format(
+            startup['min'], args.startup_budget))
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+'''
+load mpistat collector output files into a clickhouse database
+decodes the protocol buffer files and sends large columnar blocks
+using clickhouse_driver. several files are loaded in parallel and
+a manifest of the blocks inserted is kept so that a rerun carries
+on from where a failed load stopped
+'''
+
+import os
+import sys
+import json
+import time
+import glob
+import fcntl
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import clickhouse_driver
+
+import mpistat_pb
+import mpistat_config
+
+# collector file type and the table it is loaded into
+TABLES = (
+    ('f', 'files'),
+    ('d', 'directories'),
+    ('l', 'symlinks'))
+
+# the clickhouse client for each worker process
+CLICK = None
+
+
+def get_args():
+    ''''
+    parse the arguments to load collector output into clickhouse
+    '''
+    parser = argparse.ArgumentParser(description='''
+        load mpistat collector output files into a clickhouse database''')
+    parser.add_argument(
+        '--database', required=True,
+        help='database to load the data into')
+    parser.add_argument(
+        '--batch_run_dir',
+        help='directory holding the collector output files')
+    parser.set_defaults(batch_run_dir='.')
+    parser.add_argument(
+        '--rank', nargs='*',
+        help='only load the files written by these collector ranks'
+             ' (zero padded as in the file names). defaults to all files')
+    parser.add_argument(
+        '--parallel', type=int,
+        help='number of files to load at the same time')
+    parser.set_defaults(
+        parallel=getattr(mpistat_config, 'click_load_parallel', 3))
+    parser.add_argument(
+        '--batch_size', type=int,
+        help='number of rows to send in each insert')
+    parser.set_defaults(batch_size=mpistat_pb.BATCH_SIZE)
+    parser.add_argument(
+        '--retries', type=int,
+        help='number of times to retry a failed insert')
+    parser.set_defaults(retries=3)
+    parser.add_argument(
+        '--manifest',
+        help='file recording the blocks that have been loaded.'
+             ' defaults to click_load_manifest.jsonl in the batch_run_dir')
+    args = parser.parse_args()
+    if args.manifest is None:
+        args.manifest = os.path.join(
+            args.batch_run_dir, 'click_load_manifest.jsonl')
+    return args
+
+
+def data_files(batch_run_dir, ranks):
+    '''
+    list the (data file, table) pairs to load
+    '''
+    files = []
+    for file_type, table in TABLES:
+        if ranks:
+            paths = [
+                os.path.join(batch_run_dir, '{}_{}.out.gz'.format(rank, file_type))
+                for rank in ranks]
+            paths = [path for path in paths if os.path.exists(path)]
+        else:
+            paths = glob.glob(os.path.join(
+                batch_run_dir, '*_{}.out.gz'.format(file_type)))
+        files += [(path, table) for path in sorted(paths)]
+    return files
+
+
+def read_manifest(manifest):
+    '''
+    read the manifest and return the set of files that have been
+    completely loaded and the blocks loaded for each partial file
+    '''
+    done = set()
+    blocks = {}
+    try:
+        with open(manifest) as manifest_file:
+            for line in manifest_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a partly written last line from a killed load
+                    continue
+                name = record['file']
+                if record.get('done'):
+                    done.add(name)
+                else:
+                    blocks.setdefault(name, {})[record['block']] = record
+    except FileNotFoundError:
+        pass
+    return done, blocks
+
+
+def write_manifest(manifest, record):
+    '''
+    append a record to the manifest
+    several loads can share a manifest so take a lock while writing
+    '''
+    with open(manifest, 'a') as manifest_file:
+        fcntl.flock(manifest_file, fcntl.LOCK_EX)
+        try:
+            manifest_file.write(json.dumps(record) + '\n')
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        finally:
+            fcntl.flock(manifest_file, fcntl.LOCK_UN)
+
+
+def get_click():
+    '''
+    get the clickhouse client for this worker process
+    strings are sent as bytes since paths need not be valid utf-8
+    '''
+    global CLICK
+    if CLICK is None:
+        CLICK = clickhouse_driver.Client(
+            mpistat_config.click_host,
+            compression=True,
+            settings={'strings_as_bytes': True})
+    return CLICK
+
+
+def insert_block(database, table, batch, retries):
+    '''
+    insert a batch of rows, retrying with a backoff if it fails
+    '''
+    qry = 'INSERT INTO {}.{} ({}) VALUES'.format(
+        database, table, ', '.join(mpistat_pb.FIELD_NAMES))
+    columns = [
+        batch[name] if name in mpistat_pb.BYTES_FIELDS else batch[name].tolist()
+        for name in mpistat_pb.FIELD_NAMES]
+    for attempt in range(retries + 1):
+        try:
+            get_click().execute(qry, columns, columnar=True)
+            return
+        except Exception as err:
+            if attempt == retries:
+                raise
+            print('insert into {} failed, retrying : {}'.format(table, err))
+            get_click().disconnect()
+            time.sleep(2 ** attempt)
+
+
+def load_file(path, table, database, batch_size, retries, manifest, loaded):
+    '''
+    load one data file, skipping the blocks in loaded
+    returns the number of rows inserted
+    '''
+    name = os.path.basename(path)
+    start = time.time()
+    rows = 0
+    for block, batch in enumerate(mpistat_pb.read_batches(path, batch_size)):
+        num_rows = len(batch['mode'])
+        if block in loaded:
+            if loaded[block]['rows'] != num_rows:
+                raise Exception(
+                    'block {} of {} has changed size since it was loaded,'
+                    ' was the batch size changed?'.format(block, name))
+            continue
+        insert_block(database, table, batch, retries)
+        write_manifest(manifest, {
+            'file': name, 'table': table, 'block': block, 'rows': num_rows})
+        rows += num_rows
+    write_manifest(manifest, {'file': name, 'table': table, 'done': True})
+    print('{} loaded {} rows into {} in {:.1f} seconds'.format(
+        name, rows, table, time.time() - start))
+    return rows
+
+
+def main():
+    '''
+    main entry point
+    '''
+    args = get_args()
+
+    # work out what still needs loading
+    done, blocks = read_manifest(args.manifest)
+    todo = []
+    for path, table in data_files(args.batch_run_dir, args.rank):
+        name = os.path.basename(path)
+        if name in done:
+            print('{} already loaded, skipping'.format(name))
+            continue
+        todo.append((path, table, blocks.get(name, {})))
+    print('loading {} files into {}'.format(len(todo), args.database))
+
+    # load the files in parallel
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.parallel) as executor:
+        futures = [
+            executor.submit(
+                load_file, path, table, args.database, args.batch_size,
+                args.retries, args.manifest, loaded)
+            for path, table, loaded in todo]
+        for (path, _, _), future in zip(todo, futures):
+            try:
+                future.result()
+            except Exception as err:
+                failed += 1
+                print('failed to load {} : {}'.format(path, err))
+
+    if failed:
+        print('{} files failed to load, rerun to carry on'.format(failed))
+        return 1
+    print('finished loading')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+'''
+convert mpistat collector output files into a local columnar snapshot
+that cli/treemap_local.py can query without a clickhouse server
+
+a snapshot is a directory holding
+  meta.json       time of the conversion (used for atime_cost like the
+                  clickhouse schema), row counts and the suffix names
+  files/          a column per file for each field treemap uses
+  directories/    full_path and depth of each directory
+rows are sorted by full_path so everything under a path is a contiguous
+range. integer columns are .npy files that are memory mapped and
+full_path is stored as the concatenated bytes (full_path.bin) plus
+an array of offsets into them (full_path.npy)
+
+everything is sorted in memory so this is meant for small filesystems
+'''
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+
+import numpy as np
+
+import mpistat_pb
+
+# integer columns kept for files and directories
+FILE_COLUMNS = ('uid', 'gid', 'atime', 'mtime', 'size', 'blocks', 'depth')
+DIRECTORY_COLUMNS = ('depth',)
+
+
+def get_args():
+    ''''
+    parse the arguments to convert collector output to a snapshot
+    '''
+    parser = argparse.ArgumentParser(description='''
+        convert mpistat collector output files into a local columnar
+        snapshot for treemap --local''')
+    parser.add_argument(
+        'batch_run_dir',
+        help='directory holding the collector output files')
+    parser.add_argument(
+        'snapshot',
+        help='directory to write the snapshot to')
+    return parser.parse_args()
+
+
+def read_type(batch_run_dir, file_type, columns):
+    '''
+    read all the collector files of the given type (f or d)
+    returns the list of paths, the integer columns and the suffixes
+    '''
+    paths = []
+    suffixes = []
+    ints = {name: [] for name in columns}
+    fields = ('full_path', 'suffix') + columns
+    pattern = os.path.join(batch_run_dir, '*_{}.out.gz'.format(file_type))
+    for data_file in sorted(glob.glob(pattern)):
+        for batch in mpistat_pb.read_batches(data_file, fields=fields):
+            paths += batch['full_path']
+            suffixes += batch['suffix']
+            for name in columns:
+                ints[name].append(batch[name])
+    for name in columns:
+        if ints[name]:
+            ints[name] = np.concatenate(ints[name])
+        else:
+            ints[name] = np.zeros(0, dtype=np.uint64)
+    return paths, ints, suffixes
+
+
+def write_table(directory, paths, ints, order):
+    '''
+    write the paths and integer columns in the given row order
+    '''
+    os.makedirs(directory, exist_ok=True)
+    lengths = np.fromiter(
+        (len(paths[i]) for i in order), dtype=np.uint64, count=len(order))
+    offsets = np.zeros(len(order) + 1, dtype=np.uint64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(directory, 'full_path.npy'), offsets)
+    with open(os.path.join(directory, 'full_path.bin'), 'wb') as blob:
+        for i in order:
+            blob.write(paths[i])
+    index = np.array(order, dtype=np.int64)
+    for name, values in ints.items():
+        np.save(os.path.join(directory, name + '.npy'), values[index])
+
+
+def convert(batch_run_dir, snapshot):
+    '''
+    convert the collector output in batch_run_dir to a snapshot
+    returns the number of files and directories written
+    '''
+    now = int(time.time())
+
+    # files, with the suffixes stored as codes into a list of names
+    paths, ints, suffixes = read_type(batch_run_dir, 'f', FILE_COLUMNS)
+    order = sorted(range(len(paths)), key=paths.__getitem__)
+    names = sorted(set(suffixes))
+    codes = {name: code for code, name in enumerate(names)}
+    ints['suffix'] = np.array(
+        [codes[suffix] for suffix in suffixes], dtype=np.int32)
+    write_table(os.path.join(snapshot, 'files'), paths, ints, order)
+    num_files = len(paths)
+    del paths, ints, suffixes
+
+    # directories
+    paths, ints, _ = read_type(batch_run_dir, 'd', DIRECTORY_COLUMNS)
+    order = sorted(range(len(paths)), key=paths.__getitem__)
+    write_table(os.path.join(snapshot, 'directories'), paths, ints, order)
+
+    meta = {
+        'now': now,
+        'num_files': num_files,
+        'num_directories': len(paths),
+        'suffixes': [name.decode('utf-8', 'surrogateescape') for name in names]}
+    with open(os.path.join(snapshot, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file)
+    return num_files, len(paths)
+
+
+def main():
+    '''
+    main entry point
+    '''
+    args = get_args()
+    num_files, num_directories = convert(args.batch_run_dir, args.snapshot)
+    print('wrote {} files and {} directories to {}'.format(
+        num_files, num_directories, args.snapshot))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+'''
+streaming reader for the gzipped files of length delimited
+MpistatMsg protocol buffers written by the mpistat collector
+
+splits large buffered chunks into messages on their length prefixes
+and decodes a batch of messages at a time with numpy instead of
+building a protobuf object for each message. yields batches of
+messages as columns, the integer fields are numpy arrays and the
+path fields are lists of bytes
+'''
+
+import gzip
+from operator import getitem
+from itertools import repeat
+
+import numpy as np
+
+# fields of MpistatMsg in field number order (see src/mpistat.proto3)
+# name, field number, numpy dtype (None for bytes fields)
+FIELDS = (
+    ('full_path', 1, None),
+    ('directory', 2, None),
+    ('file_name', 3, None),
+    ('suffix', 4, None),
+    ('suffix_class', 5, None),
+    ('mode', 6, np.uint32),
+    ('lsize', 7, np.uint64),
+    ('size', 8, np.uint64),
+    ('gid', 9, np.uint32),
+    ('uid', 10, np.uint32),
+    ('atime', 11, np.uint32),
+    ('mtime', 12, np.uint32),
+    ('depth', 13, np.uint64),
+    ('blocks', 14, np.uint64),
+    ('nlinks', 15, np.uint32),
+    ('inode', 16, np.uint64),
+    ('device', 17, np.uint64))
+
+FIELD_NAMES = tuple(name for name, _, _ in FIELDS)
+BYTES_FIELDS = tuple(name for name, _, dtype in FIELDS if dtype is None)
+INT_FIELDS = tuple(name for name, _, dtype in FIELDS if dtype is not None)
+
+# highest field number, messages are decoded into a table indexed by it
+MAX_FIELD = max(number for _, number, _ in FIELDS)
+
+# the wire type of each field number, 2 for bytes and 0 for varints
+WIRE_TYPES = np.zeros(MAX_FIELD + 1, np.int64)
+for _name, _number, _dtype in FIELDS:
+    if _dtype is None:
+        WIRE_TYPES[_number] = 2
+
+# number of bytes of uncompressed data to read at a time
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# number of messages in each batch
+BATCH_SIZE = 100000
+
+
+class DecodeError(Exception):
+    '''
+    raised when a file is not a valid stream of MpistatMsg
+    '''
+
+
+def open_data_file(path):
+    '''
+    open a collector output file, gzipped or not
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_varint(data, pos):
+    '''
+    decode the varint at pos in data
+    returns the value and the position after it
+    raises IndexError if data ends part way through it
+    '''
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def split_messages(data, pos, end):
+    '''
+    find the complete length delimited messages in data from pos
+    returns the position after the last complete message and numpy
+    arrays of the start and end of the body of each message
+    '''
+    starts = []
+    ends = []
+    add_start = starts.append
+    add_end = ends.append
+    while pos < end:
+
+        # length of the message, nearly always 1 or 2 bytes
+        length = data[pos]
+        start = pos + 1
+        if length >= 0x80:
+            try:
+                length, start = read_varint(data, pos)
+            except IndexError:
+                break
+        msg_end = start + length
+        if msg_end > end:
+            break
+        add_start(start)
+        add_end(msg_end)
+        pos = msg_end
+    return pos, np.array(starts, np.int64), np.array(ends, np.int64)
+
+
+def read_varints(data, pos):
+    '''
+    decode the varints starting at each position in the array pos of
+    the uint8 array data. returns the values as int64, with uint64
+    values of 2**63 or more wrapped round, and the positions after them
+    '''
+    values = data[pos].astype(np.int64)
+    pos = pos + 1
+    more = np.flatnonzero(values >= 0x80)
+    if more.size:
+        values[more] &= 0x7f
+    shift = 7
+    while more.size:
+        if shift > 63:
+            raise DecodeError('varint is longer than 10 bytes')
+        more_pos = pos[more]
+        byte = data[more_pos].astype(np.int64)
+        values[more] |= (byte & 0x7f) << shift
+        pos[more] = more_pos + 1
+        more = more[byte >= 0x80]
+        shift += 7
+    return values, pos
+
+
+def decode_messages(data, starts, ends, fields):
+    '''
+    decode the messages with bodies from starts to ends in data into
+    a batch dictionary of the given fields
+
+    the messages are decoded together with numpy, a field of every
+    message per pass, so it takes as many passes as the most fields in
+    a message rather than a loop per message. the values go in a table
+    with a row per field number and a column per message, for bytes
+    fields that is the length and their offset goes in a second table,
+    so only the paths that were asked for are copied out of data
+    '''
+    num = len(starts)
+    array = np.frombuffer(data, np.uint8)
+    values = np.zeros((MAX_FIELD + 1) * num, np.int64)
+    offsets = np.zeros((MAX_FIELD + 1) * num, np.int64)
+    active = np.flatnonzero(starts < ends)
+    pos = starts[active]
+    end = ends[active]
+    try:
+        while active.size:
+            key, pos = read_varints(array, pos)
+            value, pos = read_varints(array, pos)
+            wire_type = key & 7
+
+            # fields MpistatMsg doesn't have go in the unused row 0,
+            # which takes either wire type
+            number = key >> 3
+            number[number > MAX_FIELD] = 0
+            bad = wire_type != WIRE_TYPES[number]
+            bad &= (number > 0) | (wire_type != 2)
+            if bad.any():
+                bad = np.flatnonzero(bad)[0]
+                raise DecodeError('unexpected wire type {} for field {}'.format(
+                    wire_type[bad], key[bad] >> 3))
+            index = number * num + active
+            values[index] = value
+
+            # the offset of bytes fields, the value is the length
+            length_delimited = np.flatnonzero(wire_type == 2)
+            if length_delimited.size:
+                offset = pos[length_delimited]
+                offsets[index[length_delimited]] = offset
+                pos[length_delimited] = offset + value[length_delimited]
+
+            unfinished = pos < end
+            if not unfinished.all():
+                if (pos > end).any():
+                    raise DecodeError('field overruns the end of the message')
+                active = active[unfinished]
+                pos = pos[unfinished]
+                end = end[unfinished]
+    except IndexError:
+        raise DecodeError('field overruns the end of the data')
+
+    values = values.reshape(MAX_FIELD + 1, num)
+    offsets = offsets.reshape(MAX_FIELD + 1, num)
+    batch = {}
+    for name, number, dtype in FIELDS:
+        if name not in fields:
+            continue
+        if dtype is None:
+            field_start = offsets[number]
+            batch[name] = list(map(
+                getitem, repeat(data),
+                map(slice, field_start.tolist(),
+                    (field_start + values[number]).tolist())))
+        else:
+            batch[name] = values[number].astype(dtype)
+    return batch
+
+
+def read_batches(path, batch_size=BATCH_SIZE, fields=FIELD_NAMES):
+    '''
+    generator yielding batches of up to batch_size messages from a
+    collector output file. each batch is a dictionary of column name
+    to a numpy array for integer fields or a list of bytes for paths
+    '''
+    fields = set(fields)
+    data = b''
+    pos = 0
+    starts = ends = np.zeros(0, np.int64)
+    with open_data_file(path) as data_file:
+        while True:
+            chunk = data_file.read(CHUNK_SIZE)
+            if chunk:
+
+                # keep the messages not yet decoded and the incomplete
+                # one left over from the last chunk
+                base = int(starts[0]) if starts.size else pos
+                data = data[base:] + chunk
+                starts = starts - base
+                ends = ends - base
+                pos, new_starts, new_ends = split_messages(
+                    data, pos - base, len(data))
+                starts = np.concatenate((starts, new_starts))
+                ends = np.concatenate((ends, new_ends))
+
+            # decode whole batches, and what is left at the end
+            while starts.size >= batch_size or (not chunk and starts.size):
+                yield decode_messages(
+                    data, starts[:batch_size], ends[:batch_size], fields)
+                starts = starts[batch_size:]
+                ends = ends[batch_size:]
+            if not chunk:
+                break
+    if pos != len(data):
+        raise DecodeError('{} ends part way through a message'.format(path))
+
+
+def encode_varint(value):
+    '''
+    encode an unsigned integer as a protobuf varint
+    '''
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_message(row):
+    '''
+    encode a dictionary of field values as a length delimited
+    MpistatMsg, the way the collector writes them. fields with
+    their default value are left out as proto3 does
+    '''
+    out = bytearray()
+    for name, number, dtype in FIELDS:
+        value = row.get(name)
+        if not value:
+            continue
+        if dtype is None:
+            out += encode_varint(number << 3 | 2)
+            out += encode_varint(len(value))
+            out += value
+        else:
+            out += encode_varint(number << 3)
+            out += encode_varint(int(value))
+    return encode_varint(len(out)) + bytes(out)
+
+
+def read_rows(path):
+    '''
+    generator yielding each message of a collector output file as a
+    dictionary. much slower than read_batches, mainly for debugging
+    '''
+    for batch in read_batches(path):
+        columns = [
+            batch[name] if name in BYTES_FIELDS else batch[name].tolist()
+            for name in FIELD_NAMES]
+        for row in zip(*columns):
+            yield dict(zip(FIELD_NAMES, row))
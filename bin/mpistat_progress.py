@@ -1,65 +1,329 @@
 # takes an mpistat stdout log file as input
 # picks out the timestamps and # of objects processed data points from the
 # relevant lines
-# draws graph of number of objects processes against time
+# draws graph of number of objects processes against time and of the
+# processing rate
 # useful for seeing how the mpistat collection scales with number of workers
 #
 # lines are like this :
 # 1556638658:0:libcircle/token.c:207:Objects processed: 1512468 ...
+#
+# with --follow the log is tailed while the collector is still running,
+# the rate and an ETA are printed and the graph is redrawn every so often.
+# the points kept for the graph are thinned out as the log grows so a
+# 24 hour scan is plotted in bounded memory
 
+import os
 import sys
 import re
+import time
+import math
+import codecs
+import argparse
 import numpy as np
 import matplotlib as mp
 mp.use('agg')
 import matplotlib.pyplot as plt
 
-def main():
+# regex to match data lines
+pattern = r'(\d+):\d:libcircle/token.c:207:Objects processed: (\d+) ...$'
+re_mpistat = re.compile(pattern)
 
-    # start plot
-    plt.ioff()
-    plt.title('Millions of objects processed against time')
-    plt.xlabel('Time / hours')
-    plt.ylabel('Millions of objects processed')
+# the collector prints this when it has finished
+FINISHED = '*** FINISHED ***'
 
-    # regex to match data lines
-    pattern = r'(\d+):\d:libcircle/token.c:207:Objects processed: (\d+) ...$'
-    re_mpistat = re.compile(pattern)
+# bytes read from the end of a log to find its last data line
+TAIL_BYTES = 65536
 
-    # open data file
-    data_file = 'mpistat_collector.sh.o{}'.format(sys.argv[1])
-    f = open(data_file)
+# bytes of the log read at a time
+READ_BYTES = 1024 * 1024
 
-    # lists to hold vars to plot
-    x = []
-    y = []
 
-    # loop over lines in  each file
-    for line in f:
+def get_args():
+    '''
+    parse the arguments for the progress graph
+    '''
+    parser = argparse.ArgumentParser(description='''
+        graph the progress of an mpistat collector job''')
+    parser.add_argument(
+        'jobid', nargs='?',
+        help='job id of the collector, the log read is'
+             ' mpistat_collector.sh.o<jobid>')
+    parser.add_argument(
+        '--log',
+        help='collector log to read instead of the one named by the job id')
+    parser.add_argument(
+        '--output',
+        help='file to write the graph to')
+    parser.set_defaults(output='mpistat_progress.png')
+    parser.add_argument(
+        '--follow', action='store_true',
+        help='keep reading the log as the collector writes it until the'
+             ' collector finishes')
+    parser.add_argument(
+        '--interval', type=float,
+        help='seconds between checking the log and redrawing the graph'
+             ' when following')
+    parser.set_defaults(interval=60.0)
+    parser.add_argument(
+        '--smoothing', type=float,
+        help='time constant in seconds of the smoothed rate')
+    parser.set_defaults(smoothing=600.0)
+    parser.add_argument(
+        '--previous',
+        help='log of a previous scan of the same filesystem, its total'
+             ' is used as the expected total for the ETA')
+    parser.add_argument(
+        '--expected_total', type=int,
+        help='expected number of objects, for the ETA')
+    parser.add_argument(
+        '--max_points', type=int,
+        help='maximum number of points kept for the graph')
+    parser.set_defaults(max_points=10000)
+    args = parser.parse_args()
+    if args.log is None:
+        if args.jobid is None:
+            parser.error('either a job id or --log is needed')
+        args.log = 'mpistat_collector.sh.o{}'.format(args.jobid)
+    return args
 
-        # see if line matches data line
-        m = re_mpistat.match(line)
 
+class LogTail:
+    '''
+    reads the progress lines added to a log since the last read
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = ''
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.finished = False
+
+    def read(self):
+        '''
+        generator yielding (timestamp, objects processed) for the complete
+        lines written since the last call. the log is read READ_BYTES at a
+        time so memory doesn't grow with the size of the log
+        '''
+        try:
+            log = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with log:
+            log.seek(self.offset)
+            while True:
+                data = log.read(READ_BYTES)
+                if not data:
+                    break
+                self.offset += len(data)
+                lines = (self.partial + self.decoder.decode(data)).split('\n')
+
+                # the last line may still be being written
+                self.partial = lines.pop()
+                for line in lines:
+                    m = re_mpistat.match(line)
+                    if m:
+                        yield int(m.group(1)), int(m.group(2))
+                    elif line.startswith(FINISHED):
+                        self.finished = True
+
+
+class Progress:
+    '''
+    running totals, rates and a thinned out history for the graph
+    '''
+
+    def __init__(self, smoothing=600.0, max_points=10000):
+        self.smoothing = smoothing
+        self.max_points = max_points
+        self.start = None
+        self.last = None
+        self.rate = None
+        self.smoothed = None
+        self.count = 0
+        self.stride = 1
+        self.history = []
+
+    def add(self, timestamp, processed):
+        '''
+        add a data point and update the rates
+        '''
+        if self.start is None:
+            self.start = timestamp
+        if self.last is not None:
+            dt = timestamp - self.last[0]
+            if dt > 0:
+                self.rate = (processed - self.last[1]) / dt
+                if self.smoothed is None:
+                    self.smoothed = self.rate
+                else:
+                    # exponentially weighted, allowing for uneven gaps
+                    alpha = 1.0 - math.exp(-dt / self.smoothing)
+                    self.smoothed += alpha * (self.rate - self.smoothed)
+        self.last = (timestamp, processed)
+
+        # keep every stride'th point, halving them when there are too many
+        if self.count % self.stride == 0:
+            self.history.append((
+                timestamp, processed,
+                np.nan if self.rate is None else self.rate,
+                np.nan if self.smoothed is None else self.smoothed))
+            if self.max_points and len(self.history) > self.max_points:
+                self.history = self.history[::2]
+                self.stride *= 2
+        self.count += 1
+
+    def eta(self, expected_total):
+        '''
+        seconds until expected_total objects have been processed
+        at the smoothed rate, or None if it can't be worked out
+        '''
+        if not expected_total or not self.smoothed or self.last is None:
+            return None
+        return max(0, expected_total - self.last[1]) / self.smoothed
+
+    def arrays(self):
+        '''
+        the history as arrays of hours since the start, millions of
+        objects processed and the instantaneous and smoothed rates
+        '''
+        points = list(self.history)
+        if self.last is not None and points and points[-1][0] != self.last[0]:
+            points.append((
+                self.last[0], self.last[1], self.rate, self.smoothed))
+        if not points:
+            return (np.zeros(0),) * 4
+        X, Y, R, S = (np.array(column, dtype=float) for column in zip(*points))
+        X -= self.start
+        X /= 3600.0  # rebase times to zero and change to hours
+        Y /= 1000000.0  # millions of objects processed
+        return X, Y, R, S
+
+
+def read_progress(data_file, max_points=None):
+    '''
+    read the progress lines from a collector log
+    returns arrays of hours since the start and millions of objects processed
+    '''
+    progress = Progress(max_points=max_points)
+    for timestamp, processed in LogTail(data_file).read():
+        progress.add(timestamp, processed)
+    X, Y, _, _ = progress.arrays()
+    return X, Y
+
+
+def final_total(data_file):
+    '''
+    the last number of objects processed in a collector log
+    only the end of the file is read
+    '''
+    with open(data_file, 'rb') as log:
+        log.seek(0, os.SEEK_END)
+        size = log.tell()
+        log.seek(max(0, size - TAIL_BYTES))
+        lines = log.read().decode(errors='replace').split('\n')
+    for line in reversed(lines):
+        m = re_mpistat.match(line)
         if m:
-            # stuff data into the lists to plot
-            x.append(float(m.group(1)))
-            y.append(float(m.group(2)))
-
-    # rebase times to zero and change to hours
-    t0 = x[0]
-    X = np.array(x)
-    Y = np.array(y)
-    X -= t0
-    X /= 3600.0  # rebase times to zero and change to hours
-    Y /= 1000000.0  # millions of objects processed
-
-    # do the plot
-    plt.plot(X, Y)
-    axes = plt.gca()
-    axes.set_xlim([0,None])
-    axes.set_ylim([0,None])
-    plt.savefig('mpistat_progress.png')
+            return int(m.group(2))
+
+    # no data line near the end, fall back to reading it all
+    _, Y = read_progress(data_file, max_points=1)
+    if len(Y):
+        return int(round(Y[-1] * 1000000.0))
+    return None
+
+
+def format_seconds(seconds):
+    '''
+    seconds as hours:minutes:seconds
+    '''
+    seconds = int(seconds)
+    return '{}:{:02d}:{:02d}'.format(
+        seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def status(progress, expected_total):
+    '''
+    one line summary of the progress so far
+    '''
+    if progress.last is None:
+        return 'no progress lines yet'
+    timestamp, processed = progress.last
+    line = '{} elapsed, {} objects, {:.0f}/s now, {:.0f}/s smoothed'.format(
+        format_seconds(timestamp - progress.start), processed,
+        progress.rate or 0, progress.smoothed or 0)
+    eta = progress.eta(expected_total)
+    if eta is not None:
+        line += ', {:.1f}% of {}, ETA {}'.format(
+            100.0 * processed / expected_total, expected_total,
+            format_seconds(eta))
+    return line
+
+
+def plot(progress, expected_total, output):
+    '''
+    draw the objects processed and the rate against time
+    '''
+    X, Y, R, S = progress.arrays()
+    plt.ioff()
+    fig, (top, bottom) = plt.subplots(2, 1, sharex=True, figsize=(8, 8))
+    top.set_title('Millions of objects processed against time')
+    top.set_ylabel('Millions of objects processed')
+    top.plot(X, Y)
+    if expected_total:
+        top.axhline(
+            expected_total / 1000000.0, color='grey', linestyle='--',
+            label='expected total')
+        top.legend(loc='lower right')
+    bottom.set_title('Objects processed per second')
+    bottom.set_xlabel('Time / hours')
+    bottom.set_ylabel('Objects per second')
+    bottom.plot(X, R, alpha=0.4, label='instantaneous')
+    bottom.plot(X, S, label='smoothed')
+    bottom.legend(loc='upper right')
+    for axes in (top, bottom):
+        axes.set_xlim([0,None])
+        axes.set_ylim([0,None])
+    fig.tight_layout()
+
+    # write to a temporary file first so a reader never sees half a png
+    tmp = output + '.tmp.png'
+    fig.savefig(tmp)
+    plt.close(fig)
+    os.replace(tmp, output)
+
+
+def main():
+    args = get_args()
+    expected_total = args.expected_total
+    if expected_total is None and args.previous is not None:
+        expected_total = final_total(args.previous)
+
+    tail = LogTail(args.log)
+    progress = Progress(args.smoothing, args.max_points)
+    while True:
+        num_points = 0
+        for timestamp, processed in tail.read():
+            progress.add(timestamp, processed)
+            num_points += 1
+        if not args.follow:
+            break
+        if num_points:
+            print(status(progress, expected_total), flush=True)
+            plot(progress, expected_total, args.output)
+        if tail.finished:
+            break
+        time.sleep(args.interval)
+
+    if progress.last is None:
+        print('no progress lines in {}'.format(args.log))
+        return 1
+    print(status(progress, None if tail.finished else expected_total))
+    plot(progress, expected_total, args.output)
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,273 @@
+'''
+generate a synthetic filesystem snapshot in the same layout as the
+mpistat collector output (NNN_f.out.gz, NNN_d.out.gz, NNN_l.out.gz)
+for benchmarking the loader and treemap without production data
+
+the tree shape, uid / gid skew, suffix mix and atime distribution
+are all configurable and the output only depends on the seed
+'''
+
+import os
+import sys
+import gzip
+import time
+import argparse
+
+import numpy as np
+
+import mpistat_pb
+
+# default mix of file suffixes and their relative frequency
+DEFAULT_SUFFIXES = (
+    ('', 20), ('txt', 15), ('gz', 15), ('bam', 10), ('fastq', 10),
+    ('log', 10), ('py', 5), ('h5', 5), ('tif', 5), ('csv', 5))
+
+# file type bits for the mode
+MODE_FILE = 0o100644
+MODE_DIRECTORY = 0o040755
+MODE_SYMLINK = 0o120777
+
+
+def get_args():
+    ''''
+    parse the arguments for the synthetic snapshot generator
+    '''
+    parser = argparse.ArgumentParser(description='''
+        generate a synthetic mpistat collector output directory''')
+    parser.add_argument(
+        'out_dir',
+        help='directory to write the output files to')
+    parser.add_argument(
+        '-n', '--num_inodes', type=int,
+        help='total number of inodes to generate')
+    parser.set_defaults(num_inodes=100000)
+    parser.add_argument(
+        '--num_ranks', type=int,
+        help='number of collector ranks to spread the output over')
+    parser.set_defaults(num_ranks=4)
+    parser.add_argument(
+        '--depth', type=int,
+        help='maximum depth of the directory tree below the seed')
+    parser.set_defaults(depth=6)
+    parser.add_argument(
+        '--fanout', type=float,
+        help='mean number of subdirectories in each directory')
+    parser.set_defaults(fanout=8.0)
+    parser.add_argument(
+        '--dir_fraction', type=float,
+        help='fraction of the inodes that are directories')
+    parser.set_defaults(dir_fraction=0.05)
+    parser.add_argument(
+        '--symlink_fraction', type=float,
+        help='fraction of the inodes that are symlinks')
+    parser.set_defaults(symlink_fraction=0.01)
+    parser.add_argument(
+        '--num_users', type=int,
+        help='number of distinct uids')
+    parser.set_defaults(num_users=100)
+    parser.add_argument(
+        '--num_groups', type=int,
+        help='number of distinct gids')
+    parser.set_defaults(num_groups=20)
+    parser.add_argument(
+        '--skew', type=float,
+        help='zipf exponent for how files are spread over users, groups'
+             ' and directories. 0 is uniform')
+    parser.set_defaults(skew=1.1)
+    parser.add_argument(
+        '--suffixes',
+        help='suffix mix as a comma separated list of suffix:weight')
+    parser.add_argument(
+        '--atime_mean_days', type=float,
+        help='mean number of days since files were last accessed')
+    parser.set_defaults(atime_mean_days=365.0)
+    parser.add_argument(
+        '--seed_dir',
+        help='the directory the synthetic tree starts from')
+    parser.set_defaults(seed_dir='/synth')
+    parser.add_argument(
+        '--seed', type=int,
+        help='random seed')
+    parser.set_defaults(seed=0)
+    parser.add_argument(
+        '--progress_log',
+        help='also write a synthetic collector stdout log with this name')
+    parser.add_argument(
+        '--progress_lines', type=int,
+        help='number of progress lines in the log')
+    parser.set_defaults(progress_lines=8640)
+    args = parser.parse_args()
+    if args.suffixes is None:
+        args.suffixes = DEFAULT_SUFFIXES
+    else:
+        args.suffixes = tuple(
+            (item.rsplit(':', 1)[0], float(item.rsplit(':', 1)[1]))
+            for item in args.suffixes.split(','))
+    return args
+
+
+def zipf_weights(num, skew):
+    '''
+    probabilities for num items following a zipf distribution
+    '''
+    weights = 1.0 / np.arange(1, num + 1) ** skew
+    return weights / weights.sum()
+
+
+def make_tree(rng, seed_dir, num_dirs, depth, fanout):
+    '''
+    breadth first directory tree with a poisson number of
+    subdirectories per directory, up to num_dirs directories
+    '''
+    dirs = [seed_dir]
+    head = 0
+    while len(dirs) < num_dirs and head < len(dirs):
+        parent = dirs[head]
+        head += 1
+        if parent.count('/') - seed_dir.count('/') >= depth:
+            continue
+        for i in range(rng.poisson(fanout)):
+            dirs.append('{}/d{}'.format(parent, i))
+            if len(dirs) >= num_dirs:
+                break
+    return dirs
+
+
+class RankWriter:
+    '''
+    gzipped output files for each rank and inode type
+    '''
+
+    def __init__(self, out_dir, num_ranks):
+        self.out_dir = out_dir
+        self.digits = max(1, len(str(num_ranks - 1)))
+        self.files = {}
+
+    def write(self, rank, file_type, row):
+        key = (rank, file_type)
+        if key not in self.files:
+            name = '{:0{}d}_{}.out.gz'.format(rank, self.digits, file_type)
+            self.files[key] = gzip.open(
+                os.path.join(self.out_dir, name), 'wb', compresslevel=1)
+        self.files[key].write(mpistat_pb.encode_message(row))
+
+    def close(self):
+        for out in self.files.values():
+            out.close()
+
+
+def generate(
+        out_dir, num_inodes, num_ranks=4, depth=6, fanout=8.0,
+        dir_fraction=0.05, symlink_fraction=0.01,
+        num_users=100, num_groups=20, skew=1.1,
+        suffixes=DEFAULT_SUFFIXES, atime_mean_days=365.0,
+        seed_dir='/synth', seed=0, now=None):
+    '''
+    write a synthetic snapshot to out_dir
+    returns the number of files, directories and symlinks written
+    '''
+    rng = np.random.default_rng(seed)
+    if now is None:
+        now = int(time.time())
+    os.makedirs(out_dir, exist_ok=True)
+    writer = RankWriter(out_dir, num_ranks)
+    inode = 1000
+
+    # directories
+    dirs = make_tree(
+        rng, seed_dir, max(1, int(num_inodes * dir_fraction)), depth, fanout)
+    for path in dirs:
+        inode += 1
+        writer.write(int(rng.integers(num_ranks)), 'd', {
+            'full_path': path.encode(),
+            'mode': MODE_DIRECTORY,
+            'lsize': 4096, 'size': 4096, 'blocks': 8,
+            'uid': 0, 'gid': 0,
+            'atime': now - int(rng.integers(86400 * 30)),
+            'mtime': now - int(rng.integers(86400 * 365)),
+            'depth': path.count('/'),
+            'nlinks': 2, 'inode': inode, 'device': 42})
+
+    # files and symlinks, all the random columns are drawn up front
+    num = max(0, num_inodes - len(dirs))
+    parents = rng.choice(len(dirs), size=num, p=zipf_weights(len(dirs), skew))
+    uids = 1000 + rng.choice(num_users, size=num, p=zipf_weights(num_users, skew))
+    gids = 1000 + rng.choice(num_groups, size=num, p=zipf_weights(num_groups, skew))
+    names = [name for name, _ in suffixes]
+    weights = np.array([weight for _, weight in suffixes], dtype=float)
+    suffix_index = rng.choice(len(names), size=num, p=weights / weights.sum())
+    sizes = np.minimum(rng.lognormal(10.0, 3.0, size=num), 2**40).astype(np.int64)
+    atimes = now - rng.exponential(atime_mean_days * 86400, size=num).astype(np.int64)
+    mtimes = atimes - rng.exponential(30 * 86400, size=num).astype(np.int64)
+    is_link = rng.random(size=num) < symlink_fraction
+    ranks = rng.integers(num_ranks, size=num)
+    num_links = 0
+    for i in range(num):
+        directory = dirs[parents[i]].encode()
+        suffix = names[suffix_index[i]].encode()
+        file_name = b'f%d' % i
+        if suffix:
+            file_name += b'.' + suffix
+        full_path = directory + b'/' + file_name
+        inode += 1
+        row = {
+            'full_path': full_path,
+            'uid': int(uids[i]), 'gid': int(gids[i]),
+            'atime': max(0, int(atimes[i])), 'mtime': max(0, int(mtimes[i])),
+            'depth': full_path.count(b'/'),
+            'nlinks': 1, 'inode': inode, 'device': 42}
+        if is_link[i]:
+            num_links += 1
+            row.update({'mode': MODE_SYMLINK, 'lsize': 20, 'size': 0})
+            writer.write(int(ranks[i]), 'l', row)
+            continue
+        size = int(sizes[i])
+        row.update({
+            'directory': directory,
+            'file_name': file_name,
+            'suffix': suffix,
+            'mode': MODE_FILE,
+            'lsize': size, 'size': size, 'blocks': (size + 511) // 512})
+        writer.write(int(ranks[i]), 'f', row)
+    writer.close()
+    return num - num_links, len(dirs), num_links
+
+
+def write_progress_log(path, num_lines, rate=20000.0, interval=10, seed=0):
+    '''
+    write a collector stdout log with num_lines progress lines, one
+    every interval seconds, processing about rate objects per second
+    '''
+    rng = np.random.default_rng(seed)
+    start = 1556638658
+    processed = 0
+    with open(path, 'w') as log:
+        log.write('args are: mpistat /data /synth\n')
+        for i in range(1, num_lines + 1):
+            processed += int(rate * interval * rng.uniform(0.5, 1.5))
+            log.write(
+                '{}:0:libcircle/token.c:207:Objects processed: {} ...\n'.format(
+                    start + i * interval, processed))
+        log.write('*** FINISHED *** : wrote {} lines\n'.format(processed))
+
+
+def main():
+    '''
+    main entry point
+    '''
+    args = get_args()
+    num_files, num_dirs, num_links = generate(
+        args.out_dir, args.num_inodes, args.num_ranks, args.depth,
+        args.fanout, args.dir_fraction, args.symlink_fraction,
+        args.num_users, args.num_groups, args.skew, args.suffixes,
+        args.atime_mean_days, args.seed_dir, args.seed)
+    print('wrote {} files, {} directories and {} symlinks to {}'.format(
+        num_files, num_dirs, num_links, args.out_dir))
+    if args.progress_log is not None:
+        write_progress_log(
+            os.path.join(args.out_dir, args.progress_log), args.progress_lines)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,23 +1,25 @@
-import proto3_pb2 as mpistat
+'''
+print the messages in an mpistat collector output file
+'''
 
-from google.protobuf.internal.encoder import _VarintBytes
-from google.protobuf.internal.decoder import _DecodeVarint32
+import sys
+
+import mpistat_pb
 
 
 def main():
     '''
     main entry point
     '''
-    with gzip.open(sys.argv[1], 'rb') as f:
-        buf = f.read(10)
-        while buf:
-            msg_len, new_pos = _DecodeVarint32(buf,0)
-            buf = buf[new_pos:]
-            buf += f.read(msg_len - len(buf))
-            msg = mpistat.MpistatMsg()
-            msg.ParseFromString(buf)
-            print(msg)
-            buf = f.read(10)
+    for row in mpistat_pb.read_rows(sys.argv[1]):
+        for name in mpistat_pb.FIELD_NAMES:
+            value = row[name]
+            if name in mpistat_pb.BYTES_FIELDS:
+                value = value.decode('utf-8', 'backslashreplace')
+            print('{}: {}'.format(name, value))
+        print()
+    return 0
+
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -4,6 +4,7 @@ run the mpistat collector pipeline
 
 import sys
 import os
+import re
 import errno
 from datetime import datetime
 import argparse
@@ -159,6 +160,9 @@ def main():
         'tag': args.tag,
         'click_host': mpistat_config.click_host,
         'click_num_parallel_loads': mpistat_config.click_num_parallel_loads,
+        'click_load_parallel': getattr(mpistat_config, 'click_load_parallel', 3),
+        'warm_num_requests': getattr(mpistat_config, 'warm_num_requests', 100),
+        'warm_parallel': getattr(mpistat_config, 'warm_parallel', 4),
         'database': args.tag + '_' + date_str
     }
 
@@ -197,13 +201,24 @@ def main():
     #############################
     # load the data into the db #
     #############################
-    make_job(
+    click_load_job_id = make_job(
         jinja_env,
         batch_run_dir,
         'mpistat_click_load',
         sys.argv,
         context,
         click_create_job_id)
+
+    #########################################
+    # warm the treemap cache for the new db #
+    #########################################
+    make_job(
+        jinja_env,
+        batch_run_dir,
+        'mpistat_post_load',
+        [],
+        context,
+        click_load_job_id)
     logging.info('finished')
     return 0
 
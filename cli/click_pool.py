@@ -0,0 +1,142 @@
+'''
+a pool of clickhouse connections shared by the treemap functions
+connections are keyed by (host, database) and reused between queries
+'''
+
+import time
+import threading
+from contextlib import contextmanager
+
+
+class ClickPool:
+    '''
+    thread safe pool of clickhouse_driver clients
+
+    max_size is the number of clients that can exist at the same time
+    for each (host, database), callers wait for one to be released once
+    the limit is reached.
+    idle clients are disconnected after max_idle seconds and clients
+    that have been idle for more than check_after seconds are pinged
+    before being handed out again
+    '''
+
+    def __init__(self, max_size=8, max_idle=300, check_after=30):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.check_after = check_after
+        # one condition for every key, so waiters are all woken when a
+        # client is freed and go back to sleep if it wasn't for their key
+        self.lock = threading.Condition()
+
+        # idle clients and the time they were released for each key
+        self.idle = {}
+
+        # number of clients in use or idle for each key
+        self.size = {}
+
+    def new_client(self, host, database):
+        '''
+        create a new client, the connection is made on the first query
+        clickhouse_driver is imported here so answers from the cache
+        don't pay for importing it
+        '''
+        import clickhouse_driver
+
+        if database is None:
+            return clickhouse_driver.Client(host, compression=True)
+        return clickhouse_driver.Client(
+            host, database=database, compression=True)
+
+    def evict(self):
+        '''
+        disconnect clients that have been idle for too long
+        must be called with the lock held
+        '''
+        now = time.time()
+        for key, idle in self.idle.items():
+            while idle and now - idle[0][1] > self.max_idle:
+                client, _ = idle.pop(0)
+                self.size[key] -= 1
+                client.disconnect()
+
+    def healthy(self, client, idle_time):
+        '''
+        ping clients that have been idle for a while
+        '''
+        if idle_time < self.check_after:
+            return True
+        try:
+            return client.connection.ping()
+        except Exception:
+            return False
+
+    def acquire(self, host, database):
+        '''
+        get a client for the host and database
+        blocks if max_size clients are already in use
+        '''
+        key = (host, database)
+        while True:
+            with self.lock:
+                self.evict()
+                idle = self.idle.setdefault(key, [])
+                self.size.setdefault(key, 0)
+                while not idle and self.size[key] >= self.max_size:
+                    self.lock.wait()
+                if not idle:
+                    self.size[key] += 1
+                    break
+                client, released = idle.pop()
+            if self.healthy(client, time.time() - released):
+                return client
+            self.discard(host, database, client)
+        try:
+            return self.new_client(host, database)
+        except Exception:
+            with self.lock:
+                self.size[key] -= 1
+                self.lock.notify_all()
+            raise
+
+    def release(self, host, database, client):
+        '''
+        return a client to the pool
+        '''
+        with self.lock:
+            self.idle[(host, database)].append((client, time.time()))
+            self.lock.notify_all()
+
+    def discard(self, host, database, client):
+        '''
+        drop a client that has failed rather than returning it to the pool
+        '''
+        client.disconnect()
+        with self.lock:
+            self.size[(host, database)] -= 1
+            self.lock.notify_all()
+
+    @contextmanager
+    def connection(self, host, database):
+        '''
+        context manager that lends out a client from the pool
+        clients are discarded if the block raises an exception
+        since the connection may be left in an unknown state
+        '''
+        client = self.acquire(host, database)
+        try:
+            yield client
+        except BaseException:
+            self.discard(host, database, client)
+            raise
+        self.release(host, database, client)
+
+    def close(self):
+        '''
+        disconnect all the idle clients
+        '''
+        with self.lock:
+            for key, idle in self.idle.items():
+                for client, _ in idle:
+                    client.disconnect()
+                self.size[key] -= len(idle)
+                idle.clear()
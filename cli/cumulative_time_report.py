@@ -11,7 +11,15 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import matplotlib as mp
-import clickhouse_driver
+
+import treemap
+import treemap_args
+import treemap_config
+
+# the kind column returned by treemap.age_histograms
+ATIME = 0
+MTIME = 1
+
 
 def get_args():
     ''''
@@ -25,49 +33,52 @@ def get_args():
         required=True)
     parser.add_argument(
         '--host',
-        help='clickhouse host',
-        required=True)
+        help='clickhouse host, defaults to CLICK_HOST in treemap_config')
     parser.add_argument(
         '--num_days',
         help='number of days back in time to include',
         type=int, required=True)
-    return parser.parse_args()
-
-
-def get_data_set(click, time_var, qry_var):
-    '''
-    get data to graph for a particular time_var (atime,mtime)
-    and data type (size or nfiles)
+    parser.add_argument(
+        '--output',
+        help='file to save the graph to, defaults to'
+             ' cumulative_access_time_plots_<database>.png')
+    treemap_args.add_filter_arguments(parser)
+    args = treemap_args.process_filter_arguments(parser.parse_args())
+    if args.output is None:
+        args.output = 'cumulative_access_time_plots_{}.png'.format(
+            args.database)
+    return args
+
+
+def get_data_set(rows, kind, num_days):
     '''
-
-    # query base text
-    qry = f'''
-        select {time_var}_days, {qry_var} 
-        from files
-        where {time_var}_days >=0
-        and {time_var}_days < 5000
-        group by {time_var}_days
-        order by {time_var}_days
+    get the cumulative size (TiB) and number of files (millions) to
+    graph for one kind of time (ATIME or MTIME) from the histogram rows.
+    rows are binned by day so days without any files still take
+    their place on the x axis
     '''
-
-    # get data from clickhouse
-    rows = click.execute(qry)
+    size = np.zeros(num_days)
+    nfiles = np.zeros(num_days)
+    if rows:
+        data = np.array(rows, dtype=float)
+        data = data[data[:, 0] == kind]
+        days = data[:, 1].astype(np.int64)
+        np.add.at(size, days, data[:, 2])
+        np.add.at(nfiles, days, data[:, 3])
 
     # work out cumulative values
-    accumulator = 0
-    data = []
-    for row in rows:
-        day = row[0]
-        val = row[1] + accumulator
-        data.append(val)
-        accumulator = val
+    size = np.cumsum(size) / (1024*1024*1024*1024)
+    nfiles = np.cumsum(nfiles) / (1000*1000)
 
     # transform to graphable format
-    X = np.array(range(len(data))).astype(float)
+    X = np.arange(num_days, dtype=float)
     X /= 365.0
-    Ymax = accumulator
-    Y = 100.0*np.array(data)/Ymax
-    return (X,Y,Ymax)
+    size_max = size[-1] if num_days else 0.0
+    nfiles_max = nfiles[-1] if num_days else 0.0
+    Y_size = 100.0*size/size_max if size_max else size
+    Y_nfiles = 100.0*nfiles/nfiles_max if nfiles_max else nfiles
+    return X, Y_size, size_max, Y_nfiles, nfiles_max
+
 
 def main():
     '''
@@ -77,57 +88,49 @@ def main():
     # get args
     args = get_args()
 
-    # get connection to the clickhouse database
-    click = clickhouse_driver.Client(
-       args.host,
-       database=args.database,
-       compression=True)
-
-    X_atime_size, Y_atime_size, Ymax_atime_size = get_data_set(
-        click,
-        'atime',
-        'sum(blocks*512)/(1024*1024*1024*1024)')
-
-    X_atime_nfiles, Y_atime_nfiles, Ymax_atime_nfiles = get_data_set(
-        click, 
-        'atime',
-        'count(*)/(1000*1000)')
+    # the report functions use the host from treemap_config
+    if args.host is not None:
+        treemap_config.CLICK_HOST = args.host
 
-    X_mtime_size, Y_mtime_size, Ymax_mtime_size = get_data_set(
-        click,
-        'mtime',
-        'sum(blocks*512)/(1024*1024*1024*1024)')
+    # the atime and mtime histograms with both size and count
+    # for the path and filters in one pass over the table
+    rows = treemap.age_histograms(
+        args.database, args.path, *treemap_args.filters(args), args.num_days)
 
-    X_mtime_nfiles, Y_mtime_nfiles, Ymax_mtime_nfiles = get_data_set(
-        click,   
-        'mtime',
-        'count(*)/(1000*1000)')
+    (X_atime, Y_atime_size, Ymax_atime_size,
+        Y_atime_nfiles, Ymax_atime_nfiles) = get_data_set(
+            rows, ATIME, args.num_days)
+    (X_mtime, Y_mtime_size, Ymax_mtime_size,
+        Y_mtime_nfiles, Ymax_mtime_nfiles) = get_data_set(
+            rows, MTIME, args.num_days)
 
     # do the plot
     mp.use('agg')
     fig, ax1 = plt.subplots()
     plt.title('Cumulative size / nfiles for time since last access / modification')
+    if args.path:
+        fig.suptitle(args.path, fontsize='small')
     color = 'tab:red'
     ax1.set_xlabel('years since last accessed / modified')
     ax1.set_ylabel(f'cumulative size % ({Ymax_atime_size:.2f} TiB)')
-    ax1.step(X_atime_size, Y_atime_size, color='tab:red',
+    ax1.step(X_atime, Y_atime_size, color='tab:red',
         linewidth=0.5, label='atime_size')
-    ax1.step(X_mtime_size, Y_mtime_size, color='tab:blue',
+    ax1.step(X_mtime, Y_mtime_size, color='tab:blue',
         linewidth=0.5, label='mtime_size')
     ax1.grid(True, which='major', linestyle='-')
     ax1.grid(True, which='minor', linestyle='--')
     ax1.set_xlim(xmin=0)
     ax2 = ax1.twinx()
     ax2.set_ylabel(f'cumulative number of files % ({Ymax_atime_nfiles:.2f} Million)')
-    ax2.step(X_atime_nfiles, Y_atime_nfiles, color='tab:green',
+    ax2.step(X_atime, Y_atime_nfiles, color='tab:green',
         linewidth=0.5, label='atime_nfiles')
-    ax2.step(X_mtime_nfiles, Y_mtime_nfiles, color='tab:orange',
+    ax2.step(X_mtime, Y_mtime_nfiles, color='tab:orange',
         linewidth=0.5, label='mtime_nfiles')
     ax1.set_ylim(ymin=0)
     ax2.set_ylim(ymin=0)
     fig.tight_layout()
     fig.legend(loc='upper left', bbox_to_anchor=(0.6, 0.4))
-    plt.savefig('cumulative_access_time_plots_{}.png'.format(args.database))
+    plt.savefig(args.output)
     plt.close()
     return 0
 
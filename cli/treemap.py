@@ -3,93 +3,80 @@ functions for getting mpistat data
 in a clickhouse database
 '''
 
-import pwd
-import grp
-import bidict
-import clickhouse_driver
-from memorised.decorators import memorise
+import json
+import math
+import time
+from functools import wraps
 
 import treemap_config
+import treemap_cache
+import treemap_names
+from click_pool import ClickPool
 
-# global bidicts for users and groups
-GROUPS = bidict.bidict()
+# how get_subdir_data works out the totals for each child directory
+# 'grouped' does a single group by over the path component below the path
+# 'per_child' does a subtree_sums query for each subdirectory
+SUBDIR_MODE = getattr(treemap_config, 'SUBDIR_MODE', 'grouped')
 
-# the primary key is username
-USERS = bidict.bidict()
+# maximum number of per child queries to run at the same time
+MAX_CONCURRENT_QUERIES = getattr(treemap_config, 'MAX_CONCURRENT_QUERIES', 8)
 
+# use the pre-aggregated rollup table when the filters allow it
+USE_ROLLUP = getattr(treemap_config, 'USE_ROLLUP', True)
+
+# file to log every report request to, used to warm the cache
+# after a new database is loaded. None to disable logging
+ACCESS_LOG = getattr(treemap_config, 'ACCESS_LOG', None)
+
+# fraction of the files read by the approximate (--fast) reports
+# and the z value for the confidence intervals given with them
+SAMPLE = getattr(treemap_config, 'SAMPLE', 0.01)
+CONFIDENCE_Z = getattr(treemap_config, 'CONFIDENCE_Z', 1.96)
+
+# files_sample holds the files whose sample_key, intHash32(inode) % 1000,
+# is below 100, these must match clickhouse/schema.sql.tpl
+SAMPLE_BUCKETS = 1000
+SAMPLE_KEPT = 100
+
+# number of rows clickhouse sends in each block when streaming results
+EXPORT_BLOCK_SIZE = getattr(treemap_config, 'EXPORT_BLOCK_SIZE', 65536)
+
+# cache of which optional tables (rollup, files_by_path, files_sample)
+# each database has. databases loaded before they were added to the
+# schema do not
+TABLES = {}
+
+# clickhouse connections shared by all the treemap functions
+POOL = ClickPool(
+    max_size=getattr(treemap_config, 'POOL_MAX_SIZE', 8),
+    max_idle=getattr(treemap_config, 'POOL_MAX_IDLE', 300))
 
 def get_gid(group):
     '''
     get the gid for a particular group
     '''
-    try:
-        gid = GROUPS.inverse[group]
-        return gid
-    except KeyError:
-        try:
-            gid = grp.getgrnam(group)[2]
-            GROUPS[gid] = group
-            return gid
-        except KeyError:
-            GROUPS[group] = group
-            return group
+    return treemap_names.gid(group)
 
 
 def get_group(gid):
     '''
     get the group for a particular gid
     '''
-    try:
-        # this line triggers a false positive in pylint
-        # see https://github.com/PyCQA/pylint/issues/1498
-        #pylint: disable=unsubscriptable-object
-        group = GROUPS[gid]
-        return group
-    except KeyError:
-        try:
-            group = grp.getgrgid(gid)[0]
-            GROUPS[gid] = str(group)
-            return str(group)
-        except KeyError:
-            GROUPS[gid] = str(gid)
-            return str(gid)
+    return treemap_names.group(gid)
 
 
 def get_uid(username):
     '''
     get the uid for a particular username
     '''
-    try:
-        uid = USERS.inverse[username]
-        return uid
-    except KeyError:
-        try:
-            uid = pwd.getpwnam(username)[2]
-            USERS[uid] = username
-            return uid
-        except KeyError:
-            USERS[username] = username
-            return username
+    return treemap_names.uid(username)
 
 
 def get_username(uid):
     '''
     get the username for a particular uid
     '''
-    try:
-        # this line triggers a false positive in pylint
-        # see https://github.com/PyCQA/pylint/issues/1498
-        #pylint: disable=unsubscriptable-object
-        username = USERS[uid]
-        return username
-    except KeyError:
-        try:
-            username = pwd.getpwuid(uid)[0]
-            USERS[uid] = username
-            return username
-        except KeyError:
-            USERS[uid] = str(uid)
-            return str(uid)
+    return treemap_names.username(uid)
 
 
 def get_bytes_str(nbytes):
@@ -127,22 +114,37 @@ def path_depth(path):
     return len(path.split('/')) - 1
 
 
+def escape(value):
+    '''
+    escape a string to go between single quotes in a query
+    '''
+    return str(value).replace('\\', '\\\\').replace("'", "\\'")
+
+
+def child_name_expr(path):
+    '''
+    clickhouse expression for the name of the child of the given
+    path that a row of the files table lives under
+    files directly in the path are put in the *.* bucket
+    '''
+    return "if(directory = '{}', '*.*', splitByChar('/', full_path)[{}])".format(
+        escape(path), path_depth(path) + 2)
+
+
 def default_tag():
     return treemap_config.DEFAULT_TAG
 
 
-def get_databases(tag):
+def list_databases(tag):
     '''
     returns the set of available databases
     only shows for the given tag if included
+    this queries clickhouse, get_databases uses the catalog
     '''
-    click = clickhouse_driver.Client(
-        treemap_config.CLICK_HOST,
-        compression=True)
     qry = 'select name from system.databases'
     if tag is not None:
-        qry += " where name like '{}%'".format(tag)
-    rows = click.execute(qry)
+        qry += " where name like '{}%'".format(escape(tag))
+    rows = execute(None, qry)
     databases = set()
     for row in rows:
         databases.add(row[0])
@@ -155,36 +157,234 @@ def get_databases(tag):
     return databases
 
 
+def get_databases(tag):
+    '''
+    returns the set of snapshot databases
+    only shows for the given tag if included
+    '''
+    import treemap_catalog
+    return {entry['name'] for entry in treemap_catalog.databases(tag)}
+
+
 def get_database(tag):
     '''
     get the latest database with the given tag
     uses the default tag if None is passed
     '''
+    import treemap_catalog
     if tag is None:
         tag=treemap_config.DEFAULT_TAG
+    return treemap_catalog.latest(tag)
+
+
+def execute(database, qry):
+    '''
+    run a query against the required database using
+    a client from the connection pool
+    '''
+    with POOL.connection(treemap_config.CLICK_HOST, database) as click:
+        return click.execute(qry)
+
+
+def iterate(database, qry, block_size=EXPORT_BLOCK_SIZE):
+    '''
+    run a query and yield the rows as they are streamed back a block
+    at a time, so the whole result is never held in memory.
+    the client is kept until the generator finishes and is discarded
+    if it is closed before all the rows have been read
+    '''
+    settings = {'max_block_size': block_size}
+    with POOL.connection(treemap_config.CLICK_HOST, database) as click:
+        for row in click.execute_iter(qry, settings=settings):
+            yield row
+
+
+def has_table(database, table):
+    '''
+    check if the database has the given table
+    '''
+    if (database, table) not in TABLES:
+        qry = '''
+            select count(*)
+            from system.tables
+            where database='{}'
+            and name='{}'
+        '''
+        qry = qry.format(escape(database), escape(table))
+        TABLES[(database, table)] = execute(database, qry)[0][0] > 0
+    return TABLES[(database, table)]
+
+
+def use_rollup(
+        database,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, regex):
+    '''
+    the rollup table is keyed by (ancestor, gid, uid, suffix) so it
+    can answer a query if there are no time, size or regex filters
+    '''
+    if not USE_ROLLUP:
+        return False
+    filters = (
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, regex)
+    if any(f is not None for f in filters):
+        return False
+    return has_table(database, 'rollup')
+
+
+def files_table(database, group, user, sample=None):
+    '''
+    choose which copy of the files data to query
+    files is ordered by (gid, uid, full_path) so can only use its primary
+    index to find a path if there is a group or user filter. without one
+    use files_by_path, which is ordered by full_path, so the path prefix
+    limits the range that is read. sampled queries read files_sample
+    '''
+    if sample is not None:
+        return 'files_sample'
+    if group is not None or user is not None:
+        return 'files'
+    if has_table(database, 'files_by_path'):
+        return 'files_by_path'
+    return 'files'
+
+
+def sampling(database, sample):
+    '''
+    the fraction of the files an approximate query reads, None to read
+    all of them. files_sample is ordered by (sample_key, full_path) so
+    the sample is a contiguous range of the table and the path limits
+    the range read within it. the fraction is rounded to a whole number
+    of buckets and can be at most what files_sample keeps. databases
+    created before the schema had files_sample are always read in full
+    '''
+    if sample is None or not has_table(database, 'files_sample'):
+        return None
+    buckets = min(max(int(round(sample * SAMPLE_BUCKETS)), 1), SAMPLE_KEPT)
+    return buckets / SAMPLE_BUCKETS
+
+
+def sample_clause(sample):
+    '''
+    the prewhere clause to put after files_sample to read the sample
+    '''
+    if sample is None:
+        return ''
+    return ' prewhere sample_key < {}'.format(
+        int(round(sample * SAMPLE_BUCKETS)))
+
+
+def squares_expr(sample):
+    '''
+    a sampled query also needs the sums of the squares
+    of the size and atime_cost to estimate its error
+    '''
+    if sample is None:
+        return ''
+    return ', sum(pow(toFloat64(blocks*512), 2)), sum(pow(atime_cost, 2))'
+
+
+def sums_expr(sample):
+    '''
+    the sums to select from the files table
+    '''
+    return 'sum(blocks*512), count(*), sum(atime_cost)' + squares_expr(sample)
+
+
+def estimate(sample, size, num_files, atime_cost, size_sq, atime_cost_sq):
+    '''
+    scale the sums over a sample up to the whole table and get the half
+    width of their confidence intervals. each file is in the sample
+    with probability sample so the variance of a scaled sum is
+    (1 - sample) / sample**2 times the sum of the squares in the sample
+    returns the sums and the errors as dicts
+    '''
+    factor = (1 - sample) / (sample * sample)
+    sums = {
+        'size': int(round(size / sample)),
+        'num_files': int(round(num_files / sample)),
+        'atime_cost': atime_cost / sample}
+    errors = {
+        'size': CONFIDENCE_Z * math.sqrt(factor * size_sq),
+        'num_files': CONFIDENCE_Z * math.sqrt(factor * num_files),
+        'atime_cost': CONFIDENCE_Z * math.sqrt(factor * atime_cost_sq)}
+    return sums, errors
+
+
+def combine_errors(errors):
+    '''
+    the error of a sum of estimates over disjoint sets of files
+    '''
+    return {
+        name: math.sqrt(sum(error[name] ** 2 for error in errors))
+        for name in ('size', 'num_files', 'atime_cost')}
+
+
+def load_generation(database):
+    '''
+    get an id for the data loaded in a database
+    it changes if the files table is recreated or rows are added
+    so cached results for an old load are not used
+    '''
     qry = '''
-        select name
-        from system.databases
-        where name like '{}_%'
-        order by name desc
-        limit 1
+        select
+            toUInt32(any(metadata_modification_time)),
+            (select sum(rows) from system.parts
+             where database = '{0}' and table = 'files' and active)
+        from system.tables
+        where database = '{0}'
+        and name = 'files'
+    '''
+    rows = execute(None, qry.format(escape(database)))
+    if not rows:
+        return None
+    return '{}-{}'.format(*rows[0])
+
+
+# decorator for caching query results in process and in memcached
+cached = treemap_cache.cached(load_generation)
+
+
+def log_request(name, arguments):
     '''
-    qry = qry.format(tag)
-    click = clickhouse_driver.Client(
-        treemap_config.CLICK_HOST,
-        compression=True)
-    return click.execute(qry)[0][0]
+    append a json line for a report request to the access log
+    failing to write the log should never stop a report
+    '''
+    record = {
+        'time': int(time.time()),
+        'function': name,
+        'args': arguments}
+    try:
+        with open(ACCESS_LOG, 'a') as log:
+            log.write(json.dumps(record) + '\n')
+    except OSError:
+        pass
 
 
-def get_click(database):
+def logged(func):
     '''
-    get a clickhouse client object for the
-    required database
+    decorator that logs each call of a report function
+    with its named arguments to the access log
     '''
-    return clickhouse_driver.Client(
-        treemap_config.CLICK_HOST,
-        database=database,
-        compression=True)
+    # the report functions only have positional parameters, reading
+    # their names from the code object avoids importing inspect. the
+    # names are those of the function under the cache decorator, whose
+    # wrapper only has database and *args
+    inner = func
+    while hasattr(inner, '__wrapped__'):
+        inner = inner.__wrapped__
+    code = inner.__code__
+    names = code.co_varnames[:code.co_argcount]
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if ACCESS_LOG is not None:
+            arguments = dict(zip(names, args))
+            arguments.update(kwargs)
+            log_request(func.__name__, arguments)
+        return func(*args, **kwargs)
+    return wrapper
 
 
 def filter_qry(
@@ -195,16 +395,15 @@ def filter_qry(
         suffix, regex):
     '''
     create the text to append to queries
-    based on the filters in args
-    **** THIS IS A SECURITY RISK CURRENTLY ****
-    need to figure out best way to do query parameters
-    for clickhouse
+    based on the filters in args. the strings are escaped and
+    the group and user must be known names or numbers, unknown
+    ones match nothing as they do with treemap_local
     '''
     qry = ''
     if group is not None:
-        qry += ' and gid={}'.format(get_gid(group))
+        qry += ' and gid={}'.format(numeric_id(get_gid(group)))
     if user is not None:
-        qry += ' and uid={}'.format(get_uid(user))
+        qry += ' and uid={}'.format(numeric_id(get_uid(user)))
     if modified_before is not None:
         qry += ' and mtime < {}'.format(modified_before)
     if modified_after is not None:
@@ -218,13 +417,25 @@ def filter_qry(
     if size_greater_than is not None:
         qry += ' and size > {}'.format(size_greater_than)
     if suffix is not None:
-        qry += " and suffix='{}'".format(suffix)
+        qry += " and suffix='{}'".format(escape(suffix))
     if regex is not None:
-        qry += " and match(full_path,'{}')".format(regex)
+        qry += " and match(full_path,'{}')".format(escape(regex))
     return qry
 
 
-@memorise(mc_servers=treemap_config.MC_SERVERS)
+def numeric_id(value):
+    '''
+    get_gid and get_uid return the name they were given if it
+    is not known, which can only match if it is a number. the
+    null id matches nothing
+    '''
+    try:
+        return int(value)
+    except ValueError:
+        return 'null'
+
+
+@cached
 def subdirs(database, path):
     '''
     get a list of directories immediately underneath the given path
@@ -238,15 +449,15 @@ def subdirs(database, path):
         from directories
         where full_path like '{}/%'
         and depth={}'''
-    qry = qry.format(path, depth+1)
-    rows = get_click(database).execute(qry)
+    qry = qry.format(escape(path), depth+1)
+    rows = execute(database, qry)
     result = list()
     for row in rows:
         result.append(row[0])
     return result
 
 
-@memorise(mc_servers=treemap_config.MC_SERVERS)
+@cached
 def subtree_sums(
         database, path, group, user,
         modified_before, modified_after, accessed_before, accessed_after,
@@ -256,23 +467,86 @@ def subtree_sums(
     for the given path and filters passed on via the
     args dictionary
     '''
+    if use_rollup(
+            database,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, regex):
+        qry = '''
+            select
+                sum(total_size) as tot_size,
+                sum(total_num) as tot_num,
+                sum(total_atime_cost) as tot_atime_cost
+            from {}
+            where ancestor = '{}'
+        '''
+        table = 'rollup'
+    else:
+        qry = '''
+            select
+                sum(blocks*512) as tot_size,
+                count(*) as tot_num,
+                sum(atime_cost) as tot_atime_cost
+            from {}
+            where full_path like '{}/%'
+        '''
+        table = files_table(database, group, user)
+    qry = qry.format(table, escape(path))
+    qry += filter_qry(
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    return execute(database, qry)[0]
+
+
+@cached
+def sampled_subtree_sums(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, sample):
+    '''
+    estimate the subtree sums from a sample of the files table
+    returns the sums and their errors
+    '''
     qry = '''
-        select
-            sum(blocks*512) as tot_size,
-            count(*) as tot_num,
-            sum(atime_cost) as tot_atime_cost
-        from files
+        select {}
+        from {}{}
         where full_path like '{}/%'
     '''
-    qry = qry.format(path)
+    qry = qry.format(
+        sums_expr(sample), files_table(database, group, user, sample),
+        sample_clause(sample), escape(path))
     qry += filter_qry(
         group, user,
         modified_before, modified_after, accessed_before, accessed_after,
         size_less_than, size_greater_than, suffix, regex)
-    return get_click(database).execute(qry)[0]
+    return estimate(sample, *execute(database, qry)[0])
+
+
+def subtree_estimate(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, sample):
+    '''
+    the subtree sums as a dict and their errors, from a sample of the
+    files if sample is set and the query can't use the rollup table.
+    the errors are None if the sums are exact
+    '''
+    filters = (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    if not use_rollup(
+            database,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, regex):
+        sample = sampling(database, sample)
+        if sample is not None:
+            return sampled_subtree_sums(database, path, *filters, sample)
+    size, num_files, atime_cost = subtree_sums(database, path, *filters)
+    return {'size': size, 'num_files': num_files, 'atime_cost': atime_cost}, None
 
 
-@memorise(mc_servers=treemap_config.MC_SERVERS)
+@cached
 def star_dot_star(
         database, path, group, user,
         modified_before, modified_after, accessed_before, accessed_after,
@@ -285,26 +559,171 @@ def star_dot_star(
             sum(blocks*512) as tot_size,
             count(*) as tot_num,
             sum(atime_cost) as tot_atime_cost
-        from files
-        where directory='{}'
+        from {}
+        where full_path like '{}/%'
+        and directory='{}'
     '''
-    qry = qry.format(path)
+    qry = qry.format(
+        files_table(database, group, user), escape(path), escape(path))
     qry += filter_qry(
         group, user,
         modified_before, modified_after,
         accessed_before, accessed_after,
         size_less_than, size_greater_than,
         suffix, regex)
-    return get_click(database).execute(qry)[0]
+    return execute(database, qry)[0]
 
 
-@memorise(mc_servers=treemap_config.MC_SERVERS)
-def get_subdir_data(
+@cached
+def subdir_sums(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex):
+    '''
+    get the sums for every child of the given path in a single
+    pass over the files table, grouping on the path component
+    at depth+1. files directly in the path are returned as *.*
+    '''
+    filters = filter_qry(
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    if use_rollup(
+            database,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, regex):
+        return rollup_subdir_sums(database, path, filters)
+    qry = '''
+        select
+            {} as name,
+            sum(blocks*512) as tot_size,
+            count(*) as tot_num,
+            sum(atime_cost) as tot_atime_cost
+        from {}
+        where full_path like '{}/%'
+    '''
+    qry = qry.format(
+        child_name_expr(path), files_table(database, group, user),
+        escape(path))
+    qry += filters
+    qry += '''
+        group by name
+        order by name
+    '''
+    return execute(database, qry)
+
+
+def rollup_subdir_sums(database, path, filters):
+    '''
+    get the sums for every child of the given path from the rollup
+    table. the *.* bucket is the total for the path less the
+    totals for its subdirectories
+    '''
+    qry = '''
+        select
+            ancestor,
+            sum(total_size) as tot_size,
+            sum(total_num) as tot_num,
+            sum(total_atime_cost) as tot_atime_cost
+        from rollup
+        where (ancestor = '{}' or (ancestor like '{}/%' and depth = {}))
+    '''
+    qry = qry.format(escape(path), escape(path), path_depth(path) + 1)
+    qry += filters
+    qry += '''
+        group by ancestor
+        order by ancestor
+    '''
+    star_size, star_num_files, star_atime_cost = 0, 0, 0
+    rows = []
+    for ancestor, size, num_files, atime_cost in execute(database, qry):
+        if ancestor == path:
+            star_size += size
+            star_num_files += num_files
+            star_atime_cost += atime_cost
+        else:
+            star_size -= size
+            star_num_files -= num_files
+            star_atime_cost -= atime_cost
+            rows.append((ancestor.rsplit('/', 1)[-1], size, num_files, atime_cost))
+    return [('*.*', star_size, star_num_files, star_atime_cost)] + rows
+
+
+def sampled_subdir_sums(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, sample):
+    '''
+    estimate the sums for every child of the given path from a sample
+    of the files table. returns the rows as subdir_sums does and the
+    errors for each child by name
+    '''
+    qry = '''
+        select {} as name, {}
+        from {}{}
+        where full_path like '{}/%'
+    '''
+    qry = qry.format(
+        child_name_expr(path), sums_expr(sample),
+        files_table(database, group, user, sample), sample_clause(sample),
+        escape(path))
+    qry += filter_qry(
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    qry += '''
+        group by name
+        order by name
+    '''
+    rows = []
+    errors = {}
+    for row in execute(database, qry):
+        sums, errors[row[0]] = estimate(sample, *row[1:])
+        rows.append(
+            (row[0], sums['size'], sums['num_files'], sums['atime_cost']))
+    return rows, errors
+
+
+def per_child_sums(
         database, path, group, user,
         modified_before, modified_after, accessed_before, accessed_after,
         size_less_than, size_greater_than, suffix, regex):
     '''
+    get the sums for every child of the given path with a *.*
+    query and one subtree_sums query per subdirectory
+    the queries are run concurrently, at most MAX_CONCURRENT_QUERIES
+    at a time, and the rows come back in subdirs order
+    '''
+    filters = (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    # imported here as it is slow to import and only used in this mode
+    from concurrent.futures import ThreadPoolExecutor
+
+    directories = subdirs(database, path)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUERIES) as executor:
+        star = executor.submit(star_dot_star, database, path, *filters)
+        sums = executor.map(
+            lambda directory: subtree_sums(database, directory, *filters),
+            directories)
+        rows = [('*.*',) + tuple(star.result())]
+        for directory, (size, num_files, atime_cost) in zip(directories, sums):
+            rows.append((directory.rsplit('/', 1)[-1], size, num_files, atime_cost))
+    return rows
+
+
+@logged
+@cached
+def get_subdir_data(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, sample=None):
+    '''
     get data for subdirs
+    if sample is set and the rollup table can't be used the sums are
+    estimated from that fraction of the files, the data then has the
+    sample and the errors of the sums
     '''
 
     # initialise the data
@@ -320,101 +739,207 @@ def get_subdir_data(
     tot_num_files = 0
     tot_atime_cost = 0
 
-    # get the *.* data if any
-    size, num_files, atime_cost = star_dot_star(
-        database, path, group, user,
-        modified_before, modified_after, accessed_before, accessed_after,
-        size_less_than, size_greater_than, suffix, regex)
-    if num_files > 0:
-        tot_size += size
-        tot_num_files += num_files
-        tot_atime_cost += atime_cost
-        children.append({
-            'name': '*.*',
-            'size': size,
-            'num_files': num_files,
-            'atime_cost': atime_cost})
-
-    # get the totals for each subdir
-    for directory in subdirs(database, path):
-        size, num_files, atime_cost = subtree_sums(
-            database, directory, group, user,
+    # get the totals for *.* and each subdir
+    errors = {}
+    if not use_rollup(
+            database,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, regex):
+        sample = sampling(database, sample)
+    else:
+        sample = None
+    if sample is not None:
+        rows, errors = sampled_subdir_sums(
+            database, path, group, user,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, suffix, regex, sample)
+    elif SUBDIR_MODE == 'per_child':
+        rows = per_child_sums(
+            database, path, group, user,
             modified_before, modified_after, accessed_before, accessed_after,
             size_less_than, size_greater_than, suffix, regex)
+    else:
+        rows = subdir_sums(
+            database, path, group, user,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, suffix, regex)
+    for name, size, num_files, atime_cost in rows:
         if num_files > 0:
             tot_size += size
             tot_num_files += num_files
             tot_atime_cost += atime_cost
             children.append({
-                'name': directory.rsplit('/', 1)[-1],
+                'name': name,
                 'size': size,
                 'num_files': num_files,
                 'atime_cost': atime_cost})
+            if name in errors:
+                children[-1]['errors'] = errors[name]
     data['size'] = tot_size
     data['num_files'] = tot_num_files
     data['atime_cost'] = tot_atime_cost
+    if sample is not None:
+        data['sample'] = sample
+        data['errors'] = combine_errors(
+            [child['errors'] for child in children])
+
+        # subdirectories with no files in the sample are kept and marked
+        # as unsampled, they can still hold files the sample missed
+        for subdir in subdirs(database, path):
+            name = subdir.rsplit('/', 1)[-1]
+            if name not in errors:
+                children.append({
+                    'name': name,
+                    'size': 0,
+                    'num_files': 0,
+                    'atime_cost': 0,
+                    'unsampled': True})
     return data
 
 
-@memorise(mc_servers=treemap_config.MC_SERVERS)
-def by_user(
-        database, path, group,
-        user, modified_before, modified_after, accessed_before, accessed_after,
-        size_less_than, size_greater_than, suffix, regex, order_by, limit):
+def report_qry(
+        database, path, column, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit,
+        sample=None):
     '''
-    get usage by user
+    generate the query for a usage report grouped on the given
+    column (uid, gid or suffix). uses the rollup table if the
+    filters allow it otherwise aggregates the files table, or
+    the given fraction of it
     '''
+    if use_rollup(
+            database,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, regex):
+        qry = '''
+            select
+                {},
+                sum(total_size) as size,
+                sum(total_num) as num_files,
+                sum(total_atime_cost) as atime_cost
+            from rollup
+            where ancestor = '{}'
+        '''
+        qry = qry.format(column, escape(path))
+    else:
+        qry = '''
+            select
+                {},
+                sum(blocks*512) as size,
+                count(*) as num_files,
+                sum(atime_cost) as atime_cost{}
+            from {}{}
+            where full_path like '{}/%'
+        '''
+        qry = qry.format(
+            column, squares_expr(sample),
+            files_table(database, group, user, sample),
+            sample_clause(sample), escape(path))
+    qry += filter_qry(
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    qry += '''
+        group by {}
+        order by {} desc
+        limit {}
+    '''.format(column, order_by, limit)
+    return qry
 
-    # get the total sums for this directory
-    size, num_files, atime_cost = subtree_sums(
+
+def report_rows(database, qry, sample):
+    '''
+    run a report query, scaling the sums up if it read a sample
+    returns (value, size, num_files, atime_cost, errors) rows
+    with errors None if the sums are exact
+    '''
+    rows = []
+    for row in execute(database, qry):
+        if sample is None:
+            rows.append(tuple(row) + (None,))
+        else:
+            sums, errors = estimate(sample, *row[1:])
+            rows.append((
+                row[0], sums['size'], sums['num_files'], sums['atime_cost'],
+                errors))
+    return rows
+
+
+def report_data(
         database, path, group, user,
         modified_before, modified_after, accessed_before, accessed_after,
-        size_less_than, size_greater_than, suffix, regex)
+        size_less_than, size_greater_than, suffix, regex, sample):
+    '''
+    the data for a by_user, by_group or by_suffix report before the
+    rows are added, with the total sums for the path. returns the data
+    and the sample the report can use, None if it has to be exact
+    '''
+    totals, errors = subtree_estimate(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, sample)
     data = {
         'database': database,
         'path': path,
-        'size': size,
-        'num_files': num_files,
-        'atime_cost': atime_cost,
+        'size': totals['size'],
+        'num_files': totals['num_files'],
+        'atime_cost': totals['atime_cost'],
         'children': []}
-    children = data['children']
+    if errors is None:
+        return data, None
+    sample = sampling(database, sample)
+    data['sample'] = sample
+    data['errors'] = errors
+    return data, sample
 
-    # prepare the query to get the by_user data
-    qry = '''
-        select
-            uid,
-            sum(blocks*512) as size,
-            count(*) as num_files,
-            sum(atime_cost) as atime_cost
-        from files
-        where full_path like '{}/%'
+
+def add_rows(data, rows, name):
     '''
-    qry = qry.format(path)
-    qry += filter_qry(
-        group, user,
-        modified_before, modified_after,
-        accessed_before, accessed_after,
-        size_less_than, size_greater_than,
-        suffix, regex)
-    qry += '''
-        group by uid
-        order by {} desc
-        limit {}
+    add the report rows to the data, name maps the grouped on
+    value to the name to show
     '''
-
-    # execute it and process the results
-    qry = qry.format(order_by, limit)
-    rows = get_click(database).execute(qry)
-    for row in rows:
-        children.append({
-            'name': get_username(row[0]),
-            'size': row[1],
-            'num_files': row[2],
-            'atime_cost': row[3]})
+    for value, size, num_files, atime_cost, errors in rows:
+        child = {
+            'name': name(value),
+            'size': size,
+            'num_files': num_files,
+            'atime_cost': atime_cost}
+        if errors is not None:
+            child['errors'] = errors
+        data['children'].append(child)
     return data
 
 
-@memorise(mc_servers=treemap_config.MC_SERVERS)
+@logged
+@cached
+def by_user(
+        database, path, group,
+        user, modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit,
+        sample=None):
+    '''
+    get usage by user
+    if sample is set and the rollup table can't be used the sums are
+    estimated from that fraction of the files
+    '''
+    data, sample = report_data(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, sample)
+    rows = report_rows(database, report_qry(
+        database, path, treemap_names.name_expr('uid'), group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit,
+        sample), sample)
+    # the names come from the query if the name dictionaries are used
+    if treemap_names.NAMES_DICTIONARIES:
+        return add_rows(data, rows, str)
+    return add_rows(data, rows, get_username)
+
+
+@logged
+@cached
 def by_group(
         database, path,
         group, user,
@@ -422,114 +947,467 @@ def by_group(
         accessed_before, accessed_after,
         size_less_than, size_greater_than,
         suffix, regex,
-        order_by, limit):
+        order_by, limit,
+        sample=None):
     '''
     get usage by group
+    if sample is set and the rollup table can't be used the sums are
+    estimated from that fraction of the files
     '''
+    data, sample = report_data(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, sample)
+    rows = report_rows(database, report_qry(
+        database, path, treemap_names.name_expr('gid'), group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit,
+        sample), sample)
+    # the names come from the query if the name dictionaries are used
+    if treemap_names.NAMES_DICTIONARIES:
+        return add_rows(data, rows, str)
+    return add_rows(data, rows, lambda gid: str(get_group(gid)))
 
-    # get the total sums for this directory
-    size, num_files, atime_cost = subtree_sums(
-        database, path,
+
+@logged
+@cached
+def by_suffix(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit,
+        sample=None):
+    '''
+    get usage by suffix
+    if sample is set and the rollup table can't be used the sums are
+    estimated from that fraction of the files
+    '''
+    data, sample = report_data(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, sample)
+    rows = report_rows(database, report_qry(
+        database, path, 'suffix', group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit,
+        sample), sample)
+    return add_rows(data, rows, str)
+
+
+# the dimensions a crosstab can have on its rows and columns
+CROSSTAB_DIMENSIONS = ('user', 'group', 'suffix', 'subdir')
+
+
+def dimension_expr(path, dimension):
+    '''
+    clickhouse expression for a crosstab dimension
+    '''
+    if dimension == 'user':
+        return treemap_names.name_expr('uid')
+    if dimension == 'group':
+        return treemap_names.name_expr('gid')
+    if dimension == 'subdir':
+        return child_name_expr(path)
+    return 'suffix'
+
+
+def dimension_name(dimension, value):
+    '''
+    the name to show for a value of a crosstab dimension
+    '''
+    if treemap_names.NAMES_DICTIONARIES:
+        return value
+    if dimension == 'user':
+        return get_username(value)
+    if dimension == 'group':
+        return str(get_group(value))
+    return value
+
+
+@logged
+@cached
+def crosstab(
+        database, path, rows, columns, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex,
+        order_by, limit, num_columns):
+    '''
+    get usage broken down by two of user, group, suffix and subdir,
+    with the totals for each row and column, in one aggregation.
+    group by with cube adds the marginal rows with the rolled up
+    dimension set to its default value, the dimensions are made
+    nullable so that is null and can't be mistaken for uid 0 or an
+    empty suffix. the rows and columns with the largest order_by
+    totals are returned, the totals are over all of them
+    '''
+    if 'subdir' not in (rows, columns) and use_rollup(
+            database,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, regex):
+        qry = '''
+            select
+                toNullable({}) as row_key,
+                toNullable({}) as column_key,
+                sum(total_size) as size,
+                sum(total_num) as num_files,
+                sum(total_atime_cost) as atime_cost
+            from rollup
+            where ancestor = '{}'
+        '''
+        qry = qry.format(
+            dimension_expr(path, rows), dimension_expr(path, columns),
+            escape(path))
+    else:
+        qry = '''
+            select
+                toNullable({}) as row_key,
+                toNullable({}) as column_key,
+                sum(blocks*512) as size,
+                count(*) as num_files,
+                sum(atime_cost) as atime_cost
+            from {}
+            where full_path like '{}/%'
+        '''
+        qry = qry.format(
+            dimension_expr(path, rows), dimension_expr(path, columns),
+            files_table(database, group, user), escape(path))
+    qry += filter_qry(
         group, user,
-        modified_before, modified_after,
-        accessed_before, accessed_after,
-        size_less_than, size_greater_than,
-        suffix, regex)
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    qry += '''
+        group by row_key, column_key with cube
+    '''
+
+    # split the cells from the marginal totals
+    total = {'size': 0, 'num_files': 0, 'atime_cost': 0}
+    row_totals = {}
+    column_totals = {}
+    cells = {}
+    for row, column, size, num_files, atime_cost in execute(database, qry):
+        sums = {'size': size, 'num_files': num_files, 'atime_cost': atime_cost}
+        if row is None and column is None:
+            total = sums
+        elif column is None:
+            row_totals[row] = sums
+        elif row is None:
+            column_totals[column] = sums
+        else:
+            cells[(row, column)] = sums
+
+    top_rows = sorted(
+        row_totals, key=lambda k: row_totals[k][order_by], reverse=True)
+    top_columns = sorted(
+        column_totals, key=lambda k: column_totals[k][order_by], reverse=True)
+    top_columns = top_columns[:num_columns]
+    data = {
+        'database': database,
+        'path': path,
+        'size': total['size'],
+        'num_files': total['num_files'],
+        'atime_cost': total['atime_cost'],
+        'num_rows': len(row_totals),
+        'num_columns': len(column_totals),
+        'columns': [
+            dict(column_totals[column], name=dimension_name(columns, column))
+            for column in top_columns],
+        'children': [
+            dict(
+                row_totals[row], name=dimension_name(rows, row),
+                cells=[cells.get((row, column)) for column in top_columns])
+            for row in top_rows[:limit]]}
+    return data
+
+
+# what top_files can rank by and the expression for it in the files table
+TOP_FILES_ORDER = {'size': 'blocks*512', 'atime_cost': 'atime_cost'}
+
+
+@logged
+@cached
+def top_files(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit,
+        after):
+    '''
+    get the files under the path with the largest size or atime_cost
+    clickhouse does the ranking, an order by with a limit only keeps
+    the top rows of each block rather than sorting every file.
+    ties are broken on full_path so the pages can be walked with a
+    keyset: after is the (value, full_path) of the last file of the
+    previous page and is returned as next if there may be more
+    '''
+    size, num_files, atime_cost = subtree_sums(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
     data = {
         'database': database,
         'path': path,
         'size': size,
         'num_files': num_files,
         'atime_cost': atime_cost,
-        'children': []}
+        'children': [],
+        'next': None}
     children = data['children']
 
-    # prepare the query to get the by_group data
+    column = TOP_FILES_ORDER[order_by]
     qry = '''
-        select
-            gid,
-            sum(blocks*512) as size,
-            count(*) as num_files,
-            sum(atime_cost) as atime_cost
-        from files
+        select full_path, blocks*512, atime_cost, uid, atime, mtime
+        from {}
         where full_path like '{}/%'
     '''
-    qry = qry.format(path)
+    qry = qry.format(files_table(database, group, user), escape(path))
     qry += filter_qry(
         group, user,
         modified_before, modified_after, accessed_before, accessed_after,
         size_less_than, size_greater_than, suffix, regex)
+    if after is not None:
+        value, last_path = after
+        qry += " and ({0} < {1} or ({0} = {1} and full_path > '{2}'))".format(
+            column, repr(value), escape(last_path))
     qry += '''
-        group by gid
-        order by {} desc
+        order by {} desc, full_path
         limit {}
-    '''
-    qry = qry.format(order_by, limit)
-
-    # execute it and process the results
-    rows = get_click(database).execute(qry)
-    for row in rows:
+    '''.format(column, limit)
+    rows = execute(database, qry)
+    for full_path, size, atime_cost, uid, atime, mtime in rows:
         children.append({
-            'name': str(get_group(row[0])),
-            'size': row[1],
-            'num_files': row[2],
-            'atime_cost': row[3]})
+            'name': full_path[len(path) + 1:],
+            'full_path': full_path,
+            'size': size,
+            'num_files': 1,
+            'atime_cost': atime_cost,
+            'user': get_username(uid),
+            'atime': atime,
+            'mtime': mtime})
+    if len(rows) == limit:
+        last = children[-1]
+        data['next'] = (last[order_by], last['full_path'])
     return data
 
 
-@memorise(mc_servers=treemap_config.MC_SERVERS)
-def by_suffix(
+@cached
+def age_histograms(
         database, path, group, user,
         modified_before, modified_after, accessed_before, accessed_after,
-        size_less_than, size_greater_than, suffix, regex, order_by, limit):
+        size_less_than, size_greater_than, suffix, regex, num_days):
     '''
-    get usage by suffix
+    size and number of files for each number of days since the
+    files were last accessed and last modified, both from one scan
+    returns rows of (kind, days, size, num_files) where kind is
+    0 for atime_days and 1 for mtime_days
     '''
-    # get the total sums for this directory
-    size, num_files, atime_cost = subtree_sums(
-        database, path,
+    qry = '''
+        select
+            kind,
+            days,
+            sum(blocks*512) as size,
+            count(*) as num_files
+        from {}
+        array join
+            [0, 1] as kind,
+            [atime_days, mtime_days] as days
+        where full_path like '{}/%'
+        and days >= 0
+        and days < {}
+    '''
+    qry = qry.format(
+        files_table(database, group, user), escape(path), num_days)
+    qry += filter_qry(
         group, user,
-        modified_before, modified_after,
-        accessed_before, accessed_after,
-        size_less_than, size_greater_than,
-        suffix, regex)
-    data = {
-        'database': database,
-        'path': path,
-        'size': size,
-        'num_files': num_files,
-        'atime_cost': atime_cost,
-        'children': []}
-    children = data['children']
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    qry += '''
+        group by kind, days
+    '''
+    return execute(database, qry)
 
-    # prepare the query to get the by_suffix data
-    qry = '''
-       select
-           suffix,
-           sum(blocks*512) as size,
-           count(*) as num_files,
-           sum(atime_cost) as atime_cost
-       from files
-       where full_path like '{}/%'
-    '''
-    qry = qry.format(path)
+
+# the sums returned for each name by the diff queries
+DIFF_SUMS = ('size', 'num_files', 'atime_cost')
+
+
+def diff_side_qry(
+        database, snap, path, column, rollup, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex):
+    '''
+    query for one of the databases in a diff. the tables are
+    qualified with the database so both sides can go in one query.
+    column is uid, gid, suffix or subdir
+    with the rollup table the *.* subdir row holds the total for the path
+    '''
+    if rollup:
+        qry = '''
+            select
+                {} as snap,
+                {} as name,
+                sum(total_size) as tot_size,
+                sum(total_num) as tot_num,
+                sum(total_atime_cost) as tot_atime_cost
+            from {}.rollup
+        '''
+        if column == 'subdir':
+            name = "if(ancestor = '{}', '*.*', splitByChar('/', ancestor)[{}])"
+            name = name.format(escape(path), path_depth(path) + 2)
+            where = '''
+            where (ancestor = '{0}' or (ancestor like '{0}/%' and depth = {1}))
+            '''.format(escape(path), path_depth(path) + 1)
+        else:
+            name = column
+            where = '''
+            where ancestor = '{}'
+            '''.format(escape(path))
+        qry = qry.format(snap, name, database) + where
+    else:
+        qry = '''
+            select
+                {} as snap,
+                {} as name,
+                sum(blocks*512) as tot_size,
+                count(*) as tot_num,
+                sum(atime_cost) as tot_atime_cost
+            from {}.{}
+            where full_path like '{}/%'
+        '''
+        name = child_name_expr(path) if column == 'subdir' else column
+        qry = qry.format(
+            snap, name, database, files_table(database, group, user),
+            escape(path))
     qry += filter_qry(
         group, user,
         modified_before, modified_after, accessed_before, accessed_after,
         size_less_than, size_greater_than, suffix, regex)
     qry += '''
-       group by suffix
-       order by {} desc
-       limit {}
+            group by name
     '''
-    qry = qry.format(order_by, limit)
+    return qry
+
 
-    # excecute it and process the results
-    rows = get_click(database).execute(qry)
+@cached
+def diff_sums(
+        databases, path, column, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit):
+    '''
+    get the sums in the old and new database for each name in one
+    aggregation over both databases, largest change first.
+    returns the totals for the path as (old size, old num_files,
+    old atime_cost, new size, new num_files, new atime_cost) and rows
+    of the name followed by the same sums
+    '''
+    filters = (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+
+    # both sides have to agree on using the rollup table
+    # as it changes what the *.* subdir row holds
+    rollup = all(
+        use_rollup(
+            database,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, regex)
+        for database in databases)
+    sides = [
+        diff_side_qry(database, snap, path, column, rollup, *filters)
+        for snap, database in enumerate(databases)]
+    sums = '''
+            sumIf(tot_size, snap = 0) as old_size,
+            sumIf(tot_num, snap = 0) as old_num,
+            sumIf(tot_atime_cost, snap = 0) as old_atime_cost,
+            sumIf(tot_size, snap = 1) as new_size,
+            sumIf(tot_num, snap = 1) as new_num,
+            sumIf(tot_atime_cost, snap = 1) as new_atime_cost
+    '''
+    if column == 'subdir':
+        qry = '''
+            select name, {}
+            from ({}
+                union all
+                {})
+            group by name
+            order by name
+        '''
+        qry = qry.format(sums, *sides)
+        rows = [list(row) for row in execute(databases[1], qry)]
+
+        # turn the rollup path totals into the *.* bucket
+        star = next((row for row in rows if row[0] == '*.*'), None)
+        if rollup and star is not None:
+            for row in rows:
+                if row is not star:
+                    for i in range(1, 7):
+                        star[i] -= row[i]
+
+        # every file under the path is in one of the subdirs
+        totals = tuple(sum(row[i] for row in rows) for i in range(1, 7))
+        return totals, [tuple(row) for row in rows]
+
+    # each row is also counted in a total row, which sorts first,
+    # so the totals for the path come from the same aggregation
+    qry = '''
+        select
+            is_total,
+            if(is_total = 1, defaultValueOfArgumentType(name), name) as key,
+            {}
+        from ({}
+            union all
+            {})
+        array join [0, 1] as is_total
+        group by is_total, key
+        order by is_total desc, abs(new_{} - old_{}) desc
+        limit {}
+    '''
+    column_name = {
+        'size': 'size', 'num_files': 'num', 'atime_cost': 'atime_cost'}[order_by]
+    qry = qry.format(sums, *sides, column_name, column_name, limit + 1)
+    rows = execute(databases[1], qry)
+    if not rows:
+        return (0,) * 6, []
+    return tuple(rows[0][2:]), [row[1:] for row in rows[1:]]
+
+
+def diff_report(
+        databases, path, column, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit):
+    '''
+    get the differences between two databases for subdir, uid,
+    gid or suffix. databases is (old database, new database)
+    each child has the new sums, the old sums as old_<sum>
+    and the change as <sum>_delta
+    '''
+    databases = tuple(databases)
+    filters = (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    data = {
+        'database': '{} -> {}'.format(*databases),
+        'databases': databases,
+        'path': path,
+        'children': []}
+    totals, rows = diff_sums(
+        databases, path, column, *filters, order_by, limit)
+    for i, name in enumerate(DIFF_SUMS):
+        data['old_' + name] = totals[i]
+        data[name] = totals[3 + i]
+        data[name + '_delta'] = totals[3 + i] - totals[i]
     for row in rows:
-        children.append({
-            'name': row[0],
-            'size': row[1],
-            'num_files': row[2],
-            'atime_cost': row[3]})
+        if row[2] == 0 and row[5] == 0:
+            continue
+        if column == 'uid':
+            name = get_username(row[0])
+        elif column == 'gid':
+            name = str(get_group(row[0]))
+        else:
+            name = row[0]
+        child = {'name': name}
+        for i, sum_name in enumerate(DIFF_SUMS):
+            child['old_' + sum_name] = row[1 + i]
+            child[sum_name] = row[4 + i]
+            child[sum_name + '_delta'] = row[4 + i] - row[1 + i]
+        data['children'].append(child)
     return data
@@ -0,0 +1,193 @@
+'''
+json api for the treemap reports
+serves the subdir, by_user, by_group and by_suffix reports and the
+database catalog over http. the reports take the same path and filters
+as treemap_cmd as query parameters, e.g.
+
+    /api/databases?tag=lustre
+    /api/<database>/subdirs?path=/lustre/scratch&user=bob
+    /api/<database>/by_user?path=/lustre/scratch&order_by=num_files&limit=50
+
+one process serves every user from the same connection pool and cache,
+so concurrent requests for the same report share a single query and
+later ones come from the cache. run it threaded (python treemap_api.py
+or a wsgi server using treemap_api:app) so the threads share the pool
+and in-process cache, memcached is shared between processes.
+
+snapshots don't change once loaded so report responses get a strong
+etag made from the database generation and the arguments
+'''
+
+import sys
+import gzip
+import json
+import hashlib
+
+from flask import Flask, Response, abort, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+import treemap
+import treemap_args
+import treemap_cache
+import treemap_catalog
+import treemap_config
+
+# where python treemap_api.py listens
+API_HOST = getattr(treemap_config, 'API_HOST', '127.0.0.1')
+API_PORT = getattr(treemap_config, 'API_PORT', 5000)
+
+# seconds browsers and proxies can cache report responses for and the
+# database list, which changes when a load finishes
+API_MAX_AGE = getattr(treemap_config, 'API_MAX_AGE', 24 * 3600)
+API_LIST_MAX_AGE = getattr(treemap_config, 'API_LIST_MAX_AGE', 60)
+
+# gzip compression level and the largest limit a report can ask for
+API_GZIP_LEVEL = getattr(treemap_config, 'API_GZIP_LEVEL', 6)
+API_MAX_LIMIT = getattr(treemap_config, 'API_MAX_LIMIT', 10000)
+
+# what the by_* reports can be ordered by
+ORDER_BY = ('size', 'num_files', 'atime_cost')
+
+# the report for each endpoint and whether it takes order_by and limit
+REPORTS = {
+    'subdirs': (treemap.get_subdir_data, False),
+    'by_user': (treemap.by_user, True),
+    'by_group': (treemap.by_group, True),
+    'by_suffix': (treemap.by_suffix, True)}
+
+app = Flask(__name__)
+
+
+@app.errorhandler(HTTPException)
+def http_error(err):
+    '''
+    errors are returned as json too
+    '''
+    response = jsonify(error=err.description)
+    response.status_code = err.code
+    return response
+
+
+def get_filters():
+    '''
+    the path and filters from the query parameters
+    in the order treemap's report functions take them
+    '''
+    params = request.args
+    path = params.get('path', '/').rstrip('/')
+    filters = []
+    for name in treemap_args.FILTERS:
+        value = params.get(name)
+        if value is not None:
+            if name.startswith(('modified_', 'accessed_')):
+                try:
+                    value = treemap_args.end_of_day(
+                        treemap_args.parse_date(value).timestamp())
+                except ValueError:
+                    abort(400, 'bad date for {}: {}'.format(name, value))
+            elif name.startswith('size_'):
+                value = get_int(name, value)
+        filters.append(value)
+    return [path] + filters
+
+
+def get_int(name, value):
+    '''
+    an integer query parameter
+    '''
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, '{} should be an integer'.format(name))
+
+
+def get_order():
+    '''
+    the order_by and limit query parameters for the by_* reports
+    '''
+    order_by = request.args.get('order_by', 'size')
+    if order_by not in ORDER_BY:
+        abort(400, 'order_by should be one of {}'.format(', '.join(ORDER_BY)))
+    limit = get_int('limit', request.args.get('limit', '20'))
+    if not 0 < limit <= API_MAX_LIMIT:
+        abort(400, 'limit should be between 1 and {}'.format(API_MAX_LIMIT))
+    return [order_by, limit]
+
+
+def accepts_gzip():
+    return 'gzip' in request.accept_encodings
+
+
+def respond(get_body, etag, max_age):
+    '''
+    make the response for a json body, gzipped if the client takes it.
+    the compressed and uncompressed bodies are different
+    representations so get different etags. get_body is only
+    called if the client doesn't already have this etag
+    '''
+    if accepts_gzip():
+        etag += '-gz'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = get_body()
+        if accepts_gzip():
+            body = gzip.compress(body, API_GZIP_LEVEL)
+        response = Response(body, mimetype='application/json')
+        if accepts_gzip():
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+def encode(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+@app.route('/api/databases')
+def databases():
+    '''
+    the catalog entries for a tag, newest first
+    '''
+    body = encode(treemap_catalog.databases(request.args.get('tag')))
+    etag = hashlib.md5(body).hexdigest()
+    return respond(lambda: body, etag, API_LIST_MAX_AGE)
+
+
+@app.route('/api/<database>/<report>')
+def get_report(database, report):
+    '''
+    run one of the reports for a database
+    '''
+    if report not in REPORTS:
+        abort(404, 'no such report {}'.format(report))
+    if treemap_catalog.find(database) is None:
+        abort(404, 'no such database {}'.format(database))
+    func, ordered = REPORTS[report]
+    args = get_filters()
+    if ordered:
+        args += get_order()
+
+    # the etag is the key the report is cached under so it only
+    # changes if the database is reloaded, a client that has it
+    # gets a 304 without the report being looked up
+    generation = treemap_cache.get_generation(treemap.load_generation, database)
+    key = treemap_cache.make_key(func, generation, (database,) + tuple(args), {})
+    etag = key.split(':', 1)[1]
+    return respond(
+        lambda: encode(func(database, *args)), etag, API_MAX_AGE)
+
+
+def main():
+    '''
+    main entry point
+    '''
+    app.run(host=API_HOST, port=API_PORT, threaded=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+'''
+commandline arguments shared by the treemap reports
+the path and the filters that end up in treemap.filter_qry
+'''
+
+import re
+import calendar
+from datetime import datetime, timedelta
+
+# the filter arguments in the order treemap's report functions take them
+FILTERS = (
+    'group', 'user',
+    'modified_before', 'modified_after', 'accessed_before', 'accessed_after',
+    'size_less_than', 'size_greater_than', 'suffix', 'regex')
+
+# the filters that are dates
+DATE_FILTERS = (
+    'modified_before', 'modified_after', 'accessed_before', 'accessed_after')
+
+
+def add_filter_arguments(parser):
+    '''
+    add the path and filter arguments to an argparse parser
+    '''
+    parser.add_argument(
+        '-p', '--path',
+        help='directory we want to report on')
+    parser.set_defaults(path='/')
+    parser.add_argument(
+        '-g', '--group',
+        help='group to filter on')
+    parser.add_argument(
+        '-u', '--user',
+        help='user to filter on')
+    parser.add_argument(
+        '-m', '--modified_before',
+        help='select rows where the last modified time is'
+             ' earlier than this timestamp (uses dateparser syntax)')
+    parser.add_argument(
+        '-M', '--modified_after',
+        help='select rows where the last modified time is'
+             ' later than this timestamp (dateparser syntax)')
+    parser.add_argument(
+        '-a', '--accessed_before',
+        help='select rows where the last accessed time is'
+             ' earlier than this timestamp (dateparser syntax)')
+    parser.add_argument(
+        '-A', '--accessed_after',
+        help='select rows where the last accessed time is'
+             ' later than this timestamp (dateparser syntax)')
+    parser.add_argument(
+        '-s', '--size_less_than',
+        help='select rows where the file size is less than'
+             ' the given size',
+        type=int)
+    parser.add_argument(
+        '-S', '--size_greater_than',
+        help='select rows where the file size is greater than the given size',
+        type=int)
+    parser.add_argument(
+        '--suffix',
+        help='select rows with the given file suffix (case sensitive)')
+    parser.add_argument(
+        '--regex',
+        help='''
+            select rows where the full path matches the given
+            regular expression.  must do double-escape on backslash.
+            only use with other filters otherwise the query will be
+            very slow''')
+
+
+def process_filter_arguments(args):
+    '''
+    strip the trailing slash from the path and turn the
+    date arguments into timestamps
+    '''
+    args.path = args.path.rstrip('/')
+    for name in DATE_FILTERS:
+        value = getattr(args, name)
+        if value is not None:
+            setattr(args, name, end_of_day(parse_date(value).timestamp()))
+    return args
+
+
+# dates like 90 days ago or 2 weeks ago
+RELATIVE = re.compile(
+    r'^\s*(\d+)\s*(second|minute|hour|day|week|month|year)s?\s+ago\s*$',
+    re.IGNORECASE)
+
+# seconds in each unit with a fixed length
+SECONDS = {
+    'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 7 * 86400}
+
+
+def months_ago(now, months):
+    '''
+    the same day of the month the given number of months before now
+    the day is clamped to the end of shorter months
+    '''
+    month = now.year * 12 + now.month - 1 - months
+    year, month = divmod(month, 12)
+    day = min(now.day, calendar.monthrange(year, month + 1)[1])
+    return now.replace(year=year, month=month + 1, day=day)
+
+
+def parse_date(text):
+    '''
+    parse a date argument. iso dates, epoch seconds (@1556638658),
+    today, yesterday and 'N units ago' are handled here and
+    anything else is passed on to dateparser, which is slow to import
+    '''
+    text = text.strip()
+    lower = text.lower()
+    now = datetime.now()
+    if lower in ('now', 'today'):
+        return now
+    if lower == 'yesterday':
+        return now - timedelta(days=1)
+    if re.match(r'^@\d+$', text):
+        return datetime.fromtimestamp(int(text[1:]))
+    match = RELATIVE.match(text)
+    if match:
+        num = int(match.group(1))
+        unit = match.group(2).lower()
+        if unit == 'month':
+            return months_ago(now, num)
+        if unit == 'year':
+            return months_ago(now, 12 * num)
+        return now - timedelta(seconds=num * SECONDS[unit])
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+
+    import dateparser
+    date = dateparser.parse(text)
+    if date is None:
+        raise ValueError('could not understand the date {}'.format(text))
+    return date
+
+
+def filters(args):
+    '''
+    the filter values from args in the order treemap takes them
+    '''
+    return [getattr(args, name) for name in FILTERS]
+
+
+def end_of_day(epoch):
+    '''
+    returns the timestamp for the end of the day
+    for the passed in timestamp
+    '''
+    epoch_dt = datetime.fromtimestamp(epoch)
+    start_dt = epoch_dt.date()
+    return datetime(
+        start_dt.year, start_dt.month, start_dt.day, 23, 59, 59).timestamp()
@@ -0,0 +1,280 @@
+'''
+run a batch of treemap reports from a toml file in one process
+e.g.
+
+    [defaults]
+    tag = 'lustre'
+    output_dir = 'reports'
+    accessed_before = '90 days ago'
+
+    [[report]]
+    name = 'scratch_users'
+    report = 'by_user'
+    path = '/lustre/scratch'
+
+    [[report]]
+    name = 'scratch_users_by_suffix'
+    report = 'crosstab'
+    crosstab = 'user,suffix'
+    path = '/lustre/scratch'
+    format = 'json'
+
+each report takes the treemap_cmd options of the same name: report is
+one of subdirs, by_user, by_group, by_suffix, top_files or crosstab and
+the filters, order_by, limit, columns, name_width, database and tag can
+be set per report or in [defaults]. the output goes to <name>.txt, as
+treemap_cmd would print it, or <name>.json in output_dir.
+
+the reports are planned together. identical reports are only run once
+and the subtree_sums that several reports start with are run first, once
+each, so the reports find them in the cache. the queries run concurrently
+over the shared connection pool
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import toml
+
+import treemap
+import treemap_args
+import treemap_cache
+import treemap_cmd
+
+# the treemap function for each report and the column name in its table
+REPORTS = {
+    'subdirs': ('get_subdir_data', 'subdir'),
+    'by_user': ('by_user', 'user'),
+    'by_group': ('by_group', 'group'),
+    'by_suffix': ('by_suffix', 'suffix'),
+    'top_files': ('top_files', 'file'),
+    'crosstab': ('crosstab', None)}
+
+# the reports that start with the subtree_sums for their path and filters
+SUBTREE_REPORTS = ('by_user', 'by_group', 'by_suffix', 'top_files')
+
+# settings a report gets if neither it nor [defaults] has them
+DEFAULTS = {
+    'report': 'subdirs',
+    'path': '/',
+    'order_by': 'size',
+    'limit': 20,
+    'columns': 6,
+    'name_width': 21,
+    'format': 'table',
+    'output_dir': '.'}
+
+FORMATS = ('table', 'json')
+
+
+def get_args():
+    '''
+    parse commandline arguments for the batch runner
+    '''
+    parser = argparse.ArgumentParser(description='''
+        run the treemap reports listed in a toml file''')
+    parser.add_argument(
+        'batch',
+        help='toml file listing the reports')
+    parser.add_argument(
+        '-j', '--parallel', type=int,
+        help='number of queries to run at the same time')
+    parser.set_defaults(parallel=treemap.MAX_CONCURRENT_QUERIES)
+    parser.add_argument(
+        '-n', '--dry_run',
+        help='print the plan without running it',
+        action='store_true')
+    parser.set_defaults(dry_run=False)
+    return parser.parse_args()
+
+
+def load_reports(batch_file):
+    '''
+    read the reports from the batch file with the defaults filled in
+    '''
+    batch = toml.load(batch_file)
+    defaults = dict(DEFAULTS, **batch.get('defaults', {}))
+    reports = []
+    for num, spec in enumerate(batch.get('report', [])):
+        report = dict(defaults, **spec)
+        report.setdefault('name', 'report_{}'.format(num))
+        if report['report'] not in REPORTS:
+            raise ValueError('{}: unknown report {}'.format(
+                report['name'], report['report']))
+        if report['format'] not in FORMATS:
+            raise ValueError('{}: format should be one of {}'.format(
+                report['name'], ', '.join(FORMATS)))
+        reports.append(report)
+    return reports
+
+
+def get_filters(report):
+    '''
+    the path and filters of a report in the order treemap takes them
+    '''
+    filters = [report['path'].rstrip('/')]
+    for name in treemap_args.FILTERS:
+        value = report.get(name)
+        if value is not None and name in treemap_args.DATE_FILTERS:
+            value = treemap_args.end_of_day(
+                treemap_args.parse_date(str(value)).timestamp())
+        filters.append(value)
+    return filters
+
+
+def get_call(report, databases):
+    '''
+    the treemap function and arguments that make a report
+    databases maps tags to their latest database so each
+    tag is only looked up once
+    '''
+    database = report.get('database')
+    if database is None:
+        tag = report.get('tag', treemap.default_tag())
+        if tag not in databases:
+            databases[tag] = treemap.get_database(tag)
+        database = databases[tag]
+    function, _ = REPORTS[report['report']]
+    filters = get_filters(report)
+    if report['report'] == 'subdirs':
+        args = [database] + filters
+    elif report['report'] == 'crosstab':
+        rows, columns = report['crosstab'].split(',')
+        args = [database, filters[0], rows, columns] + filters[1:] + [
+            report['order_by'], report['limit'], report['columns']]
+    elif report['report'] == 'top_files':
+        args = [database] + filters + [
+            report['order_by'], report['limit'], None]
+    else:
+        args = [database] + filters + [report['order_by'], report['limit']]
+    return function, tuple(args)
+
+
+def plan(reports):
+    '''
+    work out the distinct queries for the reports
+    returns the subtree_sums calls the reports share, the distinct
+    report calls and the call for each report
+    '''
+    databases = {}
+    calls = [get_call(report, databases) for report in reports]
+    shared = []
+    for report, (function, args) in zip(reports, calls):
+        if report['report'] in SUBTREE_REPORTS:
+            # database, path and the filters
+            call = ('subtree_sums', args[:12])
+            if call not in shared:
+                shared.append(call)
+    distinct = []
+    for call in calls:
+        if call not in distinct:
+            distinct.append(call)
+    return shared, distinct, calls
+
+
+def run(call):
+    '''
+    run a treemap function
+    '''
+    function, args = call
+    return getattr(treemap, function)(*args)
+
+
+def run_report(call):
+    '''
+    run a report underneath the access log decorator
+    so the batch doesn't add to the log
+    '''
+    function, args = call
+    return getattr(treemap, function).__wrapped__(*args)
+
+
+def write_output(report, data):
+    '''
+    write a report to its file in the output directory
+    '''
+    os.makedirs(report['output_dir'], exist_ok=True)
+    extension = 'json' if report['format'] == 'json' else 'txt'
+    output = os.path.join(
+        report['output_dir'], '{}.{}'.format(report['name'], extension))
+    with open(output, 'w') as out:
+        if report['format'] == 'json':
+            json.dump(data, out, indent=2)
+            out.write('\n')
+            return output
+        with contextlib.redirect_stdout(out):
+            name = report['report']
+            if name == 'top_files':
+                treemap_cmd.print_files_table(
+                    data, report['order_by'], report['name_width'],
+                    report['limit'])
+            elif name == 'crosstab':
+                rows, columns = report['crosstab'].split(',')
+                treemap_cmd.print_crosstab(
+                    data, rows, columns, report['order_by'],
+                    report['name_width'])
+            else:
+                treemap_cmd.print_table(
+                    data, REPORTS[name][1], report['order_by'],
+                    report['name_width'])
+    return output
+
+
+def main():
+    '''
+    main entry point
+    '''
+    start = time.time()
+    args = get_args()
+    reports = load_reports(args.batch)
+    shared, distinct, calls = plan(reports)
+    print('{} reports, {} distinct, {} shared subtree sums'.format(
+        len(reports), len(distinct), len(shared)))
+    if args.dry_run:
+        for function, call_args in shared + distinct:
+            print('{} {}'.format(function, call_args))
+        return 0
+    if not treemap_cache.ENABLED:
+        print('the cache is disabled so shared queries will be run again')
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+
+        # the shared subqueries first so the reports find them in the cache
+        futures = {executor.submit(run, call): call for call in shared}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as err:
+                # the reports that need it will fail and say why
+                print('failed {} {} : {}'.format(*futures[future], err))
+
+        # then every distinct report, writing each as it finishes
+        futures = {executor.submit(run_report, call): call for call in distinct}
+        for future in as_completed(futures):
+            call = futures[future]
+            for report, report_call in zip(reports, calls):
+                if report_call != call:
+                    continue
+                try:
+                    print('wrote {}'.format(
+                        write_output(report, future.result())))
+                except Exception as err:
+                    failed += 1
+                    print('failed {} : {}'.format(report['name'], err))
+
+    print('finished {} reports with {} failures after {:.1f} seconds'.format(
+        len(reports), failed, time.time() - start))
+    for level, counts in treemap_cache.stats().items():
+        print('{:10s}: {} hits, {} misses'.format(
+            level, counts['hits'], counts['misses']))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
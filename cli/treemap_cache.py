@@ -0,0 +1,273 @@
+'''
+two level cache for the treemap query functions
+a bounded in-process lru cache sits in front of memcached
+keys include a generation id for the database so reloading
+a database invalidates the results cached for the old data
+'''
+
+import time
+import pickle
+import hashlib
+import inspect
+import threading
+from functools import wraps, lru_cache
+from collections import OrderedDict
+
+import treemap_config
+
+# set to False to always run the queries, e.g. for benchmarking
+ENABLED = getattr(treemap_config, 'CACHE_ENABLED', True)
+
+# number of results to keep in the in-process cache
+LRU_SIZE = getattr(treemap_config, 'LRU_SIZE', 1024)
+
+# number of seconds to trust a database generation id before checking it again
+GENERATION_TTL = getattr(treemap_config, 'GENERATION_TTL', 60)
+
+# hit and miss counters for each level of the cache
+# in_flight hits are calls that waited for the same call already
+# running in another thread instead of running it again
+STATS = {
+    'lru': {'hits': 0, 'misses': 0},
+    'in_flight': {'hits': 0, 'misses': 0},
+    'memcached': {'hits': 0, 'misses': 0}}
+
+# key -> Flight for the calls that are running
+FLIGHTS = {}
+
+# database -> (generation id, time it was looked up)
+GENERATIONS = {}
+
+# created on first use
+MEMCACHED = None
+
+LOCK = threading.Lock()
+
+
+class LRUCache:
+    '''
+    thread safe dictionary holding at most max_size items
+    the least recently used item is dropped when it is full
+    values are stored pickled so callers can't modify the cached copy
+    '''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        returns None if the key is not in the cache
+        '''
+        with self.lock:
+            try:
+                self.items.move_to_end(key)
+                value = self.items[key]
+            except KeyError:
+                return None
+        return pickle.loads(value)
+
+    def put(self, key, value):
+        '''
+        add an item, evicting the least recently used if needed
+        '''
+        value = pickle.dumps(value)
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        '''
+        empty the cache
+        '''
+        with self.lock:
+            self.items.clear()
+
+
+LRU = LRUCache(LRU_SIZE)
+
+
+class Flight:
+    '''
+    a call that is running, other threads making the same
+    call wait for it to finish and use its result
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        '''
+        wait for the call to finish, returns a copy of its result
+        '''
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return pickle.loads(self.value)
+
+
+def count(level, outcome):
+    '''
+    increment a hit or miss counter
+    '''
+    with LOCK:
+        STATS[level][outcome] += 1
+
+
+def stats():
+    '''
+    get a copy of the hit and miss counters
+    '''
+    with LOCK:
+        return {level: dict(counts) for level, counts in STATS.items()}
+
+
+def get_memcached():
+    '''
+    get the memcached client, creating it if needed
+    '''
+    global MEMCACHED
+    if MEMCACHED is None:
+        import memcache
+        MEMCACHED = memcache.Client(treemap_config.MC_SERVERS)
+    return MEMCACHED
+
+
+def generation_key(database):
+    return 'treemap:generation:' + hashlib.md5(
+        database.encode('utf-8')).hexdigest()
+
+
+def get_generation(load_generation, database):
+    '''
+    get the generation id of a database
+    looks it up again once it is older than GENERATION_TTL seconds.
+    it is shared through memcached for GENERATION_TTL seconds too, so
+    a new process only asks clickhouse if neither cache has it
+    '''
+    now = time.time()
+    with LOCK:
+        cached = GENERATIONS.get(database)
+    if cached is not None and now - cached[1] < GENERATION_TTL:
+        return cached[0]
+    generation = None
+    if ENABLED:
+        generation = get_memcached().get(generation_key(database))
+    if generation is None:
+        generation = load_generation(database)
+        if ENABLED and generation is not None:
+            get_memcached().set(
+                generation_key(database), generation, time=GENERATION_TTL)
+    with LOCK:
+        GENERATIONS[database] = (generation, now)
+    return generation
+
+
+def forget_generation(database):
+    '''
+    drop the generation id of a database that has been loaded
+    so the next lookup asks clickhouse
+    '''
+    with LOCK:
+        GENERATIONS.pop(database, None)
+    if ENABLED:
+        get_memcached().delete(generation_key(database))
+
+
+@lru_cache(maxsize=None)
+def signature(func):
+    return inspect.signature(func)
+
+
+def make_key(func, generation, args, kwargs):
+    '''
+    memcached keys are limited to 250 characters
+    so use a hash of the function name and arguments.
+    the arguments are bound to the function's parameters with the
+    defaults filled in, so a call has the same key whether they
+    were passed by position or by name
+    '''
+    bound = signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    text = repr((
+        func.__module__, func.__name__, generation,
+        tuple(bound.arguments.items())))
+    return 'treemap:' + hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def fetch(func, key, database, args, kwargs):
+    '''
+    get a result from memcached or by calling the function
+    and store it in both levels of the cache
+    '''
+    value = get_memcached().get(key)
+    if value is not None:
+        count('memcached', 'hits')
+        LRU.put(key, value)
+        return value
+    count('memcached', 'misses')
+
+    # run the query and store the result in both levels
+    value = func(database, *args, **kwargs)
+    get_memcached().set(key, value)
+    LRU.put(key, value)
+    return value
+
+
+def cached(load_generation):
+    '''
+    make a decorator that caches the results of a function in the
+    in-process lru cache and memcached. concurrent calls with the
+    same arguments only run the function once.
+    the first argument of the decorated function must be the database
+    (or a tuple of databases) and load_generation maps a database name
+    to its generation id
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(database, *args, **kwargs):
+            if not ENABLED:
+                return func(database, *args, **kwargs)
+            if isinstance(database, tuple):
+                # a diff between databases
+                generation = tuple(
+                    get_generation(load_generation, name) for name in database)
+            else:
+                generation = get_generation(load_generation, database)
+            key = make_key(func, generation, (database,) + args, kwargs)
+
+            # try the in-process cache
+            value = LRU.get(key)
+            if value is not None:
+                count('lru', 'hits')
+                return value
+            count('lru', 'misses')
+
+            # wait for the same call if another thread is making it
+            with LOCK:
+                flight = FLIGHTS.get(key)
+                leader = flight is None
+                if leader:
+                    flight = FLIGHTS[key] = Flight()
+            if not leader:
+                count('in_flight', 'hits')
+                return flight.wait()
+            count('in_flight', 'misses')
+            try:
+                value = fetch(func, key, database, args, kwargs)
+                flight.value = pickle.dumps(value)
+                return value
+            except Exception as err:
+                flight.error = err
+                raise
+            finally:
+                with LOCK:
+                    del FLIGHTS[key]
+                flight.done.set()
+        return wrapper
+    return decorator
@@ -0,0 +1,258 @@
+'''
+catalog of the mpistat snapshot databases
+databases are named <tag>_<yyyy>_<mm>_<dd>. the catalog holds the
+tag and scan date parsed from the name, the number of rows and bytes
+on disk of the files table and whether the load has finished.
+
+the catalog is kept in memcached and only rebuilt when a load finishes
+(the post load job runs this with --mark_loaded) or after CATALOG_TTL
+seconds, so finding the latest database for a tag doesn't need a query
+
+run this as a script to print the catalog
+'''
+
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime
+
+import treemap
+import treemap_cache
+import treemap_config
+import treemap_names
+
+# database and table recording which loads have finished
+CATALOG_DATABASE = getattr(
+    treemap_config, 'CATALOG_DATABASE', 'treemap_catalog')
+LOADS_TABLE = CATALOG_DATABASE + '.loads'
+
+# seconds the catalog is kept in memcached if no load refreshes it
+CATALOG_TTL = getattr(treemap_config, 'CATALOG_TTL', 24 * 3600)
+
+# seconds a process keeps its copy of the catalog before reading it
+# from memcached again, so long running ones see new loads
+CATALOG_CHECK = getattr(treemap_config, 'CATALOG_CHECK', 60)
+
+# memcached key for the catalog
+KEY = 'treemap:catalog'
+
+# the catalog for this process and when it was read
+CATALOG = None
+CATALOG_TIME = 0
+
+LOCK = threading.Lock()
+
+
+def parse_name(name):
+    '''
+    split a database name into its tag and scan date
+    returns (name, None) if it doesn't end in a date
+    '''
+    try:
+        date = datetime.strptime(name[-10:], '%Y_%m_%d').date()
+    except ValueError:
+        return name, None
+    return name[:-11], date.isoformat()
+
+
+def loaded_databases():
+    '''
+    the set of databases whose load has finished
+    '''
+    qry = '''
+        select count(*)
+        from system.tables
+        where database = '{}'
+        and name = 'loads'
+    '''
+    if treemap.execute(None, qry.format(CATALOG_DATABASE))[0][0] == 0:
+        return set()
+    rows = treemap.execute(None, 'select database from {}'.format(LOADS_TABLE))
+    return {row[0] for row in rows}
+
+
+def build():
+    '''
+    build the catalog from the clickhouse system tables
+    returns a list of dicts, newest first
+    '''
+    qry = '''
+        select database, sum(rows), sum(bytes_on_disk)
+        from system.parts
+        where table = 'files'
+        and active
+        group by database
+    '''
+    sizes = {row[0]: row[1:] for row in treemap.execute(None, qry)}
+    loaded = loaded_databases()
+    catalog = []
+    for name in treemap.list_databases(None):
+        if name in (CATALOG_DATABASE, treemap_names.NAMES_DATABASE):
+            continue
+        tag, date = parse_name(name)
+        rows, bytes_on_disk = sizes.get(name, (0, 0))
+        catalog.append({
+            'name': name,
+            'tag': tag,
+            'date': date,
+            'rows': rows,
+            'bytes_on_disk': bytes_on_disk,
+            'loaded': name in loaded})
+    catalog.sort(
+        key=lambda entry: (entry['date'] or '', entry['name']), reverse=True)
+    return catalog
+
+
+def refresh():
+    '''
+    rebuild the catalog and store it in memcached
+    '''
+    global CATALOG, CATALOG_TIME
+    now = time.time()
+    catalog = build()
+    if treemap_cache.ENABLED:
+        treemap_cache.get_memcached().set(KEY, catalog, time=CATALOG_TTL)
+    with LOCK:
+        CATALOG = catalog
+        CATALOG_TIME = now
+    return catalog
+
+
+def get_catalog(max_age=None):
+    '''
+    get the catalog, reading it from memcached if this process's
+    copy is more than max_age (default CATALOG_CHECK) seconds old
+    '''
+    global CATALOG, CATALOG_TIME
+    if max_age is None:
+        max_age = CATALOG_CHECK
+    now = time.time()
+    with LOCK:
+        if CATALOG is not None and now - CATALOG_TIME < max_age:
+            return CATALOG
+    catalog = None
+    if treemap_cache.ENABLED:
+        catalog = treemap_cache.get_memcached().get(KEY)
+    if catalog is None:
+        return refresh()
+    with LOCK:
+        CATALOG = catalog
+        CATALOG_TIME = now
+    return catalog
+
+
+def databases(tag=None):
+    '''
+    the catalog entries for a tag, newest first
+    '''
+    return [
+        entry for entry in get_catalog()
+        if tag is None or entry['tag'] == tag]
+
+
+def find(name):
+    '''
+    the catalog entry for a database, None if there is no such database.
+    a name missing from this process's copy of the catalog is looked for
+    again in memcached in case its load has just finished
+    '''
+    for max_age in (None, 0):
+        for entry in get_catalog(max_age):
+            if entry['name'] == name:
+                return entry
+    return None
+
+
+def newest(tag, num):
+    '''
+    the names of the num newest databases for the tag that have
+    finished loading, newest first. if none of them are marked as
+    loaded (the post load job isn't being run) the newest are used
+    '''
+    entries = databases(tag)
+    loaded = [entry for entry in entries if entry['loaded']]
+    return [entry['name'] for entry in (loaded or entries)[:num]]
+
+
+def latest(tag):
+    '''
+    the name of the newest database for the tag that has finished
+    loading, None if there are no databases for the tag
+    '''
+    names = newest(tag, 1)
+    return names[0] if names else None
+
+
+def previous(tag, database):
+    '''
+    the name of the newest database for the tag older than database
+    '''
+    _, date = parse_name(database)
+    for entry in databases(tag):
+        if date is not None and entry['date'] is not None:
+            if entry['date'] < date:
+                return entry['name']
+    return None
+
+
+def mark_loaded(database):
+    '''
+    record that a database has finished loading and refresh the catalog
+    '''
+    treemap.execute(None, 'create database if not exists {}'.format(
+        CATALOG_DATABASE))
+    treemap.execute(None, '''
+        create table if not exists {}
+        (database String, loaded_at DateTime)
+        engine = ReplacingMergeTree()
+        order by database
+    '''.format(LOADS_TABLE))
+    treemap.execute(None, '''
+        insert into {} (database, loaded_at)
+        select '{}', now()
+    '''.format(LOADS_TABLE, treemap.escape(database)))
+    treemap_cache.forget_generation(database)
+    return refresh()
+
+
+def get_args():
+    '''
+    parse commandline arguments for the catalog
+    '''
+    parser = argparse.ArgumentParser(description='''
+        print or update the catalog of mpistat databases''')
+    parser.add_argument(
+        '--mark_loaded',
+        help='record that this database has finished loading')
+    parser.add_argument(
+        '--refresh',
+        help='rebuild the catalog from clickhouse',
+        action='store_true')
+    parser.set_defaults(refresh=False)
+    parser.add_argument(
+        '-t', '--tag',
+        help='only show databases with this tag')
+    return parser.parse_args()
+
+
+def main():
+    '''
+    main entry point
+    '''
+    args = get_args()
+    if args.mark_loaded is not None:
+        mark_loaded(args.mark_loaded)
+    elif args.refresh:
+        refresh()
+    for entry in databases(args.tag):
+        print('{:30s} {:12s} {:>10s} {:>10s} {}'.format(
+            entry['name'], entry['date'] or '',
+            treemap.get_num_str(entry['rows']),
+            treemap.get_bytes_str(entry['bytes_on_disk']),
+            'loaded' if entry['loaded'] else '-'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
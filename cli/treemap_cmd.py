@@ -4,12 +4,17 @@ in a clickhouse database
 '''
 
 from time import time
+from datetime import datetime
+from functools import partial
 import sys
+import math
+import shlex
 import argparse
-from datetime import datetime
-import dateparser
-
 import treemap
+import treemap_args
+import treemap_cache
+import treemap_catalog
+import treemap_tree
 
 
 def get_args():
@@ -21,51 +26,7 @@ def get_args():
     parser = argparse.ArgumentParser(description='''
         print various reports on space usage using mpistat data
         in a clickhouse database''')
-    parser.add_argument(
-        '-p', '--path',
-        help='directory we want to report on')
-    parser.set_defaults(path='/')
-    parser.add_argument(
-        '-g', '--group',
-        help='group to filter on')
-    parser.add_argument(
-        '-u', '--user',
-        help='user to filter on')
-    parser.add_argument(
-        '-m', '--modified_before',
-        help='select rows where the last modified time is'
-             ' earlier than this timestamp (uses dateparser syntax)')
-    parser.add_argument(
-        '-M', '--modified_after',
-        help='select rows where the last modified time is'
-             ' later than this timestamp (dateparser syntax)')
-    parser.add_argument(
-        '-a', '--accessed_before',
-        help='select rows where the last accessed time is'
-             ' earlier than this timestamp (dateparser syntax)')
-    parser.add_argument(
-        '-A', '--accessed_after',
-        help='select rows where the last accessed time is'
-             ' later than this timestamp (dateparser syntax)')
-    parser.add_argument(
-        '-s', '--size_less_than',
-        help='select rows where the file size is less than'
-             ' the given size',
-        type=int)
-    parser.add_argument(
-        '-S', '--size_greater_than',
-        help='select rows where the file size is greater than the given size',
-        type=int)
-    parser.add_argument(
-        '--suffix',
-        help='select rows with the given file suffix (case sensitive)')
-    parser.add_argument(
-        '--regex',
-        help='''
-            select rows where the full path matches the given
-            regular expression.  must do double-escape on backslash.
-            only use with other filters otherwise the query will be
-            very slow''')
+    treemap_args.add_filter_arguments(parser)
     parser.add_argument(
         '-d', '--database', nargs='*',
         help='the clickhouse database to use. if you omit this parameter it'
@@ -90,6 +51,25 @@ def get_args():
         help='display a group report',
         action='store_true')
     parser.set_defaults(by_group=False)
+    parser.add_argument(
+        '--crosstab',
+        help='display a table of usage broken down by two of user,'
+             ' group, suffix and subdir, e.g. user,suffix for a row per'
+             ' user and a column per suffix')
+    parser.add_argument(
+        '--columns', type=int,
+        help='number of columns to show for a crosstab, the largest by'
+             ' --order_by')
+    parser.set_defaults(columns=6)
+    parser.add_argument(
+        '--top_files',
+        help='display the largest files by size or atime_cost',
+        action='store_true')
+    parser.set_defaults(top_files=False)
+    parser.add_argument(
+        '--after',
+        help='show the page of --top_files after this one, pass the'
+             ' value printed under the previous page')
     parser.add_argument(
         '--list_databases',
         help='show a list of available databases, most recent first',
@@ -97,7 +77,7 @@ def get_args():
     parser.set_defaults(list_databases=False)
     parser.add_argument(
         '--limit', type=int,
-        help='number of rows to show for suffix or user reports')
+        help='number of rows to show for suffix, user or top_files reports')
     parser.set_defaults(limit=20)
     parser.add_argument(
         '--name_width', type=int,
@@ -107,76 +87,135 @@ def get_args():
         '-t', '--tag',
         help='choose the latest database with this tag')
     parser.set_defaults(tag=treemap.default_tag())
+    parser.add_argument(
+        '--local',
+        help='query a local columnar snapshot directory made by'
+             ' bin/mpistat_columnar.py instead of clickhouse')
+    parser.add_argument(
+        '--cache_stats',
+        help='print the hit and miss counts for each level of the cache',
+        action='store_true')
+    parser.set_defaults(cache_stats=False)
+    parser.add_argument(
+        '--fast',
+        help='estimate the subdir, user, group and suffix reports from'
+             ' a sample of the files when they can not use the rollup'
+             ' table, with confidence intervals',
+        action='store_true')
+    parser.set_defaults(fast=False)
+    parser.add_argument(
+        '--sample', type=float,
+        help='fraction of the files --fast reads, in steps of 0.001'
+             ' up to 0.1')
+    parser.set_defaults(sample=treemap.SAMPLE)
     parser.add_argument(
         '--diff',
-        help='report differences between 2 databases')
-    args = parser.parse_args()
-    args.path = args.path.rstrip('/')
-
-    # parse date arguments
-    if args.modified_before is not None:
-        args.modified_before = end_of_day(
-            dateparser.parse(args.modified_before).timestamp())
-    if args.modified_after is not None:
-        args.modified_after = end_of_day(
-            dateparser.parse(args.modified_after).timestamp())
-    if args.accessed_before is not None:
-        args.accessed_before = end_of_day(
-            dateparser.parse(args.accessed_before).timestamp())
-    if args.accessed_after is not None:
-        args.accessed_after = end_of_day(
-            dateparser.parse(args.accessed_after).timestamp())
+        help='report the differences between 2 databases',
+        action='store_true')
+    parser.set_defaults(diff=False)
+    args = treemap_args.process_filter_arguments(parser.parse_args())
+    if args.top_files:
+        if args.order_by not in treemap.TOP_FILES_ORDER:
+            parser.error('--top_files can only be ordered by {}'.format(
+                ' or '.join(treemap.TOP_FILES_ORDER)))
+        if args.diff:
+            parser.error('--top_files can not be used with --diff')
+    if args.after is not None:
+        args.after = parse_after(parser, args.after)
+    if args.fast:
+        if args.diff or args.local is not None:
+            parser.error('--fast can not be used with --diff or --local')
+        if args.top_files or args.crosstab is not None:
+            parser.error('--fast can not be used with --top_files or --crosstab')
+        if not 0 < args.sample < 1:
+            parser.error('--sample should be between 0 and 1')
+    if args.crosstab is not None:
+        args.crosstab = args.crosstab.split(',')
+        if (len(args.crosstab) != 2
+                or args.crosstab[0] == args.crosstab[1]
+                or not set(args.crosstab) <= set(treemap.CROSSTAB_DIMENSIONS)):
+            parser.error('--crosstab should be two different ones of {}'.format(
+                ', '.join(treemap.CROSSTAB_DIMENSIONS)))
+        if args.diff or args.local is not None:
+            parser.error('--crosstab can not be used with --diff or --local')
     return args
 
 
-def end_of_day(epoch):
+def parse_after(parser, after):
     '''
-    returns the timestamp for the end of the day
-    for the passed in timestamp
+    split an --after value into the order_by value and full_path
+    of the last file on the previous page
     '''
-    epoch_dt = datetime.fromtimestamp(epoch)
-    start_dt = epoch_dt.date()
-    return datetime(
-        start_dt.year, start_dt.month, start_dt.day, 23, 59, 59).timestamp()
+    value, _, full_path = after.partition(',')
+    try:
+        value = int(value)
+    except ValueError:
+        try:
+            value = float(value)
+        except ValueError:
+            parser.error('--after should be the value printed under --top_files')
+    return value, full_path
+
 
 def get_databases(args):
     '''
     what databases do we need to use?
+    returns a database name or, for a diff, an (old, new) tuple
     '''
 
     # list the databases if that is the request
     if args.list_databases:
         print_databases(args.tag)
         sys.exit(0)
-   
-    if args.diff is None:
+
+    requested = args.database or []
+    missing = [name for name in requested if treemap_catalog.find(name) is None]
+    if missing:
+        sys.exit('no such database {}'.format(', '.join(sorted(missing))))
+    if not args.diff:
         # just want a single database
-        if args.database is None:
-            # use the latest default tag
-        else:
-            # check the database supplied exists
-    else:
-        # we need 2 databases to diff
-        if len(args.database) < 1:
-            # use the latest 2 default tag ones
-        elif len(args.database) < 2:
-            # use the latest default tag db and the one passed in
-        else:
-            # use the databases passed in
+        if len(requested) > 1:
+            sys.exit('only give 2 databases when doing a --diff')
+        if requested:
+            return requested[0]
+        # use the latest for the tag
+        database = treemap.get_database(args.tag)
+        if database is None:
+            sys.exit('no databases with tag {}'.format(args.tag))
+        return database
+
+    # we need 2 databases to diff
+    if len(requested) > 2:
+        sys.exit('can only diff 2 databases')
+    if len(requested) == 2:
+        # use the databases passed in
+        return tuple(requested)
+    latest = treemap_catalog.newest(args.tag, 2)
+    if len(latest) < 2 - len(requested):
+        sys.exit('not enough databases with tag {} to diff'.format(args.tag))
+    if requested:
+        # diff the one passed in against the latest
+        return (requested[0], latest[0])
+    # the latest 2
+    return (latest[1], latest[0])
 
 
 def print_databases(tag):
     '''
-    print list of available databases
+    print list of available databases, most recent first
     '''
-    databases = treemap.get_databases(tag)
-    print('|-' + '-'*30 + '-|')
-    print('| {:30s} |'.format('database'))
-    print('|-' + '-'*30 + '-|')
-    # print in reverse date order (alphabetical for the last 10 characters)
-    for name in sorted(databases, key=lambda item: item[-10:], reverse=True):
-        print('| {:30s} |'.format(name))
-    print('|-' + '-'*30 + '-|')
+    line_format = '| {:30s} | {:10s} | {:>10s} | {:>10s} | {:6s} |'
+    rule = line_format.format('', '', '', '', '').replace(' ', '-')
+    print(rule)
+    print(line_format.format('database', 'date', 'rows', 'size', 'loaded'))
+    print(rule)
+    for entry in treemap_catalog.databases(tag):
+        print(line_format.format(
+            entry['name'], entry['date'] or '',
+            treemap.get_num_str(entry['rows']),
+            treemap.get_bytes_str(entry['bytes_on_disk']),
+            'yes' if entry['loaded'] else ''))
+    print(rule)
 
 
 def print_header(data):
@@ -187,12 +226,51 @@ def print_header(data):
         data['path'] = '/'
     print('database  : {}'.format(data['database']))
     print('path      : {}'.format(data['path']))
-    print('size      : {}'.format(treemap.get_bytes_str(data['size'])))
-    print('num_files : {}'.format(treemap.get_num_str(data['num_files'])))
-    print('atime_cost: {}'.format(treemap.get_num_str(data['atime_cost'])))
+    errors = data.get('errors')
+    for name in ('size', 'num_files', 'atime_cost'):
+        line = '{:10s}: {}'.format(name, value_str(name, data[name]))
+        if errors is not None:
+            line += ' \u00B1 {}'.format(value_str(name, errors[name]))
+        print(line)
 
 
-def get_table_line_format(name_width, order_by):
+def value_str(name, value):
+    '''
+    pretty print a size, num_files or atime_cost value
+    '''
+    if name == 'size':
+        return treemap.get_bytes_str(int(round(value)))
+    return treemap.get_num_str(value)
+
+
+def error_str(name, child):
+    '''
+    the confidence interval of a --fast row, or that none
+    of its files were in the sample
+    '''
+    if child.get('unsampled'):
+        return 'unsampled'
+    return value_str(name, child['errors'][name])
+
+
+def print_sample_note(data):
+    '''
+    say how approximate a --fast report is
+    '''
+    if 'sample' not in data:
+        return
+    confidence = math.erf(treemap.CONFIDENCE_Z / math.sqrt(2))
+    print('estimated from a {:.1%} sample of the files, \u00B1 gives the'
+          ' {:.0%} confidence interval.'.format(data['sample'], confidence))
+    if any(child.get('unsampled') for child in data['children']):
+        print('none of the files in the unsampled directories were in the'
+              ' sample')
+    print('run without --fast, with --path set to the rows that matter,'
+          ' for exact values')
+    print()
+
+
+def get_table_line_format(name_width, order_by, errors=False):
     pct ='{p:{c}>5}{c}{M}{c}'
     pct += '{q:{c}>5}{c}{M}{c}'
     line_format = u'{L}{c}'
@@ -209,6 +287,9 @@ def get_table_line_format(name_width, order_by):
         line_format += '{q:{c}>5}{c}{R}'
     else:
         line_format += '{a:{c}>10}{c}{R}'
+    if errors:
+        # the confidence interval of the order_by column at the end
+        line_format = line_format[:-len('{R}')] + '{M}{c}{e:{c}>10}{c}{R}'
     return line_format
 
 def print_table(data, col_name, order_by, name_width):
@@ -216,8 +297,10 @@ def print_table(data, col_name, order_by, name_width):
     print a subdir, user or suffix table
     '''
 
-    # get the line format
-    line_format = get_table_line_format(name_width, order_by)
+    # get the line format, --fast reports have a column
+    # for the confidence interval of the order_by value
+    sampled = 'sample' in data
+    line_format = get_table_line_format(name_width, order_by, sampled)
 
     # print the header
     print()
@@ -225,9 +308,9 @@ def print_table(data, col_name, order_by, name_width):
     print()
     print(line_format.format(
         n=col_name, s='size', p='%', q='+%', N='num_files',a='atime_cost',
-        L=' ', M= ' ', R=' ', c=' '))
+        e=u'\u00B1', L=' ', M= ' ', R=' ', c=' '))
     print(line_format.format(
-        n='', s='', p='', q='', N='',a='',
+        n='', s='', p='', q='', N='',a='', e='',
         L=u'\u250F', M=u'\u2533', R=u'\u2513', c=u'\u2501'))
 
     # print the lines for the table
@@ -245,13 +328,174 @@ def print_table(data, col_name, order_by, name_width):
             a=treemap.get_num_str(child['atime_cost']),
             p='{:5.1f}'.format(p),
             q='{:5.1f}'.format(q),
+            e=error_str(order_by, child) if sampled else '',
             L=u'\u2503', M=u'\u2503', R=u'\u2503', c=' '))
 
     # print the footer
     print(line_format.format(
-        n='', s='', N='', a='', p='', q='',
+        n='', s='', N='', a='', p='', q='', e='',
         L=u'\u2517', M=u'\u253B', R=u'\u251B', c=u'\u2501'))
     print()
+    print_sample_note(data)
+
+
+def print_files_table(data, order_by, name_width, limit):
+    '''
+    print the largest files and how to get the next page
+    '''
+    line_format = u'{L}{c}'
+    line_format += '{{n:{{c}}<{}}}{{c}}{{M}}{{c}}'.format(name_width)
+    line_format += '{s:{c}>10}{c}{M}{c}{a:{c}>10}{c}{M}{c}'
+    line_format += '{u:{c}<10}{c}{M}{c}{t:{c}>10}{c}{M}{c}{m:{c}>10}{c}{R}'
+    blank = dict(n='', s='', a='', u='', t='', m='')
+
+    print()
+    print_header(data)
+    print()
+    print(line_format.format(
+        n='file', s='size', a='atime_cost', u='user', t='atime', m='mtime',
+        L=' ', M=' ', R=' ', c=' '))
+    print(line_format.format(
+        L=u'\u250F', M=u'\u2533', R=u'\u2513', c=u'\u2501', **blank))
+    for child in data['children']:
+        # keep the end of long paths, the file name is the useful part
+        name = child['name']
+        if len(name) > name_width:
+            name = '*' + name[1-name_width:]
+        print(line_format.format(
+            n=name,
+            s=treemap.get_bytes_str(child['size']),
+            a=treemap.get_num_str(child['atime_cost']),
+            u=child['user'][:10],
+            t=datetime.fromtimestamp(child['atime']).strftime('%Y-%m-%d'),
+            m=datetime.fromtimestamp(child['mtime']).strftime('%Y-%m-%d'),
+            L=u'\u2503', M=u'\u2503', R=u'\u2503', c=' '))
+    print(line_format.format(
+        L=u'\u2517', M=u'\u253B', R=u'\u251B', c=u'\u2501', **blank))
+    print()
+    if data['next'] is not None:
+        print('next {} files: --after {}'.format(
+            limit, shlex.quote('{},{}'.format(*data['next']))))
+        print()
+
+
+def print_crosstab(data, rows, columns, order_by, name_width):
+    '''
+    print a crosstab as a matrix of the order_by values with the
+    row totals down the right and the column totals along the bottom
+    '''
+    to_str = treemap.get_bytes_str if order_by == 'size' else treemap.get_num_str
+    line_format = u'{{L}}{{c}}{{n:{{c}}<{}}}{{c}}'.format(name_width)
+    for i in range(len(data['columns']) + 1):
+        line_format += u'{{M}}{{c}}{{v{}:{{c}}>10}}{{c}}'.format(i)
+    line_format += '{R}'
+    blank = {'v{}'.format(i): '' for i in range(len(data['columns']) + 1)}
+
+    def cut(name):
+        name = str(name)
+        if len(name) > name_width:
+            name = name[:name_width-1] + '*'
+        return name
+
+    print()
+    print_header(data)
+    print('shown     : {} of {} {} rows, {} of {} {} columns'.format(
+        len(data['children']), data['num_rows'], rows,
+        len(data['columns']), data['num_columns'], columns))
+    print()
+    header = {'v{}'.format(i): str(column['name'])[:10]
+              for i, column in enumerate(data['columns'])}
+    header['v{}'.format(len(data['columns']))] = 'total'
+    print(line_format.format(
+        n='{}/{}'.format(rows, columns), L=' ', M=' ', R=' ', c=' ',
+        **header))
+    print(line_format.format(
+        n='', L=u'\u250F', M=u'\u2533', R=u'\u2513', c=u'\u2501', **blank))
+    for child in data['children']:
+        values = {
+            'v{}'.format(i): to_str(cell[order_by]) if cell else '-'
+            for i, cell in enumerate(child['cells'])}
+        values['v{}'.format(len(child['cells']))] = to_str(child[order_by])
+        print(line_format.format(
+            n=cut(child['name']), L=u'\u2503', M=u'\u2503', R=u'\u2503',
+            c=' ', **values))
+    print(line_format.format(
+        n='', L=u'\u2523', M=u'\u254B', R=u'\u252B', c=u'\u2501', **blank))
+    totals = {
+        'v{}'.format(i): to_str(column[order_by])
+        for i, column in enumerate(data['columns'])}
+    totals['v{}'.format(len(data['columns']))] = to_str(data[order_by])
+    print(line_format.format(
+        n='total', L=u'\u2503', M=u'\u2503', R=u'\u2503', c=' ', **totals))
+    print(line_format.format(
+        n='', L=u'\u2517', M=u'\u253B', R=u'\u251B', c=u'\u2501', **blank))
+    print()
+
+
+def signed(value, to_str):
+    '''
+    pretty print a change with its sign
+    '''
+    if value < 0:
+        return '-' + to_str(-value)
+    return '+' + to_str(value)
+
+
+def print_diff_table(data, col_name, order_by, name_width):
+    '''
+    print a subdir, user, group or suffix table of the
+    differences between 2 databases, biggest change first
+    '''
+    line_format = u'{L}{c}'
+    line_format += '{{n:{{c}}<{}}}{{c}}{{M}}{{c}}'.format(name_width)
+    line_format += '{s:{c}>10}{c}{M}{c}{S:{c}>11}{c}{M}{c}'
+    line_format += '{N:{c}>10}{c}{M}{c}{D:{c}>11}{c}{M}{c}'
+    line_format += '{a:{c}>10}{c}{M}{c}{A:{c}>11}{c}{R}'
+    blank = dict(n='', s='', S='', N='', D='', a='', A='')
+
+    # the header shows the new totals and the change
+    print()
+    if data['path'] == '':
+        data['path'] = '/'
+    print('database  : {}'.format(data['database']))
+    print('path      : {}'.format(data['path']))
+    print('size      : {} ({})'.format(
+        treemap.get_bytes_str(data['size']),
+        signed(data['size_delta'], treemap.get_bytes_str)))
+    print('num_files : {} ({})'.format(
+        treemap.get_num_str(data['num_files']),
+        signed(data['num_files_delta'], treemap.get_num_str)))
+    print('atime_cost: {} ({})'.format(
+        treemap.get_num_str(data['atime_cost']),
+        signed(data['atime_cost_delta'], treemap.get_num_str)))
+    print()
+    print(line_format.format(
+        n=col_name, s='size', S='change', N='num_files', D='change',
+        a='atime_cost', A='change', L=' ', M=' ', R=' ', c=' '))
+    print(line_format.format(
+        L=u'\u250F', M=u'\u2533', R=u'\u2513', c=u'\u2501', **blank))
+
+    # print the lines for the table
+    delta = order_by + '_delta'
+    for child in sorted(
+            data['children'], key=lambda k: abs(k[delta]), reverse=True):
+        name = child['name']
+        if len(name) > name_width:
+            name = name[:name_width-1] + '*'
+        print(line_format.format(
+            n=name,
+            s=treemap.get_bytes_str(child['size']),
+            S=signed(child['size_delta'], treemap.get_bytes_str),
+            N=treemap.get_num_str(child['num_files']),
+            D=signed(child['num_files_delta'], treemap.get_num_str),
+            a=treemap.get_num_str(child['atime_cost']),
+            A=signed(child['atime_cost_delta'], treemap.get_num_str),
+            L=u'\u2503', M=u'\u2503', R=u'\u2503', c=' '))
+
+    # print the footer
+    print(line_format.format(
+        L=u'\u2517', M=u'\u253B', R=u'\u251B', c=u'\u2501', **blank))
+    print()
 
 
 def main():
@@ -265,12 +509,18 @@ def main():
     # get commandline args
     args = get_args()
 
-    get_databases(args)
+    # choose where to get the data from
+    engine = treemap
+    if args.local is not None:
+        if args.diff:
+            sys.exit('--diff is not supported with --local')
+        import treemap_local
+        engine = treemap_local
+        database = args.local
+    else:
+        database = get_databases(args)
 
-    # get the command line arguments and
-    # sanitise them
-    args = get_args()
-    database = args.database
+    # sanitise the command line arguments
     path = args.path
     group = args.group
     user = args.user
@@ -285,56 +535,118 @@ def main():
     order_by = args.order_by
     limit = args.limit
     name_width = args.name_width
-    diff = args.diff
 
-    if diff is not None:
-        print('doing a diff of {}'.format(diff))
+    # the differences between 2 databases
+    if args.diff:
+        if args.by_suffix:
+            column, col_name = 'suffix', 'suffix'
+        elif args.by_user:
+            column, col_name = 'uid', 'user'
+        elif args.by_group:
+            column, col_name = 'gid', 'group'
+        else:
+            # every subdir is shown so order and limit don't apply
+            column, col_name = 'subdir', 'subdir'
+        data = treemap.diff_report(
+            database, path, column, group, user,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, suffix, regex,
+            None if column == 'subdir' else order_by,
+            None if column == 'subdir' else limit)
+        print_diff_table(data, col_name, order_by, name_width)
+        finish(args, start)
+        return 0
+
+    # read a sample of the files for --fast
+    fast = {'sample': args.sample} if args.fast else {}
 
     # placeholder for the query data
     # and the column name to display in the table
     data = []
     col_name = ''
 
+    # usage by two dimensions with their totals
+    if args.crosstab is not None:
+        rows, columns = args.crosstab
+        data = treemap.crosstab(
+            database, path, rows, columns, group, user,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, suffix, regex,
+            order_by, limit, args.columns)
+        print_crosstab(data, rows, columns, order_by, name_width)
+        finish(args, start)
+        return 0
+
+    # the largest files under the path
+    if args.top_files:
+        data = engine.top_files(
+            database, path, group, user,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, suffix, regex, order_by, limit,
+            args.after)
+        print_files_table(data, order_by, name_width, limit)
+        finish(args, start)
+        return 0
+
     # get the usage by suffix for the given path and filters
     if args.by_suffix:
-        data = treemap.by_suffix(
+        data = engine.by_suffix(
             database, path, group, user,
             modified_before, modified_after, accessed_before, accessed_after,
-            size_less_than, size_greater_than, suffix, regex, order_by, limit)
+            size_less_than, size_greater_than, suffix, regex, order_by, limit,
+            **fast)
         col_name = 'suffix'
 
     # get the usage by user for the given path and filters
     elif args.by_user:
-        data = treemap.by_user(
+        data = engine.by_user(
             database, path, group, user,
             modified_before, modified_after, accessed_before, accessed_after,
-            size_less_than, size_greater_than, suffix, regex, order_by, limit)
+            size_less_than, size_greater_than, suffix, regex, order_by, limit,
+            **fast)
         col_name = 'user'
 
     # get the usage by group for the given path and filters
     elif args.by_group:
-        data = treemap.by_group(
+        data = engine.by_group(
             database, path, group, user,
             modified_before, modified_after, accessed_before, accessed_after,
-            size_less_than, size_greater_than, suffix, regex, order_by, limit)
+            size_less_than, size_greater_than, suffix, regex, order_by, limit,
+            **fast)
         col_name = 'group'
 
     # get the usage for the sub directories of the given path
     else:
-        data = treemap.get_subdir_data(
-            database, path, group, user,
-            modified_before, modified_after, accessed_before, accessed_after,
-            size_less_than, size_greater_than, suffix, regex)
+        load = engine.get_subdir_data
+        if args.fast:
+            load = partial(load, **fast)
+        tree = treemap_tree.TreeModel(
+            database, treemap_args.filters(args), load=load)
+        data = tree.get(path)
         col_name = 'subdir'
 
 
     # print a table of the data returned
     print_table(data, col_name, order_by, name_width)
+    finish(args, start)
+    return 0
+
+
+def finish(args, start):
+    '''
+    print the elapsed time and the cache counters if requested
+    '''
 
     # print the total elapsed time for the query
     print('after {} seconds'.format(time()-start))
     print()
-    return 0
+
+    # print the cache counters if requested
+    if args.cache_stats:
+        for level, counts in treemap_cache.stats().items():
+            print('{:10s}: {} hits, {} misses'.format(
+                level, counts['hits'], counts['misses']))
+        print()
 
 
 if __name__ == '__main__':
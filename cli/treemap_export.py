@@ -0,0 +1,143 @@
+'''
+export the files under a path from an mpistat clickhouse database
+writes the full_path, size, uid, atime and mtime of every file that
+matches the treemap filters as json lines or csv, gzipped if the output
+file ends in .gz or with --compress. the rows are streamed from clickhouse
+a block at a time so exports of any size run in bounded memory
+'''
+
+import sys
+import csv
+import gzip
+import json
+import argparse
+
+import treemap
+import treemap_args
+
+# the columns exported for each file
+COLUMNS = ('full_path', 'size', 'uid', 'atime', 'mtime')
+
+FORMATS = ('jsonl', 'csv')
+
+
+def get_args():
+    '''
+    parse commandline arguments for the export
+    '''
+    parser = argparse.ArgumentParser(description='''
+        export the list of files under a path, with the same filters
+        as treemap, as json lines or csv''')
+    treemap_args.add_filter_arguments(parser)
+    parser.add_argument(
+        '-d', '--database',
+        help='the clickhouse database to use, defaults to the latest'
+             ' for the tag')
+    parser.add_argument(
+        '-t', '--tag',
+        help='choose the latest database with this tag')
+    parser.set_defaults(tag=treemap.default_tag())
+    parser.add_argument(
+        '-o', '--output',
+        help='file to write to, defaults to stdout')
+    parser.set_defaults(output='-')
+    parser.add_argument(
+        '-f', '--format',
+        help='jsonl or csv, defaults to the extension of the output file'
+             ' or jsonl',
+        choices=FORMATS)
+    parser.add_argument(
+        '-z', '--compress',
+        help='gzip the output, the default if the output file ends in .gz',
+        action='store_true')
+    parser.set_defaults(compress=False)
+    args = treemap_args.process_filter_arguments(parser.parse_args())
+    name = args.output[:-3] if args.output.endswith('.gz') else args.output
+    if args.output.endswith('.gz'):
+        args.compress = True
+    if args.format is None:
+        args.format = 'csv' if name.endswith('.csv') else 'jsonl'
+    return args
+
+
+def export_qry(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex):
+    '''
+    generate the query for the files under the path
+    '''
+    qry = '''
+        select {}
+        from {}
+        where full_path like '{}/%'
+    '''
+    qry = qry.format(
+        ', '.join(COLUMNS), treemap.files_table(database, group, user),
+        treemap.escape(path))
+    qry += treemap.filter_qry(
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex)
+    return qry
+
+
+def open_output(output, compress):
+    '''
+    open the output as text, gzipped if asked for
+    '''
+    if output == '-':
+        if compress:
+            return gzip.open(sys.stdout.buffer, 'wt', newline='')
+        return sys.stdout
+    if compress:
+        return gzip.open(output, 'wt', newline='')
+    return open(output, 'w', newline='')
+
+
+def write_jsonl(out, rows):
+    '''
+    write each row as a json object on its own line
+    '''
+    num = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(COLUMNS, row))) + '\n')
+        num += 1
+    return num
+
+
+def write_csv(out, rows):
+    '''
+    write the rows as csv with a header line
+    '''
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    num = 0
+    for row in rows:
+        writer.writerow(row)
+        num += 1
+    return num
+
+
+def main():
+    '''
+    main entry point
+    '''
+    args = get_args()
+    database = args.database
+    if database is None:
+        database = treemap.get_database(args.tag)
+    qry = export_qry(database, args.path, *treemap_args.filters(args))
+    write = write_csv if args.format == 'csv' else write_jsonl
+    out = open_output(args.output, args.compress)
+    try:
+        num = write(out, treemap.iterate(database, qry))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print('exported {:,} files from {}'.format(num, database), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
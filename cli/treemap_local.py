@@ -0,0 +1,448 @@
+'''
+functions for getting mpistat data from a local columnar
+snapshot made by bin/mpistat_columnar.py instead of clickhouse
+
+they have the same signatures as the query functions in treemap
+with the snapshot directory passed as the database. all the
+filters are done with numpy over memory mapped columns
+'''
+
+import os
+import re
+import json
+import bisect
+
+import numpy as np
+
+import treemap
+
+# snapshots that have been opened, keyed by directory
+SNAPSHOTS = {}
+
+
+class PathColumn:
+    '''
+    sorted list of paths stored as concatenated bytes and offsets
+    supports len and indexing so the bisect module can search it
+    '''
+
+    def __init__(self, directory):
+        self.offsets = np.load(
+            os.path.join(directory, 'full_path.npy'), mmap_mode='r')
+        blob_path = os.path.join(directory, 'full_path.bin')
+        if os.path.getsize(blob_path) > 0:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i+1]].tobytes()
+
+    def prefix_range(self, path):
+        '''
+        get the range of rows under the given path
+        '/' sorts immediately before '0' so everything starting with
+        path/ lies between path/ and path0
+        '''
+        path = path.encode('utf-8', 'surrogateescape')
+        start = bisect.bisect_left(self, path + b'/')
+        end = bisect.bisect_left(self, path + b'0', lo=start)
+        return start, end
+
+    def decode(self, i):
+        '''
+        get a path as a string, as clickhouse_driver would return it
+        '''
+        return self[i].decode('utf-8', 'surrogateescape')
+
+
+class Table:
+    '''
+    the memory mapped columns of a table in the snapshot
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.full_path = PathColumn(directory)
+        self.columns = {}
+
+    def __getitem__(self, name):
+        if name not in self.columns:
+            self.columns[name] = np.load(
+                os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+        return self.columns[name]
+
+
+class Snapshot:
+    '''
+    a local columnar snapshot
+    '''
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as meta_file:
+            self.meta = json.load(meta_file)
+        self.files = Table(os.path.join(directory, 'files'))
+        self.directories = Table(os.path.join(directory, 'directories'))
+        self.suffixes = self.meta['suffixes']
+        self.suffix_codes = {
+            name: code for code, name in enumerate(self.suffixes)}
+
+    def atime_cost(self, start, end):
+        '''
+        the atime_cost for a range of files, as in the clickhouse schema
+        '''
+        blocks = self.files['blocks'][start:end].astype(np.float64)
+        age = self.meta['now'] - self.files['atime'][start:end].astype(np.float64)
+        return 10.0*(blocks*512/(1024*1024*1024*1024))*(age/(365*24*3600/12))
+
+
+def get_snapshot(database):
+    '''
+    open a snapshot, reusing it if already open
+    '''
+    if database not in SNAPSHOTS:
+        SNAPSHOTS[database] = Snapshot(database)
+    return SNAPSHOTS[database]
+
+
+def numeric_id(value):
+    '''
+    get_gid and get_uid return the name they were given if it
+    is not known, which only matches anything if it is a number
+    '''
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def filter_mask(
+        snapshot, start, end, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex):
+    '''
+    boolean mask over a range of files for the filters
+    the numpy equivalent of treemap.filter_qry
+    '''
+    files = snapshot.files
+    mask = np.ones(end - start, dtype=bool)
+    if group is not None:
+        gid = numeric_id(treemap.get_gid(group))
+        if gid is None:
+            return np.zeros(end - start, dtype=bool)
+        mask &= files['gid'][start:end] == gid
+    if user is not None:
+        uid = numeric_id(treemap.get_uid(user))
+        if uid is None:
+            return np.zeros(end - start, dtype=bool)
+        mask &= files['uid'][start:end] == uid
+    if modified_before is not None:
+        mask &= files['mtime'][start:end] < modified_before
+    if modified_after is not None:
+        mask &= files['mtime'][start:end] > modified_after
+    if accessed_before is not None:
+        mask &= files['atime'][start:end] < accessed_before
+    if accessed_after is not None:
+        mask &= files['atime'][start:end] > accessed_after
+    if size_less_than is not None:
+        mask &= files['size'][start:end] < size_less_than
+    if size_greater_than is not None:
+        mask &= files['size'][start:end] > size_greater_than
+    if suffix is not None:
+        code = snapshot.suffix_codes.get(suffix)
+        if code is None:
+            return np.zeros(end - start, dtype=bool)
+        mask &= files['suffix'][start:end] == code
+    if regex is not None:
+        pattern = re.compile(regex)
+        for i in np.flatnonzero(mask):
+            if pattern.search(files.full_path.decode(start + i)) is None:
+                mask[i] = False
+    return mask
+
+
+def range_values(snapshot, start, end, filters):
+    '''
+    size, file count and atime_cost for each file in a range
+    with the files that don't match the filters zeroed
+    '''
+    mask = filter_mask(snapshot, start, end, *filters)
+    size = snapshot.files['blocks'][start:end].astype(np.uint64) * 512
+    size[~mask] = 0
+    atime_cost = snapshot.atime_cost(start, end)
+    atime_cost[~mask] = 0.0
+    return size, mask.astype(np.int64), atime_cost, mask
+
+
+def subdirs(database, path):
+    '''
+    get a list of directories immediately underneath the given path
+    '''
+    directories = get_snapshot(database).directories
+    start, end = directories.full_path.prefix_range(path)
+    depth = directories['depth'][start:end]
+    return [
+        directories.full_path.decode(start + i)
+        for i in np.flatnonzero(depth == treemap.path_depth(path) + 1)]
+
+
+def subtree_sums(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex):
+    '''
+    get the sums for everything under the given path
+    '''
+    snapshot = get_snapshot(database)
+    start, end = snapshot.files.full_path.prefix_range(path)
+    size, num_files, atime_cost, _ = range_values(snapshot, start, end, (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex))
+    return int(size.sum()), int(num_files.sum()), float(atime_cost.sum())
+
+
+def star_dot_star(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex):
+    '''
+    get the sums for the files directly in the given path
+    '''
+    snapshot = get_snapshot(database)
+    start, end = snapshot.files.full_path.prefix_range(path)
+    size, num_files, atime_cost, _ = range_values(snapshot, start, end, (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex))
+    here = snapshot.files['depth'][start:end] == treemap.path_depth(path) + 1
+    return (
+        int(size[here].sum()),
+        int(num_files[here].sum()),
+        float(atime_cost[here].sum()))
+
+
+def subdir_sums(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex):
+    '''
+    get the sums for *.* and every child of the given path
+    the rows under each child are a contiguous range so the
+    sums come from differences of cumulative sums
+    '''
+    snapshot = get_snapshot(database)
+    files = snapshot.files
+    start, end = files.full_path.prefix_range(path)
+    size, num_files, atime_cost, _ = range_values(snapshot, start, end, (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex))
+    here = files['depth'][start:end] == treemap.path_depth(path) + 1
+    rows = [(
+        '*.*',
+        int(size[here].sum()),
+        int(num_files[here].sum()),
+        float(atime_cost[here].sum()))]
+    cumulative = [
+        np.concatenate(([0], np.cumsum(values)))
+        for values in (size, num_files, atime_cost)]
+    for directory in subdirs(database, path):
+        child_start, child_end = files.full_path.prefix_range(directory)
+        child_start -= start
+        child_end -= start
+        sums = [
+            values[child_end] - values[child_start] for values in cumulative]
+        rows.append((
+            directory.rsplit('/', 1)[-1],
+            int(sums[0]), int(sums[1]), float(sums[2])))
+    return rows
+
+
+def get_subdir_data(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex):
+    '''
+    get data for subdirs
+    '''
+    data = {
+        'database': database,
+        'path': path,
+        'size': 0,
+        'num_files': 0,
+        'atime_cost': 0,
+        'children': []}
+    for name, size, num_files, atime_cost in subdir_sums(
+            database, path, group, user,
+            modified_before, modified_after, accessed_before, accessed_after,
+            size_less_than, size_greater_than, suffix, regex):
+        if num_files > 0:
+            data['size'] += size
+            data['num_files'] += num_files
+            data['atime_cost'] += atime_cost
+            data['children'].append({
+                'name': name,
+                'size': size,
+                'num_files': num_files,
+                'atime_cost': atime_cost})
+    return data
+
+
+def report(
+        database, path, column, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit):
+    '''
+    usage report grouped on the given column (uid, gid or suffix)
+    returns the totals for the path and a list of
+    (value, size, num_files, atime_cost) ordered and limited
+    '''
+    snapshot = get_snapshot(database)
+    start, end = snapshot.files.full_path.prefix_range(path)
+    size, num_files, atime_cost, mask = range_values(snapshot, start, end, (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex))
+    totals = (int(size.sum()), int(num_files.sum()), float(atime_cost.sum()))
+    keys, inverse = np.unique(
+        snapshot.files[column][start:end][mask], return_inverse=True)
+    sums = {
+        'size': np.bincount(inverse, weights=size[mask], minlength=len(keys)),
+        'num_files': np.bincount(inverse, minlength=len(keys)),
+        'atime_cost': np.bincount(
+            inverse, weights=atime_cost[mask], minlength=len(keys))}
+    order = np.argsort(-sums[order_by], kind='stable')[:limit]
+    rows = [(
+        keys[i].item(),
+        int(sums['size'][i]),
+        int(sums['num_files'][i]),
+        float(sums['atime_cost'][i])) for i in order]
+    return totals, rows
+
+
+def report_data(database, path, totals, rows, name):
+    '''
+    put the report rows into the same structure treemap returns
+    '''
+    size, num_files, atime_cost = totals
+    return {
+        'database': database,
+        'path': path,
+        'size': size,
+        'num_files': num_files,
+        'atime_cost': atime_cost,
+        'children': [{
+            'name': name(row[0]),
+            'size': row[1],
+            'num_files': row[2],
+            'atime_cost': row[3]} for row in rows]}
+
+
+def by_user(
+        database, path, group,
+        user, modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit):
+    '''
+    get usage by user
+    '''
+    totals, rows = report(
+        database, path, 'uid', group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit)
+    return report_data(database, path, totals, rows, treemap.get_username)
+
+
+def by_group(
+        database, path,
+        group, user,
+        modified_before, modified_after,
+        accessed_before, accessed_after,
+        size_less_than, size_greater_than,
+        suffix, regex,
+        order_by, limit):
+    '''
+    get usage by group
+    '''
+    totals, rows = report(
+        database, path, 'gid', group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit)
+    return report_data(
+        database, path, totals, rows, lambda gid: str(treemap.get_group(gid)))
+
+
+def by_suffix(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit):
+    '''
+    get usage by suffix
+    '''
+    totals, rows = report(
+        database, path, 'suffix', group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit)
+    suffixes = get_snapshot(database).suffixes
+    return report_data(
+        database, path, totals, rows, lambda code: suffixes[code])
+
+
+def top_files(
+        database, path, group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex, order_by, limit,
+        after):
+    '''
+    get the files under the path with the largest size or atime_cost
+    paths are already sorted so only the value needs ranking
+    '''
+    snapshot = get_snapshot(database)
+    files = snapshot.files
+    start, end = files.full_path.prefix_range(path)
+    size, num_files, atime_cost, mask = range_values(snapshot, start, end, (
+        group, user,
+        modified_before, modified_after, accessed_before, accessed_after,
+        size_less_than, size_greater_than, suffix, regex))
+    # signed so the values can be negated for a descending sort
+    values = size.astype(np.int64) if order_by == 'size' else atime_cost
+    if after is not None:
+        value, last_path = after
+        last_path = last_path.encode('utf-8', 'surrogateescape')
+        same = np.flatnonzero(mask & (values == value))
+        mask &= values < value
+        for i in same:
+            mask[i] = files.full_path[start + i] > last_path
+    candidates = np.flatnonzero(mask)
+    if len(candidates) > limit:
+        top = np.argpartition(-values[candidates], limit - 1)[:limit]
+        threshold = values[candidates[top]].min()
+        candidates = candidates[values[candidates] >= threshold]
+    # the index order is the path order so a stable sort breaks ties on path
+    order = candidates[np.argsort(-values[candidates], kind='stable')][:limit]
+    data = {
+        'database': database,
+        'path': path,
+        'size': int(size.sum()),
+        'num_files': int(num_files.sum()),
+        'atime_cost': float(atime_cost.sum()),
+        'children': [],
+        'next': None}
+    for i in order:
+        full_path = files.full_path.decode(start + i)
+        data['children'].append({
+            'name': full_path[len(path) + 1:],
+            'full_path': full_path,
+            'size': int(size[i]),
+            'num_files': 1,
+            'atime_cost': float(atime_cost[i]),
+            'user': treemap.get_username(int(files['uid'][start + i])),
+            'atime': int(files['atime'][start + i]),
+            'mtime': int(files['mtime'][start + i])})
+    if len(order) == limit:
+        last = data['children'][-1]
+        data['next'] = (last[order_by], last['full_path'])
+    return data
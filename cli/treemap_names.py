@@ -0,0 +1,314 @@
+'''
+uid and gid to name mapping for the treemap reports
+the whole passwd and group maps are loaded in one go, from nss
+enumeration or ldap, and kept in a json file for NAMES_TTL seconds
+so reports don't do an nss lookup (an ldap round trip on the cluster
+nodes) for every row. the maps can also be published to clickhouse
+as dictionaries so the reports can do the name mapping in the query
+
+run this as a script to refresh the cache file and publish the maps
+'''
+
+import os
+import sys
+import pwd
+import grp
+import json
+import time
+import argparse
+import threading
+
+import treemap_config
+
+# json file the maps are cached in and how many seconds it is used for
+NAMES_CACHE = getattr(
+    treemap_config, 'NAMES_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'treemap_names.json'))
+NAMES_TTL = getattr(treemap_config, 'NAMES_TTL', 24 * 3600)
+
+# read the maps from this ldap server instead of enumerating nss
+# e.g. ldap://ldap.example.org with the base dns to search under
+LDAP_URI = getattr(treemap_config, 'LDAP_URI', None)
+LDAP_USER_BASE = getattr(treemap_config, 'LDAP_USER_BASE', None)
+LDAP_GROUP_BASE = getattr(treemap_config, 'LDAP_GROUP_BASE', None)
+
+# clickhouse database the maps are published to as the user_names and
+# group_names dictionaries. when NAMES_DICTIONARIES is set the reports
+# by user and group get the names from the dictionaries in the query
+NAMES_DATABASE = getattr(treemap_config, 'NAMES_DATABASE', 'treemap_names')
+NAMES_DICTIONARIES = getattr(treemap_config, 'NAMES_DICTIONARIES', False)
+
+# the loaded maps, {'users': {uid: name}, 'groups': {gid: name}}
+# and the reverse maps from names to ids
+NAMES = None
+IDS = None
+
+LOCK = threading.Lock()
+
+
+def from_nss():
+    '''
+    enumerate the passwd and group maps through nss
+    with sssd this needs enumerate = true to see the ldap entries
+    '''
+    users = {}
+    for entry in pwd.getpwall():
+        users.setdefault(entry.pw_uid, entry.pw_name)
+    groups = {}
+    for entry in grp.getgrall():
+        groups.setdefault(entry.gr_gid, entry.gr_name)
+    return users, groups
+
+
+def from_ldap():
+    '''
+    read the posixAccount and posixGroup entries from ldap
+    '''
+    import ldap
+
+    conn = ldap.initialize(LDAP_URI)
+    conn.simple_bind_s()
+    try:
+        users = {}
+        for _, attrs in conn.search_s(
+                LDAP_USER_BASE, ldap.SCOPE_SUBTREE,
+                '(objectClass=posixAccount)', ['uid', 'uidNumber']):
+            users.setdefault(
+                int(attrs['uidNumber'][0]), attrs['uid'][0].decode())
+        groups = {}
+        for _, attrs in conn.search_s(
+                LDAP_GROUP_BASE, ldap.SCOPE_SUBTREE,
+                '(objectClass=posixGroup)', ['cn', 'gidNumber']):
+            groups.setdefault(
+                int(attrs['gidNumber'][0]), attrs['cn'][0].decode())
+    finally:
+        conn.unbind_s()
+    return users, groups
+
+
+def read_cache(path):
+    '''
+    read the maps from the cache file
+    returns None if it is missing, unreadable or too old
+    '''
+    try:
+        with open(path) as cache:
+            data = json.load(cache)
+    except (OSError, ValueError):
+        return None
+    if time.time() - data.get('time', 0) > NAMES_TTL:
+        return None
+    return {
+        'users': {int(uid): name for uid, name in data['users'].items()},
+        'groups': {int(gid): name for gid, name in data['groups'].items()}}
+
+
+def write_cache(path, names):
+    '''
+    write the maps to the cache file
+    written to a temporary file first so readers never see half of it
+    failing to write the cache should never stop a report
+    '''
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as cache:
+            json.dump({
+                'time': int(time.time()),
+                'users': names['users'],
+                'groups': names['groups']}, cache)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def set_names(names):
+    '''
+    make names the current maps
+    '''
+    global NAMES, IDS
+    IDS = {
+        'users': {name: uid for uid, name in names['users'].items()},
+        'groups': {name: gid for gid, name in names['groups'].items()}}
+    NAMES = names
+
+
+def load(refresh=False):
+    '''
+    get the maps, from the cache file if it is fresh enough
+    otherwise from ldap or nss. refresh ignores the cache file
+    '''
+    with LOCK:
+        if NAMES is not None and not refresh:
+            return NAMES
+        names = None if refresh else read_cache(NAMES_CACHE)
+        if names is None:
+            if LDAP_URI is not None:
+                users, groups = from_ldap()
+            else:
+                users, groups = from_nss()
+            names = {'users': users, 'groups': groups}
+            write_cache(NAMES_CACHE, names)
+        set_names(names)
+        return NAMES
+
+
+def remember(kind, number, name):
+    '''
+    add a single lookup to the maps
+    '''
+    with LOCK:
+        NAMES[kind][number] = name
+        IDS[kind][name] = number
+
+
+def username(uid):
+    '''
+    get the username for a uid, the uid as a string if it has none
+    entries missing from an nss enumeration are looked up one by one
+    '''
+    names = load()
+    try:
+        return names['users'][uid]
+    except KeyError:
+        pass
+    try:
+        name = pwd.getpwuid(uid)[0]
+    except (KeyError, TypeError, OverflowError):
+        name = str(uid)
+    remember('users', uid, name)
+    return name
+
+
+def group(gid):
+    '''
+    get the group name for a gid, the gid as a string if it has none
+    '''
+    names = load()
+    try:
+        return names['groups'][gid]
+    except KeyError:
+        pass
+    try:
+        name = grp.getgrgid(gid)[0]
+    except (KeyError, TypeError, OverflowError):
+        name = str(gid)
+    remember('groups', gid, name)
+    return name
+
+
+def uid(name):
+    '''
+    get the uid for a username, the name itself if there is no such user
+    '''
+    load()
+    try:
+        return IDS['users'][name]
+    except KeyError:
+        pass
+    try:
+        number = pwd.getpwnam(name)[2]
+    except KeyError:
+        return name
+    remember('users', number, name)
+    return number
+
+
+def gid(name):
+    '''
+    get the gid for a group name, the name itself if there is no such group
+    '''
+    load()
+    try:
+        return IDS['groups'][name]
+    except KeyError:
+        pass
+    try:
+        number = grp.getgrnam(name)[2]
+    except KeyError:
+        return name
+    remember('groups', number, name)
+    return number
+
+
+def name_expr(column):
+    '''
+    clickhouse expression for the name of the uid or gid column
+    using the published dictionaries, or the column itself if the
+    dictionaries are not being used. ids missing from the dictionary
+    keep their number, as username and group do, rather than all
+    getting the same empty name
+    '''
+    if not NAMES_DICTIONARIES:
+        return column
+    dictionary = {'uid': 'user_names', 'gid': 'group_names'}[column]
+    expr = "dictGetStringOrDefault('{0}.{1}', 'name', toUInt64({2}), toString({2}))"
+    return expr.format(NAMES_DATABASE, dictionary, column)
+
+
+def publish(names):
+    '''
+    load the maps into tables in NAMES_DATABASE and create the
+    user_names and group_names dictionaries over them
+    '''
+    import treemap
+
+    with treemap.POOL.connection(treemap_config.CLICK_HOST, None) as click:
+        click.execute(
+            'create database if not exists {}'.format(NAMES_DATABASE))
+        for table, dictionary, column, rows in (
+                ('users', 'user_names', 'uid', names['users']),
+                ('groups', 'group_names', 'gid', names['groups'])):
+            click.execute('''
+                create table if not exists {0}.{1}
+                ({2} UInt64, name String)
+                engine = MergeTree()
+                order by {2}
+            '''.format(NAMES_DATABASE, table, column))
+            click.execute('truncate table {}.{}'.format(NAMES_DATABASE, table))
+            click.execute(
+                'insert into {}.{} ({}, name) values'.format(
+                    NAMES_DATABASE, table, column),
+                sorted(rows.items()))
+            click.execute('''
+                create dictionary if not exists {0}.{1}
+                ({2} UInt64, name String)
+                primary key {2}
+                source(clickhouse(table '{3}' db '{0}'))
+                layout(hashed())
+                lifetime(min 300 max 3600)
+            '''.format(NAMES_DATABASE, dictionary, column, table))
+            click.execute('system reload dictionary {}.{}'.format(
+                NAMES_DATABASE, dictionary))
+
+
+def get_args():
+    '''
+    parse commandline arguments for refreshing the name maps
+    '''
+    parser = argparse.ArgumentParser(description='''
+        refresh the cached uid and gid to name maps used by treemap''')
+    parser.add_argument(
+        '--publish',
+        help='also publish the maps to clickhouse as dictionaries',
+        action='store_true')
+    parser.set_defaults(publish=False)
+    return parser.parse_args()
+
+
+def main():
+    '''
+    main entry point
+    '''
+    args = get_args()
+    names = load(refresh=True)
+    print('{} users and {} groups cached in {}'.format(
+        len(names['users']), len(names['groups']), NAMES_CACHE))
+    if args.publish:
+        publish(names)
+        print('published to {}'.format(NAMES_DATABASE))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
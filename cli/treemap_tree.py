@@ -0,0 +1,171 @@
+'''
+in-memory directory tree shared by treemap_cmd and treemap_ui
+listings (the get_subdir_data result for a path) are loaded when they
+are first asked for and kept, so going back to a directory that has
+been shown doesn't query again. the number of rows kept is capped and
+the least recently used listings are dropped along with everything
+loaded below them
+'''
+
+import threading
+from collections import OrderedDict
+
+import treemap
+import treemap_config
+
+# maximum number of listing rows (children) to keep in memory
+TREE_MAX_ENTRIES = getattr(treemap_config, 'TREE_MAX_ENTRIES', 200000)
+
+# the sums kept for each directory
+SUMS = ('size', 'num_files', 'atime_cost')
+
+
+def parent_path(path):
+    '''
+    the path of the parent directory, None for the root
+    '''
+    path = path.rstrip('/')
+    if path == '':
+        return None
+    return path.rsplit('/', 1)[0]
+
+
+def is_below(path, ancestor):
+    '''
+    is path somewhere under ancestor
+    '''
+    return path.startswith(ancestor.rstrip('/') + '/')
+
+
+class TreeModel:
+    '''
+    lazily loaded directory tree for one database and set of filters
+
+    load is the function used to get a listing, called as
+    load(database, path, *filters), by default treemap.get_subdir_data.
+    prefetch uses the function underneath its access log decorator so
+    speculative loads don't look like user requests
+    '''
+
+    def __init__(
+            self, database, filters=(None,) * 10, load=None,
+            max_entries=TREE_MAX_ENTRIES):
+        self.database = database
+        self.filters = tuple(filters)
+        self.load = load or treemap.get_subdir_data
+        self.prefetch_load = getattr(self.load, '__wrapped__', self.load)
+        self.max_entries = max_entries
+        self.nodes = OrderedDict()
+        self.entries = 0
+        self.lock = threading.Lock()
+
+    def key(self, path):
+        return path.rstrip('/')
+
+    def peek(self, path):
+        '''
+        the listing for a path if it is loaded, without loading it
+        '''
+        key = self.key(path)
+        with self.lock:
+            data = self.nodes.get(key)
+            if data is not None:
+                self.nodes.move_to_end(key)
+            return data
+
+    def get(self, path):
+        '''
+        the listing for a path, loading it if needed
+        '''
+        data = self.peek(path)
+        if data is None:
+            data = self.load(self.database, self.key(path), *self.filters)
+            self.put(path, data)
+        return data
+
+    def prefetch(self, path):
+        '''
+        load a listing without it counting as a user request
+        '''
+        data = self.peek(path)
+        if data is None:
+            data = self.prefetch_load(
+                self.database, self.key(path), *self.filters)
+            self.put(path, data)
+        return data
+
+    def put(self, path, data):
+        '''
+        add a listing, dropping the least recently used ones
+        (and what is loaded below them) if over the size limit.
+        the new listing and its ancestors are never dropped
+        '''
+        key = self.key(path)
+        with self.lock:
+            if key in self.nodes:
+                self.entries -= len(self.nodes[key]['children']) + 1
+            self.nodes[key] = data
+            self.nodes.move_to_end(key)
+            self.entries += len(data['children']) + 1
+            pinned = set()
+            ancestor = key
+            while ancestor is not None:
+                pinned.add(ancestor)
+                ancestor = parent_path(ancestor)
+            while self.entries > self.max_entries:
+                victim = next(
+                    (node for node in self.nodes if node not in pinned), None)
+                if victim is None:
+                    break
+                self.drop(victim)
+
+    def drop(self, key):
+        '''
+        forget a listing and everything loaded below it
+        must be called with the lock held
+        '''
+        for node in [key] + [
+                node for node in self.nodes if is_below(node, key)]:
+            self.entries -= len(self.nodes.pop(node)['children']) + 1
+
+    def totals(self, path):
+        '''
+        the size, num_files and atime_cost for a path without a query.
+        summed over the children of its listing if that is loaded. a
+        directory that hasn't been listed could have children that
+        aren't loaded, so then its row in the parent's listing is used.
+        None if neither is loaded
+        '''
+        data = self.peek(path)
+        if data is not None:
+            return {
+                name: sum(child[name] for child in data['children'])
+                for name in SUMS}
+        parent = parent_path(path)
+        if parent is None:
+            return None
+        parent_data = self.peek(parent)
+        if parent_data is None:
+            return None
+        child_name = self.key(path).rsplit('/', 1)[-1]
+        for child in parent_data['children']:
+            if child['name'] == child_name:
+                return {name: child[name] for name in SUMS}
+        return None
+
+    def children(self, path):
+        '''
+        the paths of the loaded listing's subdirectories, largest first
+        '''
+        data = self.peek(path)
+        if data is None:
+            return []
+        return [
+            self.key(path) + '/' + child['name']
+            for child in sorted(
+                data['children'], key=lambda k: k['size'], reverse=True)
+            if child['name'] != '*.*']
+
+    def __len__(self):
+        with self.lock:
+            return len(self.nodes)
@@ -1,6 +1,99 @@
 import curses
+import curses.ascii
+from concurrent.futures import Future, ThreadPoolExecutor
 import npyscreen
 import treemap
+import treemap_config
+import treemap_tree
+
+# number of queries the ui runs at the same time for the listings the
+# user asks for and for prefetching
+UI_WORKERS = getattr(treemap_config, 'UI_WORKERS', 2)
+UI_PREFETCH_WORKERS = getattr(treemap_config, 'UI_PREFETCH_WORKERS', 2)
+
+# number of the largest subdirectories of the listing being shown that
+# are loaded in the background so drilling down into them is instant
+UI_PREFETCH = getattr(treemap_config, 'UI_PREFETCH', 3)
+
+# tenths of a second between checks for finished background loads
+UI_POLL = 2
+
+# no filters
+FILTERS = (None,) * 10
+
+
+def sorted_children(data):
+    return sorted(data['children'], key=lambda k: k['size'], reverse=True)
+
+
+# Loads listings into the tree model on background threads so the
+# interface never blocks. Only the latest listing the user asked for is
+# shown, asking for another one or cancelling drops the one still loading.
+# Prefetched listings go into the same tree so opening one of them, or
+# going back to a directory already shown, doesn't need a query.
+class Loader:
+    def __init__(self, database):
+        self.database = database
+        self.tree = treemap_tree.TreeModel(database, FILTERS)
+        self.executor = ThreadPoolExecutor(max_workers=UI_WORKERS)
+        self.prefetch_executor = ThreadPoolExecutor(
+            max_workers=UI_PREFETCH_WORKERS)
+        self.path = None
+        self.future = None
+        self.prefetches = []
+
+    def request(self, path):
+        self.cancel()
+        self.cancel_prefetches()
+        self.path = path
+
+        # listings already in the tree are shown straight away
+        data = self.tree.peek(path)
+        if data is not None:
+            self.future = Future()
+            self.future.set_result(data)
+        else:
+            self.future = self.executor.submit(self.tree.get, path)
+
+    def cancel(self):
+        # a query that has started can't be stopped but its result
+        # is dropped (and still ends up in the cache)
+        if self.future is not None:
+            self.future.cancel()
+        self.path = None
+        self.future = None
+
+    def loading(self):
+        return self.future is not None
+
+    def result(self):
+        # returns the data if the requested listing has finished loading
+        # raises the exception if the query failed
+        if self.future is None or not self.future.done():
+            return None
+        future = self.future
+        self.path = None
+        self.future = None
+        return future.result()
+
+    def prefetch(self, data):
+        # load the largest subdirectories of the listing being shown
+        for path in self.tree.children(data['path'])[:UI_PREFETCH]:
+            if self.tree.peek(path) is None:
+                self.prefetches.append(self.prefetch_executor.submit(
+                    self.tree.prefetch, path))
+
+    def cancel_prefetches(self):
+        for future in self.prefetches:
+            future.cancel()
+        self.prefetches = []
+
+    def shutdown(self):
+        self.cancel()
+        self.cancel_prefetches()
+        self.executor.shutdown(wait=False)
+        self.prefetch_executor.shutdown(wait=False)
+
 
 # This application class serves as a wrapper for the initialization of curses
 # and also manages the actual forms of the application
@@ -8,7 +101,7 @@ import treemap
 class App(npyscreen.NPSAppManaged):
     def onStart(self):
         self.addForm("MAIN", MainForm, name='TreeMap')
- 
+
 # This form class defines the display that will be presented to the user.
 class MainForm(npyscreen.FormBaseNew):
     def create(self):
@@ -16,51 +109,95 @@ class MainForm(npyscreen.FormBaseNew):
             "q": self.quit})
         parent = self.parentApp
         parent.database = treemap.get_database(None)
-        parent.data = treemap.get_subdir_data(
-            parent.database, '/mnt/sit', None, None, None, None,
-            None, None, None, None, None, None)
-        if parent.data['path'] == '':
-            parent.data['path'] = '/'
+        parent.loader = Loader(parent.database)
+        parent.data = {
+            'path': '', 'size': 0, 'num_files': 0, 'atime_cost': 0,
+            'children': []}
         self.database_widget = self.add(npyscreen.TitleFixedText,name='database', value=parent.database)
-        self.path_widget = self.add(npyscreen.TitleFixedText,name='path', value=parent.data['path'])
-        self.size_widget = self.add(
-            npyscreen.TitleFixedText,name='size',
-            value=treemap.get_bytes_str(parent.data['size']))
-        self.num_files_widget = self.add(
-            npyscreen.TitleFixedText,name='num_files',
-            value=treemap.get_num_str(parent.data['num_files']))
-        self.atime_cost_widget = self.add(
-            npyscreen.TitleFixedText,name='atime_cost',
-            value=treemap.get_num_str(parent.data['atime_cost']))
+        self.path_widget = self.add(npyscreen.TitleFixedText,name='path', value='')
+        self.size_widget = self.add(npyscreen.TitleFixedText,name='size', value='')
+        self.num_files_widget = self.add(npyscreen.TitleFixedText,name='num_files', value='')
+        self.atime_cost_widget = self.add(npyscreen.TitleFixedText,name='atime_cost', value='')
+        self.status_widget = self.add(npyscreen.TitleFixedText,name='status', value='')
         self.table_widget = self.add(
             Table,
-            values=sorted(parent.data['children'], key=lambda k: k['size'], reverse=True),
+            values=[],
             rely=8,
             slow_scroll=True)
-        self.editw = 5
+        self.editw = 6
+
+        # check for finished loads between key presses
+        self.keypress_timeout = UI_POLL
+        self.request('/mnt/sit')
 
     def quit(self, *args, **keywords):
+        self.parentApp.loader.shutdown()
         self.parentApp.switchForm(None)
 
+    def request(self, path):
+        loader = self.parentApp.loader
+        loader.request(path)
+        self.set_status('loading {} ... (esc to cancel)'.format(path or '/'))
+
+        # show the totals while the listing loads if they are known
+        totals = loader.tree.totals(path)
+        if totals is not None:
+            self.path_widget.value = path or '/'
+            self.path_widget.display()
+            self.show_totals(totals)
+
+    def cancel(self):
+        loader = self.parentApp.loader
+        if loader.loading():
+            loader.cancel()
+            self.set_status('cancelled')
+
+    def set_status(self, text):
+        self.status_widget.value = text
+        self.status_widget.display()
+
+    def while_waiting(self):
+        loader = self.parentApp.loader
+        if not loader.loading():
+            return
+        path = loader.path
+        try:
+            data = loader.result()
+        except Exception as err:
+            self.set_status('failed to load {} : {}'.format(path or '/', err))
+            return
+        if data is None:
+            return
+        self.parentApp.data = data
+        self.table_widget.values = sorted_children(data)
+        self.table_widget.cursor_line = 0
+        self.table_widget.display()
+        self.update_header()
+        self.set_status('')
+        loader.prefetch(data)
+
     def update_header(self):
         self.database_widget.value = self.parentApp.database
         self.database_widget.display()
-        self.path_widget.value = self.parentApp.data['path']
-        if self.parentApp.data['path'] == '':
-            self.parentApp.data['path'] = '/'
+        # the listing is shared with the tree and the cache so isn't changed
+        self.path_widget.value = self.parentApp.data['path'] or '/'
         self.path_widget.display()
-        self.size_widget.value = treemap.get_bytes_str(self.parentApp.data['size'])
+        self.show_totals(self.parentApp.data)
+
+    def show_totals(self, totals):
+        self.size_widget.value = treemap.get_bytes_str(totals['size'])
         self.size_widget.display()
-        self.num_files_widget.value = treemap.get_num_str(self.parentApp.data['num_files'])
+        self.num_files_widget.value = treemap.get_num_str(totals['num_files'])
         self.num_files_widget.display()
-        self.atime_cost_widget.value = treemap.get_num_str(self.parentApp.data['atime_cost'])
+        self.atime_cost_widget.value = treemap.get_num_str(totals['atime_cost'])
         self.atime_cost_widget.display()
 
 class Table(npyscreen.MultiLineAction):
     def __init__(self, *args, **keywords):
         super(Table, self).__init__(*args, **keywords)
         self.add_handlers({
-            curses.KEY_BACKSPACE: self.move_up})
+            curses.KEY_BACKSPACE: self.move_up,
+            curses.ascii.ESC: self.cancel})
 
     def display_value(self, vl):
         line_format='{:<20s} {:>10s} {:>10s} {:>10s}'
@@ -72,17 +209,9 @@ class Table(npyscreen.MultiLineAction):
 
     def actionHighlighted(self, vl, key_press):
         app = self.parent.parentApp
-        update = False
-        if key_press == curses.ascii.LF:
-            new_path = app.data['path'] + '/' + vl['name']
-            app.data = treemap.get_subdir_data(
-                app.database, new_path, None, None, None, None,
-                None, None, None, None, None, None)
-            update = True
-        if update:
-            self.values=sorted(app.data['children'], key=lambda k: k['size'], reverse=True)
-            self.display()
-            self.parent.update_header()
+        if key_press == curses.ascii.LF and vl['name'] != '*.*':
+            new_path = app.data['path'].rstrip('/') + '/' + vl['name']
+            self.parent.request(new_path)
 
     def move_up(self, *args, **keywords):
         app = self.parent.parentApp
@@ -90,12 +219,10 @@ class Table(npyscreen.MultiLineAction):
         if len(path_bits) == 3:
             return
         new_path = '/'.join(path_bits[:-1])
-        app.data = treemap.get_subdir_data(
-            app.database, new_path, None, None, None, None,
-            None, None, None, None, None, None)
-        self.values=sorted(app.data['children'], key=lambda k: k['size'], reverse=True)
-        self.display()
-        self.parent.update_header()
+        self.parent.request(new_path)
+
+    def cancel(self, *args, **keywords):
+        self.parent.cancel()
 
 if __name__ == '__main__':
     App().run()
@@ -0,0 +1,139 @@
+'''
+warm the treemap cache for a newly loaded database
+replays the most popular requests made against the previous
+database with the same tag from the treemap access log
+'''
+
+import sys
+import json
+import argparse
+import inspect
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import treemap
+import treemap_catalog
+
+# the report functions that are logged and can be replayed
+REPORTS = ('get_subdir_data', 'by_user', 'by_group', 'by_suffix')
+
+
+def get_args():
+    '''
+    parse commandline arguments for the cache warmer
+    '''
+    parser = argparse.ArgumentParser(description='''
+        warm the treemap cache for a new database by replaying the
+        most popular requests made against the previous database''')
+    parser.add_argument(
+        '-d', '--database', required=True,
+        help='the newly loaded database to warm the cache for')
+    parser.add_argument(
+        '-t', '--tag',
+        help='tag of the database, used to find the previous database')
+    parser.set_defaults(tag=treemap.default_tag())
+    parser.add_argument(
+        '--previous',
+        help='database to take the popular requests from.'
+             ' defaults to the one before the new database for the tag')
+    parser.add_argument(
+        '--log',
+        help='access log to read the requests from')
+    parser.set_defaults(log=treemap.ACCESS_LOG)
+    parser.add_argument(
+        '-n', '--num_requests', type=int,
+        help='number of the most popular requests to replay')
+    parser.set_defaults(num_requests=100)
+    parser.add_argument(
+        '-j', '--parallel', type=int,
+        help='number of requests to run at the same time')
+    parser.set_defaults(parallel=4)
+    return parser.parse_args()
+
+
+def popular_requests(log_file, database, num_requests):
+    '''
+    count the requests made against the database in the access log
+    and return the most popular ones as (function, arguments) pairs
+    '''
+    counts = Counter()
+    with open(log_file) as log:
+        for line in log:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('function') not in REPORTS:
+                continue
+            arguments = record.get('args', {})
+            if arguments.get('database') != database:
+                continue
+            arguments.pop('database')
+            key = (record['function'], json.dumps(arguments, sort_keys=True))
+            counts[key] += 1
+    return [
+        (function, json.loads(arguments))
+        for (function, arguments), _ in counts.most_common(num_requests)]
+
+
+def replay(database, function, arguments):
+    '''
+    run a request against the new database
+    the cache keys don't depend on how the arguments are passed
+    so the results are found by the command line tools. calls the function underneath the access log decorator
+    so warming the cache doesn't add to the log
+    '''
+    func = getattr(treemap, function).__wrapped__
+    arguments = dict(arguments, database=database)
+    bound = inspect.signature(func).bind(**arguments)
+    func(*bound.args)
+
+
+def main():
+    '''
+    main entry point
+    '''
+    args = get_args()
+
+    # the top of the tree is always worth having in the cache
+    requests = [('get_subdir_data', {
+        'path': '', 'group': None, 'user': None,
+        'modified_before': None, 'modified_after': None,
+        'accessed_before': None, 'accessed_after': None,
+        'size_less_than': None, 'size_greater_than': None,
+        'suffix': None, 'regex': None})]
+
+    # add the popular requests from the previous database
+    previous = args.previous
+    if previous is None:
+        previous = treemap_catalog.previous(args.tag, args.database)
+    if previous is not None and args.log is not None:
+        print('reading requests made against {} from {}'.format(
+            previous, args.log))
+        try:
+            for request in popular_requests(
+                    args.log, previous, args.num_requests):
+                if request not in requests:
+                    requests.append(request)
+        except OSError as err:
+            print('cannot read access log : {}'.format(err))
+
+    # replay them with bounded parallelism
+    print('warming {} requests for {}'.format(len(requests), args.database))
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+        futures = [
+            executor.submit(replay, args.database, function, arguments)
+            for function, arguments in requests]
+        for (function, arguments), future in zip(requests, futures):
+            try:
+                future.result()
+            except Exception as err:
+                failed += 1
+                print('failed {} {} : {}'.format(function, arguments, err))
+    print('finished with {} failures'.format(failed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,13 +23,76 @@ CREATE TABLE {{ database }}.files
   `mtime_cost` Float64 MATERIALIZED 10.0*(blocks*512/(1024*1024*1024*1024))*(({{ now }}-mtime)/(365*24*3600/12)),
   `ttime_cost` Float64 MATERIALIZED 10.0*(blocks*512/(1024*1024*1024*1024))*(({{ now }}-ttime)/(365*24*3600/12)),
   `atime_days` Int64 MATERIALIZED ({{ now }}-atime)/(24*3600),
-  `mtime_days` Int64 MATERIALIZED ({{ now }}-mtime)/(24*3600)
+  `mtime_days` Int64 MATERIALIZED ({{ now }}-mtime)/(24*3600),
   `ttime_days` Int64 MATERIALIZED ({{ now }}-ttime)/(24*3600)
 )
 ENGINE = MergeTree()
 PARTITION BY (gid,uid)
 ORDER BY (gid,uid,full_path);
 
+CREATE TABLE {{ database }}.files_by_path
+(
+  `full_path` String,
+  `directory` String,
+  `file_name` String,
+  `suffix` String,
+  `mode` UInt16,
+  `size` UInt64,
+  `gid` UInt32,
+  `uid` UInt32,
+  `atime` UInt32,
+  `mtime` UInt32,
+  `depth` UInt64,
+  `blocks` UInt64,
+  `inode` UInt64,
+  `atime_cost` Float64,
+  `mtime_cost` Float64,
+  `atime_days` Int64,
+  `mtime_days` Int64
+)
+ENGINE = MergeTree()
+ORDER BY (full_path);
+
+CREATE MATERIALIZED VIEW {{ database }}.files_by_path_mv TO {{ database }}.files_by_path AS
+SELECT
+  full_path, directory, file_name, suffix, mode, size, gid, uid,
+  atime, mtime, depth, blocks, inode,
+  atime_cost, mtime_cost, atime_days, mtime_days
+FROM {{ database }}.files;
+
+CREATE TABLE {{ database }}.files_sample
+(
+  `sample_key` UInt16,
+  `full_path` String,
+  `directory` String,
+  `file_name` String,
+  `suffix` String,
+  `mode` UInt16,
+  `size` UInt64,
+  `gid` UInt32,
+  `uid` UInt32,
+  `atime` UInt32,
+  `mtime` UInt32,
+  `depth` UInt64,
+  `blocks` UInt64,
+  `inode` UInt64,
+  `atime_cost` Float64,
+  `mtime_cost` Float64,
+  `atime_days` Int64,
+  `mtime_days` Int64
+)
+ENGINE = MergeTree()
+ORDER BY (sample_key,full_path);
+
+CREATE MATERIALIZED VIEW {{ database }}.files_sample_mv TO {{ database }}.files_sample AS
+SELECT
+  intHash32(inode) % 1000 AS sample_key,
+  full_path, directory, file_name, suffix, mode, size, gid, uid,
+  atime, mtime, depth, blocks, inode,
+  atime_cost, mtime_cost, atime_days, mtime_days
+FROM {{ database }}.files
+WHERE intHash32(inode) % 1000 < 100;
+
 CREATE TABLE {{ database }}.directories
 (
   `full_path` String,
@@ -77,3 +140,33 @@ CREATE TABLE {{ database }}.symlinks
 ENGINE = MergeTree()
 PARTITION BY (gid,uid)
 ORDER BY (gid,uid,full_path);
+
+CREATE TABLE {{ database }}.rollup
+(
+  `ancestor` String,
+  `depth` UInt64,
+  `gid` UInt32,
+  `uid` UInt32,
+  `suffix` String,
+  `total_size` UInt64,
+  `total_num` UInt64,
+  `total_atime_cost` Float64,
+  `total_mtime_cost` Float64
+)
+ENGINE = SummingMergeTree((total_size, total_num, total_atime_cost, total_mtime_cost))
+ORDER BY (ancestor, gid, uid, suffix);
+
+CREATE MATERIALIZED VIEW {{ database }}.rollup_mv TO {{ database }}.rollup AS
+SELECT
+  arrayStringConcat(arraySlice(splitByChar('/', directory), 1, n), '/') AS ancestor,
+  n - 1 AS depth,
+  gid,
+  uid,
+  suffix,
+  sum(blocks*512) AS total_size,
+  count(*) AS total_num,
+  sum(atime_cost) AS total_atime_cost,
+  sum(mtime_cost) AS total_mtime_cost
+FROM {{ database }}.files
+ARRAY JOIN range(1, length(splitByChar('/', directory)) + 1) AS n
+GROUP BY ancestor, depth, gid, uid, suffix;
@@ -17,24 +17,11 @@ printf -v j "%0{{ digits }}d" $SLURM_ARRAY_TASK_ID
 echo `date "+%Y-%m-%d %T"` starting load $j on $HOSTNAME
 
 # change to the input directory
-cd {{ data_dir }}
+cd {{ batch_run_dir }}
 
-# insert the inode data using the clickhouse client command line tool
-# uses pattern for looping over tuples
-# https://stackoverflow.com/questions/9713104/loop-over-tuples-in-bash
-IFS="",
-for tuple in f,files,  d,directories,  l,symlinks
-    do
-        set -- $tuple
-
-        # get the data file
-        DATA_FILE="{{ batch_run_dir }}/${j}_${1}.out.gz" 
-        echo `date "+%Y-%m-%d %T"` inserting $DATA_FILE
-
-        # insert the inode data using the clickhouse client command line tool
-        zcat $DATA_FILE | clickhouse-client --host {{ click_host }}  --query "INSERT INTO {{ database }}.$2 FORMAT Protobuf SETTINGS format_schema='{{ mpistat_home }}/src/mpistat.proto3:MpistatMsg'" --compression 1
-
-    done
+# decode the collector output for this rank and insert it in parallel
+# blocks already loaded by an earlier attempt are skipped
+python {{ mpistat_home }}/bin/mpistat_click_load.py --database {{ database }} --batch_run_dir {{ batch_run_dir }} --rank $j --parallel {{ click_load_parallel }} || exit 1
 
 # finish message
 echo `date "+%Y-%m-%d %T"` finished load $j
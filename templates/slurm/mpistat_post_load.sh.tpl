@@ -0,0 +1,28 @@
+#!/bin/bash
+
+##################
+# slurm settings #
+##################
+#SBATCH --output={{ batch_run_dir }}/mpistat_post_load.sh.o%j
+#SBATCH --error={{ batch_run_dir }}/mpistat_post_load.sh.e%j
+#SBATCH --time=120
+#SBATCH --qos= *** change me !!! ***
+#SBATCH --mem=4096
+
+#############################################
+# environment is set by the pipeline runner #
+#############################################
+
+# start message
+echo `date "+%Y-%m-%d %T"` starting post load on $HOSTNAME
+
+# mark the database as loaded in the catalog so treemap starts using it
+cd {{ mpistat_home }}/cli
+python treemap_catalog.py --mark_loaded {{ database }}
+
+# replay the most popular treemap requests against the new database
+# so the cache is hot before users get to it
+python treemap_warm.py --database {{ database }} --tag {{ tag }} --num_requests {{ warm_num_requests }} --parallel {{ warm_parallel }}
+
+# finish message
+echo `date "+%Y-%m-%d %T"` finished post load
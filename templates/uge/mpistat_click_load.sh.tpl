@@ -18,6 +18,13 @@
 # where to send stderr
 #$ -e {{ batch_run_dir }}
 
+# set environment variables
+export MPISTAT_HOME={{ mpistat_home }}
+export PYTHON_HOME={{ python_home }}
+export GCC_LIBS={{ gcc_libs }}
+export PATH=$PYTHON_HOME/bin:$PATH
+export LD_LIBRARY_PATH=$PYTHON_HOME/lib:$GCC_LIBS:$LD_LIBRARY_PATH
+
 # get the task id in the right format
 i=$(expr $SGE_TASK_ID - 1)
 printf -v j "%0{{ digits }}d" $i
@@ -27,21 +34,8 @@ printf "%(%Y-%m-%d %T)T %s\n" -1 "starting task $j"
 # change to the input directory
 cd {{ batch_run_dir }}
 
-# insert the inode data using the clickhouse client command line tool
-# uses pattern for looping over tuples
-# https://stackoverflow.com/questions/9713104/loop-over-tuples-in-bash
-IFS="",
-for tuple in f,files,  d,directories,  l,symlinks
-do
-    set -- $tuple
-
-    # get the data file
-    DATA_FILE="{{ batch_run_dir }}/${j}_${1}.out.gz"
-
-    printf "%(%Y-%m-%d %T)T %s\n" -1 "inserting $DATA_FILE"
-
-    # insert the inode data using the clickhouse client command line tool
-    zcat $DATA_FILE | clickhouse-client --host {{ click_host }}  --query "INSERT INTO {{ database }}.$2 FORMAT Protobuf SETTINGS format_schema='{{ mpistat_home }}/src/mpistat.proto3:MpistatMsg'" --compression 1
+# decode the collector output for this rank and insert it in parallel
+# blocks already loaded by an earlier attempt are skipped
+python {{ mpistat_home }}/bin/mpistat_click_load.py --database {{ database }} --batch_run_dir {{ batch_run_dir }} --rank $j --parallel {{ click_load_parallel }} || exit 1
 
-done
 printf "%(%Y-%m-%d %T)T %s\n" -1 "finished task $j"
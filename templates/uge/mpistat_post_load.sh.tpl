@@ -0,0 +1,35 @@
+#!/bin/bash
+
+# which queue
+#$ -q *** change me ***
+
+# set time limit
+#$ -l s_rt=02:00:00
+#$ -l h_rt=02:00:00
+
+# where to send stdout
+#$ -o {{ batch_run_dir }}
+
+# where to send stderr
+#$ -e {{ batch_run_dir }}
+
+# set environment variables
+export MPISTAT_HOME={{ mpistat_home }}
+export PYTHON_HOME={{ python_home }}
+export GCC_LIBS={{ gcc_libs }}
+export PATH=$PYTHON_HOME/bin:$PATH
+export LD_LIBRARY_PATH=$PYTHON_HOME/lib:$GCC_LIBS:$LD_LIBRARY_PATH
+
+# start message
+echo `date "+%Y-%m-%d %T"` starting post load on $HOSTNAME
+
+# mark the database as loaded in the catalog so treemap starts using it
+cd {{ mpistat_home }}/cli
+python treemap_catalog.py --mark_loaded {{ database }}
+
+# replay the most popular treemap requests against the new database
+# so the cache is hot before users get to it
+python treemap_warm.py --database {{ database }} --tag {{ tag }} --num_requests {{ warm_num_requests }} --parallel {{ warm_parallel }}
+
+# finish message
+echo `date "+%Y-%m-%d %T"` finished post load on $HOSTNAME
@@ -0,0 +1,56 @@
+'''
+the tools are scripts in bin and cli that import their neighbours,
+so put both directories on the path for the tests. the cli modules
+need a treemap_config, the example one is used if there isn't one
+'''
+
+import os
+import sys
+import importlib.util
+
+import pytest
+
+HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME, 'cli'))
+sys.path.insert(0, os.path.join(HOME, 'bin'))
+
+if importlib.util.find_spec('treemap_config') is None:
+    spec = importlib.util.spec_from_loader(
+        'treemap_config', loader=None,
+        origin=os.path.join(HOME, 'cli', 'treemap_config.py.example'))
+    treemap_config = importlib.util.module_from_spec(spec)
+    with open(spec.origin) as config:
+        exec(config.read(), treemap_config.__dict__)
+    sys.modules['treemap_config'] = treemap_config
+
+
+class Memcached:
+    '''
+    a dict standing in for memcached
+    '''
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, time=0):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+@pytest.fixture
+def memcached(monkeypatch):
+    '''
+    turn the cache on with an empty in-process cache and a fake memcached
+    '''
+    import treemap_cache
+
+    monkeypatch.setattr(treemap_cache, 'ENABLED', True)
+    monkeypatch.setattr(treemap_cache, 'MEMCACHED', Memcached())
+    monkeypatch.setattr(treemap_cache, 'LRU', treemap_cache.LRUCache(10))
+    monkeypatch.setattr(treemap_cache, 'GENERATIONS', {})
+    return treemap_cache.MEMCACHED
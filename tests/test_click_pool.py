@@ -0,0 +1,39 @@
+'''
+check that a client freed for one database goes to a thread waiting
+for that database when threads are waiting for others too
+'''
+
+import time
+import threading
+
+import click_pool
+
+
+class Client:
+
+    def disconnect(self):
+        pass
+
+
+def test_release_wakes_the_right_waiter(monkeypatch):
+    pool = click_pool.ClickPool(max_size=1)
+    monkeypatch.setattr(pool, 'new_client', lambda host, database: Client())
+    first = pool.acquire('host', 'first')
+    pool.acquire('host', 'second')
+    got = {}
+
+    def wait(database):
+        got[database] = pool.acquire('host', database)
+
+    # the thread waiting on second is the first in the queue
+    threads = []
+    for database in ('second', 'first'):
+        thread = threading.Thread(target=wait, args=(database,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.1)
+
+    pool.release('host', 'first', first)
+    threads[1].join(2)
+    assert got.get('first') is first
+    assert 'second' not in got
@@ -0,0 +1,157 @@
+'''
+check the numpy decoder in bin/mpistat_pb.py against the protobuf runtime
+'''
+
+import os
+import re
+import gzip
+import random
+
+import numpy as np
+import pytest
+
+import mpistat_pb
+
+descriptor_pb2 = pytest.importorskip('google.protobuf.descriptor_pb2')
+from google.protobuf import descriptor_pool, message_factory
+from google.protobuf.internal.encoder import _VarintBytes
+
+PROTO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'src', 'mpistat.proto3')
+
+TYPES = {
+    'bytes': descriptor_pb2.FieldDescriptorProto.TYPE_BYTES,
+    'uint32': descriptor_pb2.FieldDescriptorProto.TYPE_UINT32,
+    'uint64': descriptor_pb2.FieldDescriptorProto.TYPE_UINT64}
+
+
+def message_class():
+    '''
+    the MpistatMsg class built from src/mpistat.proto3 without protoc
+    '''
+    proto = descriptor_pb2.FileDescriptorProto(
+        name='test_mpistat.proto', syntax='proto3')
+    message = proto.message_type.add(name='MpistatMsg')
+    with open(PROTO) as proto_file:
+        for kind, name, number in re.findall(
+                r'(\w+)\s+(\w+)\s*=\s*(\d+);', proto_file.read()):
+            message.field.add(
+                name=name, number=int(number), type=TYPES[kind],
+                label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL)
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(proto)
+    return message_factory.GetMessageClass(
+        pool.FindMessageTypeByName('MpistatMsg'))
+
+
+MpistatMsg = message_class()
+
+
+def random_message(rand):
+    '''
+    a message with random values, some left at their default
+    '''
+    msg = MpistatMsg()
+    name = ''.join(rand.choice('abc.é/') for _ in range(rand.randint(0, 300)))
+    msg.full_path = name.encode('utf-8')
+    msg.directory = msg.full_path[:rand.randint(0, 10)]
+    msg.file_name = msg.full_path[-rand.randint(0, 10):]
+    msg.suffix = rand.choice([b'', b'txt', b'bam'])
+    msg.suffix_class = rand.choice([b'', b'text'])
+    for name, _, dtype in mpistat_pb.FIELDS:
+        if dtype is None or rand.random() < 0.2:
+            continue
+        bits = 32 if dtype == np.uint32 else 64
+        setattr(msg, name, rand.choice([
+            0, 1, 127, 128, 2**bits - 1, rand.getrandbits(bits)]))
+    return msg
+
+
+def write_messages(path, messages):
+    with gzip.open(path, 'wb') as out:
+        for msg in messages:
+            body = msg.SerializeToString()
+            out.write(_VarintBytes(len(body)) + body)
+
+
+def read_all(path, batch_size):
+    rows = []
+    for batch in mpistat_pb.read_batches(path, batch_size):
+        columns = [
+            batch[name] if name in mpistat_pb.BYTES_FIELDS
+            else batch[name].tolist()
+            for name in mpistat_pb.FIELD_NAMES]
+        rows.extend(zip(*columns))
+    return rows
+
+
+@pytest.mark.parametrize('batch_size,chunk_size', [
+    (100000, 16 * 1024 * 1024), (7, 1000), (1, 1)])
+def test_matches_protobuf(tmp_path, monkeypatch, batch_size, chunk_size):
+    monkeypatch.setattr(mpistat_pb, 'CHUNK_SIZE', chunk_size)
+    rand = random.Random(batch_size)
+    messages = [random_message(rand) for _ in range(500)]
+    messages.append(MpistatMsg())
+    path = str(tmp_path / '0_f.out.gz')
+    write_messages(path, messages)
+    expected = [
+        tuple(getattr(msg, name) for name in mpistat_pb.FIELD_NAMES)
+        for msg in messages]
+    assert read_all(path, batch_size) == expected
+
+
+def test_batches_and_fields(tmp_path):
+    rand = random.Random(1)
+    path = str(tmp_path / '0_f.out.gz')
+    write_messages(path, [random_message(rand) for _ in range(25)])
+    batches = list(mpistat_pb.read_batches(path, 10, fields=('uid', 'suffix')))
+    assert [len(batch['uid']) for batch in batches] == [10, 10, 5]
+    assert set(batches[0]) == {'uid', 'suffix'}
+    assert batches[0]['uid'].dtype == np.uint32
+
+
+def test_encode_message_parses():
+    row = {
+        'full_path': b'/a/b.txt', 'suffix': b'txt', 'uid': 1000,
+        'size': 2**40, 'inode': 2**64 - 1}
+    data = mpistat_pb.encode_message(row)
+    length, start = mpistat_pb.read_varint(data, 0)
+    msg = MpistatMsg.FromString(data[start:start + length])
+    for name, value in row.items():
+        assert getattr(msg, name) == value
+
+
+def test_unknown_fields_are_skipped(tmp_path):
+    msg = MpistatMsg(full_path=b'/x', uid=5)
+    body = msg.SerializeToString()
+    body += _VarintBytes(20 << 3) + _VarintBytes(300)
+    body += _VarintBytes(21 << 3 | 2) + _VarintBytes(3) + b'abc'
+    path = str(tmp_path / '0_f.out.gz')
+    with gzip.open(path, 'wb') as out:
+        out.write(_VarintBytes(len(body)) + body)
+    (row,) = read_all(path, 10)
+    assert row[0] == b'/x'
+    assert row[mpistat_pb.FIELD_NAMES.index('uid')] == 5
+
+
+def test_truncated_file(tmp_path):
+    path = str(tmp_path / '0_f.out.gz')
+    write_messages(path, [MpistatMsg(full_path=b'/x' * 50)])
+    with gzip.open(path, 'rb') as data:
+        whole = data.read()
+    with gzip.open(path, 'wb') as out:
+        out.write(whole[:-3])
+    with pytest.raises(mpistat_pb.DecodeError):
+        read_all(path, 10)
+
+
+@pytest.mark.parametrize('body', [
+    _VarintBytes(10 << 3 | 2) + _VarintBytes(1) + b'x',
+    _VarintBytes(1 << 3 | 2) + _VarintBytes(5) + b'x'])
+def test_bad_message(tmp_path, body):
+    path = str(tmp_path / '0_f.out.gz')
+    with gzip.open(path, 'wb') as out:
+        out.write(_VarintBytes(len(body)) + body)
+    with pytest.raises(mpistat_pb.DecodeError):
+        read_all(path, 10)
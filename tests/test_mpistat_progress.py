@@ -0,0 +1,36 @@
+'''
+check that the progress log is read a block at a time without losing lines
+'''
+
+import pytest
+
+pytest.importorskip('matplotlib')
+
+import mpistat_progress
+
+
+def progress_line(timestamp, processed):
+    return '{}:0:libcircle/token.c:207:Objects processed: {} ...\n'.format(
+        timestamp, processed)
+
+
+@pytest.mark.parametrize('read_bytes', [1, 7, 4096])
+def test_log_tail(tmp_path, monkeypatch, read_bytes):
+    monkeypatch.setattr(mpistat_progress, 'READ_BYTES', read_bytes)
+    log = tmp_path / 'mpistat_collector.sh.o1'
+    lines = ['starting on nöde ☃\n']
+    lines += [progress_line(1000 + num, num * 10) for num in range(100)]
+    text = ''.join(lines)
+
+    # the last line is still being written
+    log.write_bytes(text.encode('utf-8') + progress_line(2000, 5)[:20].encode())
+    tail = mpistat_progress.LogTail(str(log))
+    assert list(tail.read()) == [(1000 + num, num * 10) for num in range(100)]
+    assert not tail.finished
+
+    with open(str(log), 'ab') as out:
+        out.write(progress_line(2000, 5)[20:].encode())
+        out.write(mpistat_progress.FINISHED.encode() + b'\n')
+    assert list(tail.read()) == [(2000, 5)]
+    assert tail.finished
+    assert list(tail.read()) == []
@@ -0,0 +1,46 @@
+'''
+check that importing treemap_cmd stays cheap, every treemap command
+pays for it even when the answer comes from the cache
+'''
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+# the same budget as bench/mpistat_bench.py --startup_budget
+STARTUP_BUDGET = 0.25
+
+# imported when they are first needed rather than at startup
+LAZY = ('clickhouse_driver', 'dateparser', 'memcache', 'numpy')
+
+HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK = '''
+import sys
+import treemap_cmd
+print(','.join(name for name in {!r} if name in sys.modules))
+'''.format(LAZY)
+
+
+def run(tmp_path, code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [str(tmp_path), os.path.join(HOME, 'cli')]))
+    return subprocess.run(
+        [sys.executable, '-c', code], env=env, cwd=str(tmp_path),
+        stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+
+
+def test_import_is_lazy_and_fast(tmp_path):
+    shutil.copy(
+        os.path.join(HOME, 'cli', 'treemap_config.py.example'),
+        str(tmp_path / 'treemap_config.py'))
+    assert run(tmp_path, CHECK).strip() == ''
+
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        run(tmp_path, 'import treemap_cmd')
+        times.append(time.perf_counter() - start)
+    assert min(times) < STARTUP_BUDGET
@@ -0,0 +1,86 @@
+'''
+check the pages of top_files can be walked with the --after key
+'''
+
+import os
+import json
+import shlex
+import argparse
+
+import numpy as np
+import pytest
+
+import mpistat_columnar
+import treemap_cmd
+import treemap_local
+
+# ties on size so the pages have to be split on the path, and names
+# that need quoting when the key is printed for the shell
+SIZES = [4096, 4096, 512, 4096, 512, 8192, 4096, 512, 4096, 512]
+NAMES = [
+    "it's.txt", 'a,b.txt', 'space name.txt', 'plain.txt', '$HOME.txt',
+    'x.txt', "q'q,1.txt", 'é.txt', 'back\\slash.txt', 'z.txt']
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    '''
+    a local snapshot of the files under /lustre/scratch
+    '''
+    paths = [
+        '/lustre/scratch/{}'.format(name).encode('utf-8') for name in NAMES]
+    count = len(paths)
+    ints = {
+        'uid': np.zeros(count, dtype=np.uint64),
+        'gid': np.zeros(count, dtype=np.uint64),
+        'atime': np.full(count, 1000000, dtype=np.uint64),
+        'mtime': np.full(count, 1000000, dtype=np.uint64),
+        'size': np.array(SIZES, dtype=np.uint64),
+        'blocks': np.array(SIZES, dtype=np.uint64) // 512,
+        'depth': np.full(count, 3, dtype=np.uint64),
+        'suffix': np.zeros(count, dtype=np.int32)}
+    order = sorted(range(count), key=paths.__getitem__)
+    mpistat_columnar.write_table(str(tmp_path / 'files'), paths, ints, order)
+    mpistat_columnar.write_table(
+        str(tmp_path / 'directories'), [b'/lustre/scratch'],
+        {'depth': np.array([2], dtype=np.uint64)}, [0])
+    with open(os.path.join(str(tmp_path), 'meta.json'), 'w') as meta:
+        json.dump({
+            'now': 2000000, 'num_files': count, 'num_directories': 1,
+            'suffixes': ['txt']}, meta)
+    return str(tmp_path)
+
+
+def page(snapshot, limit, after):
+    return treemap_local.top_files(
+        snapshot, '/lustre/scratch', *(None,) * 10, 'size', limit, after)
+
+
+@pytest.mark.parametrize('limit', [1, 3, 4, 10])
+def test_pages_cover_every_file_once(snapshot, limit):
+    names = []
+    after = None
+    while True:
+        data = page(snapshot, limit, after)
+        names += [child['name'] for child in data['children']]
+        if data['next'] is None:
+            break
+        after = data['next']
+    expected = sorted(
+        zip(SIZES, NAMES), key=lambda row: (-row[0], row[1].encode('utf-8')))
+    assert names == [name for _, name in expected]
+
+
+def test_printed_key_gets_the_next_page(snapshot, capsys):
+    # the last file of the first page has a quote and a comma in its name
+    data = page(snapshot, 6, None)
+    assert data['next'] == (4096, "/lustre/scratch/q'q,1.txt")
+    treemap_cmd.print_files_table(data, 'size', 21, 6)
+    hint = capsys.readouterr().out.strip().splitlines()[-1]
+    assert hint.startswith('next 6 files: --after ')
+
+    # what the shell would pass back to treemap_cmd
+    after = shlex.split(hint.split(': ', 1)[1])[1]
+    after = treemap_cmd.parse_after(argparse.ArgumentParser(), after)
+    assert after == data['next']
+    assert page(snapshot, 6, after)['children'][0]['name'] == '$HOME.txt'
@@ -0,0 +1,40 @@
+'''
+check that a new process can answer from memcached without asking
+clickhouse for the database generation
+'''
+
+import treemap_cache
+
+
+def test_generation_shared_through_memcached(memcached, monkeypatch):
+    lookups = []
+
+    def load_generation(database):
+        lookups.append(database)
+        return 'gen'
+    assert treemap_cache.get_generation(load_generation, 'scratch') == 'gen'
+
+    # a new process
+    monkeypatch.setattr(treemap_cache, 'GENERATIONS', {})
+    assert treemap_cache.get_generation(load_generation, 'scratch') == 'gen'
+    assert lookups == ['scratch']
+
+    # a load finishing makes the next process ask again
+    treemap_cache.forget_generation('scratch')
+    assert treemap_cache.get_generation(load_generation, 'scratch') == 'gen'
+    assert lookups == ['scratch', 'scratch']
+
+
+def test_cached_call_from_memcached_alone(memcached, monkeypatch):
+    calls = []
+
+    @treemap_cache.cached(lambda database: calls.append('generation') or 'gen')
+    def report(database, path):
+        calls.append('report')
+        return {'path': path}
+
+    assert report('scratch', '/lustre') == {'path': '/lustre'}
+    monkeypatch.setattr(treemap_cache, 'GENERATIONS', {})
+    monkeypatch.setattr(treemap_cache, 'LRU', treemap_cache.LRUCache(10))
+    assert report('scratch', '/lustre') == {'path': '/lustre'}
+    assert calls == ['generation', 'report']
@@ -0,0 +1,85 @@
+'''
+check that a process picks up new loads from the catalog and only
+offers finished loads by default
+'''
+
+import argparse
+
+import pytest
+
+import treemap_cache
+import treemap_catalog
+import treemap_cmd
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    '''
+    build the catalog from a list instead of the system tables
+    '''
+    monkeypatch.setattr(treemap_cache, 'ENABLED', False)
+    monkeypatch.setattr(treemap_catalog, 'CATALOG', None)
+    monkeypatch.setattr(treemap_catalog, 'CATALOG_TIME', 0)
+    entries = []
+    monkeypatch.setattr(treemap_catalog, 'build', lambda: list(entries))
+    return entries
+
+
+def entry(name, loaded):
+    tag, date = treemap_catalog.parse_name(name)
+    return {'name': name, 'tag': tag, 'date': date, 'loaded': loaded}
+
+
+def test_new_loads_are_seen(catalog, monkeypatch):
+    catalog.append(entry('scratch_2024_01_01', True))
+    assert treemap_catalog.latest('scratch') == 'scratch_2024_01_01'
+    catalog.insert(0, entry('scratch_2024_01_08', True))
+
+    # the copy is kept for CATALOG_CHECK seconds then read again
+    assert treemap_catalog.latest('scratch') == 'scratch_2024_01_01'
+    monkeypatch.setattr(treemap_catalog, 'CATALOG_TIME', 0)
+    assert treemap_catalog.latest('scratch') == 'scratch_2024_01_08'
+
+
+def test_newest_skips_unfinished_loads(catalog):
+    catalog.extend([
+        entry('scratch_2024_01_15', False),
+        entry('scratch_2024_01_08', True),
+        entry('scratch_2024_01_01', True)])
+    assert treemap_catalog.newest('scratch', 2) == [
+        'scratch_2024_01_08', 'scratch_2024_01_01']
+
+
+def test_newest_without_post_load_job(catalog):
+    catalog.extend([
+        entry('scratch_2024_01_08', False),
+        entry('scratch_2024_01_01', False)])
+    assert treemap_catalog.newest('scratch', 1) == ['scratch_2024_01_08']
+
+
+def test_find_reads_again_on_a_miss(catalog):
+    catalog.append(entry('scratch_2024_01_01', True))
+    assert treemap_catalog.find('scratch_2024_01_08') is None
+    catalog.insert(0, entry('scratch_2024_01_08', False))
+    assert treemap_catalog.find('scratch_2024_01_08')['loaded'] is False
+
+
+def command_args(**values):
+    settings = dict(
+        list_databases=False, database=None, diff=False, tag='scratch')
+    settings.update(values)
+    return argparse.Namespace(**settings)
+
+
+def test_command_databases_from_catalog(catalog, monkeypatch):
+    catalog.extend([
+        entry('scratch_2024_01_08', False),
+        entry('scratch_2024_01_01', True)])
+    monkeypatch.setattr(treemap_catalog.treemap, 'list_databases', None)
+    assert treemap_cmd.get_databases(command_args()) == 'scratch_2024_01_01'
+    assert treemap_cmd.get_databases(command_args(
+        database=['scratch_2024_01_08'])) == 'scratch_2024_01_08'
+    with pytest.raises(SystemExit, match='no such database other'):
+        treemap_cmd.get_databases(command_args(database=['other']))
+    with pytest.raises(SystemExit, match='no databases with tag lustre'):
+        treemap_cmd.get_databases(command_args(tag='lustre'))
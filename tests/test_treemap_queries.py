@@ -0,0 +1,115 @@
+'''
+check the queries the reports build from their arguments
+'''
+
+import pytest
+
+import treemap
+import treemap_cache
+
+
+class Ran(Exception):
+    '''
+    raised by the fake execute once a report has got as far as a query
+    '''
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    '''
+    record the queries instead of running them
+    '''
+    monkeypatch.setattr(treemap_cache, 'ENABLED', False)
+    monkeypatch.setattr(treemap, 'use_rollup', lambda *args: False)
+    monkeypatch.setattr(treemap, 'files_table', lambda *args: 'files')
+    calls = []
+
+    def execute(database, qry):
+        calls.append(qry)
+        raise Ran()
+    monkeypatch.setattr(treemap, 'execute', execute)
+    return calls
+
+
+def filters(**values):
+    names = (
+        'group', 'user',
+        'modified_before', 'modified_after', 'accessed_before',
+        'accessed_after', 'size_less_than', 'size_greater_than',
+        'suffix', 'regex')
+    return [values.get(name) for name in names]
+
+
+def test_strings_are_escaped():
+    qry = treemap.filter_qry(*filters(
+        suffix="gz' or 1=1 --", regex='\\\\.txt$'))
+    assert "suffix='gz\\' or 1=1 --'" in qry
+    assert "match(full_path,'\\\\\\\\.txt$')" in qry
+
+
+def test_unknown_ids_match_nothing():
+    qry = treemap.filter_qry(*filters(user='0 or 1=1', group='1234'))
+    assert ' and uid=null' in qry
+    assert ' and gid=1234' in qry
+
+
+def test_path_is_escaped(queries):
+    with pytest.raises(Ran):
+        treemap.by_suffix.__wrapped__(
+            'scratch', "/lustre/x' or '1'='1", *filters(regex='a{2}'),
+            order_by='size', limit=10)
+    assert "full_path like '/lustre/x\\' or \\'1\\'=\\'1/%'" in queries[0]
+    assert "match(full_path,'a{2}')" in queries[0]
+
+
+def test_top_files_after_is_escaped(queries, monkeypatch):
+    monkeypatch.setattr(treemap, 'subtree_sums', lambda *args: (0, 0, 0))
+    with pytest.raises(Ran):
+        treemap.top_files.__wrapped__(
+            'scratch', '/lustre', *filters(), order_by='size', limit=10,
+            after=(4096, "/lustre/it's{0}.txt"))
+    assert (
+        " and (blocks*512 < 4096 or (blocks*512 = 4096 and"
+        " full_path > '/lustre/it\\'s{0}.txt'))") in queries[0]
+
+
+def test_crosstab_dimensions(queries):
+    with pytest.raises(Ran):
+        treemap.crosstab.__wrapped__(
+            'scratch', '/lustre', 'subdir', 'suffix', *filters(),
+            order_by='size', limit=10, num_columns=5)
+    assert "splitByChar('/', full_path)[3])) as row_key" in queries[0]
+    assert 'toNullable(suffix) as column_key' in queries[0]
+
+
+def test_sample_reads_files_sample(monkeypatch):
+    '''
+    --fast reads a range of files_sample and keeps the subdirectories
+    that had no files in the sample
+    '''
+    monkeypatch.setattr(treemap_cache, 'ENABLED', False)
+    monkeypatch.setattr(treemap, 'use_rollup', lambda *args: False)
+    monkeypatch.setattr(treemap, 'TABLES', {('scratch', 'files_sample'): True})
+    queries = []
+
+    def execute(database, qry):
+        queries.append(qry)
+        if 'from directories' in qry:
+            return [('/lustre/big',), ('/lustre/small',)]
+        # name, sums and the sums of the squares
+        return [('*.*', 512, 1, 1.0, 512.0 ** 2, 1.0), ('big', 5120, 2, 2.0,
+                 2 * 2560.0 ** 2, 2.0)]
+    monkeypatch.setattr(treemap, 'execute', execute)
+
+    data = treemap.get_subdir_data.__wrapped__(
+        'scratch', '/lustre', *filters(regex='x'), sample=0.0123)
+    assert 'from files_sample prewhere sample_key < 12' in queries[0]
+    assert data['sample'] == 0.012
+    assert data['num_files'] == 250
+    small = [child for child in data['children'] if child['name'] == 'small']
+    assert small == [{
+        'name': 'small', 'size': 0, 'num_files': 0, 'atime_cost': 0,
+        'unsampled': True}]
+
+    # more than files_sample keeps reads all of it
+    assert treemap.sampling('scratch', 0.5) == 0.1
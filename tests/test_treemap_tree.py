@@ -0,0 +1,74 @@
+'''
+check the tree model keeps listings, derives totals from what is
+loaded and drops the least recently used listings
+'''
+
+import treemap_tree
+
+
+def listing(path, children):
+    '''
+    a listing as get_subdir_data makes it
+    '''
+    children = [
+        {'name': name, 'size': size, 'num_files': num_files,
+         'atime_cost': atime_cost}
+        for name, size, num_files, atime_cost in children]
+    data = {'path': path, 'children': children}
+    for name in treemap_tree.SUMS:
+        data[name] = sum(child[name] for child in children)
+    return data
+
+
+LISTINGS = {
+    '/lustre': listing('/lustre', [
+        ('scratch', 300, 3, 30), ('*.*', 5, 1, 1)]),
+    '/lustre/scratch': listing('/lustre/scratch', [
+        ('team1', 100, 1, 10), ('team2', 200, 2, 20)])}
+
+
+def make_tree(max_entries=100):
+    loads = []
+
+    def load(database, path, *filters):
+        loads.append(path)
+        return LISTINGS[path]
+    return treemap_tree.TreeModel('db', load=load, max_entries=max_entries), loads
+
+
+def test_listings_are_kept():
+    tree, loads = make_tree()
+    tree.get('/lustre/scratch/')
+    tree.get('/lustre/scratch')
+    assert loads == ['/lustre/scratch']
+
+
+def test_totals_from_children():
+    tree, loads = make_tree()
+    assert tree.totals('/lustre') is None
+    tree.get('/lustre')
+    assert tree.totals('/lustre') == {
+        'size': 305, 'num_files': 4, 'atime_cost': 31}
+
+    # not listed yet so from its row in the parent
+    assert tree.totals('/lustre/scratch') == {
+        'size': 300, 'num_files': 3, 'atime_cost': 30}
+    assert tree.totals('/lustre/scratch/team1') is None
+    tree.get('/lustre/scratch')
+    assert tree.totals('/lustre/scratch/team1') == {
+        'size': 100, 'num_files': 1, 'atime_cost': 10}
+    assert tree.children('/lustre/scratch') == [
+        '/lustre/scratch/team2', '/lustre/scratch/team1']
+
+
+def test_least_recently_used_dropped():
+    tree, loads = make_tree(max_entries=6)
+    tree.get('/lustre/scratch')
+    tree.get('/lustre')
+    assert len(tree) == 2
+
+    # /lustre is an ancestor of the new listing so is kept
+    tree.put('/lustre/other', listing(
+        '/lustre/other', [('a', 1, 1, 1), ('b', 1, 1, 1)]))
+    assert tree.peek('/lustre/scratch') is None
+    assert tree.peek('/lustre') is not None
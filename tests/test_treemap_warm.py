@@ -0,0 +1,102 @@
+'''
+check that a report call written to the access log can be replayed
+by the cache warmer against the next database
+'''
+
+import json
+import time
+
+import pytest
+
+import treemap
+import treemap_cache
+import treemap_warm
+
+
+class Ran(Exception):
+    '''
+    raised by the fake execute once a report has got as far as a query
+    '''
+
+
+@pytest.fixture
+def queries(tmp_path, monkeypatch):
+    '''
+    log to a temporary file and record the queries instead of running them
+    '''
+    monkeypatch.setattr(treemap, 'ACCESS_LOG', str(tmp_path / 'access.log'))
+    monkeypatch.setattr(treemap_cache, 'ENABLED', False)
+    monkeypatch.setattr(treemap, 'use_rollup', lambda *args: False)
+    calls = []
+
+    def execute(database, qry):
+        calls.append((database, qry))
+        raise Ran()
+    monkeypatch.setattr(treemap, 'execute', execute)
+    return calls
+
+
+def test_logged_arguments_are_named(queries):
+    with pytest.raises(Ran):
+        treemap.by_suffix(
+            'scratch_old', '/lustre/scratch', None, 'bob',
+            None, None, None, None, None, None, None, None, 'size', 20)
+    with open(treemap.ACCESS_LOG) as log:
+        record = json.loads(log.readline())
+    assert record['function'] == 'by_suffix'
+    assert record['args']['database'] == 'scratch_old'
+    assert record['args']['path'] == '/lustre/scratch'
+    assert record['args']['user'] == 'bob'
+    assert record['args']['limit'] == 20
+
+
+@pytest.mark.parametrize('function,args,kwargs', [
+    ('get_subdir_data', ('/lustre',) + (None,) * 10, {}),
+    ('by_user', ('/lustre',) + (None,) * 10 + ('num_files', 5), {}),
+    ('by_group', ('/lustre',) + (None,) * 10 + ('size', 5), {'sample': 0.1})])
+def test_replay(queries, function, args, kwargs):
+    with pytest.raises(Ran):
+        getattr(treemap, function)('scratch_old', *args, **kwargs)
+    requests = treemap_warm.popular_requests(
+        treemap.ACCESS_LOG, 'scratch_old', 10)
+    assert [name for name, _ in requests] == [function]
+
+    # the replay runs the same query against the new database
+    # and isn't logged itself
+    with pytest.raises(Ran):
+        treemap_warm.replay('scratch_new', *requests[0])
+    (old_database, old_qry), (new_database, new_qry) = queries
+    assert (old_database, new_database) == ('scratch_old', 'scratch_new')
+    assert new_qry == old_qry.replace('scratch_old', 'scratch_new')
+    with open(treemap.ACCESS_LOG) as log:
+        assert len(log.readlines()) == 1
+
+
+def test_warmed_fast_request_is_a_hit(queries, memcached, monkeypatch):
+    monkeypatch.setattr(
+        treemap_cache, 'GENERATIONS', {'scratch_new': ('gen', time.time())})
+    monkeypatch.setattr(treemap, 'sampling', lambda database, sample: sample)
+    monkeypatch.setattr(treemap, 'subdirs', lambda database, path: [])
+
+    def execute(database, qry):
+        queries.append((database, qry))
+        return []
+    monkeypatch.setattr(treemap, 'execute', execute)
+
+    # the warmer replays the logged request against the new database
+    args = dict(zip(
+        ('path', 'group', 'user', 'modified_before', 'modified_after',
+         'accessed_before', 'accessed_after', 'size_less_than',
+         'size_greater_than', 'suffix', 'regex'),
+        ('/lustre',) + (None,) * 9 + ('x',)), sample=0.01)
+    treemap_warm.replay('scratch_new', 'get_subdir_data', args)
+    assert len(queries) == 1
+
+    # a new treemap_cmd --fast process finds it in memcached
+    monkeypatch.setattr(treemap_cache, 'LRU', treemap_cache.LRUCache(10))
+    before = treemap_cache.stats()['memcached']['hits']
+    data = treemap.get_subdir_data(
+        'scratch_new', '/lustre', *(None,) * 9, 'x', sample=0.01)
+    assert data['sample'] == 0.01
+    assert len(queries) == 1
+    assert treemap_cache.stats()['memcached']['hits'] == before + 1